@@ -25,6 +25,7 @@
 #include <cstdio>
 #endif
 
+#include <algorithm>
 #include <cmath>
 #include <stdexcept>
 #include "cell.h"
@@ -410,3 +411,162 @@ long smart_wrap(long i, long shape, long pbc) {
     }
     return i;
 }
+
+
+/*
+    NeighborList
+*/
+
+NeighborList::NeighborList(const Cell* _cell, double* _centers, long _ncenter,
+    double _rcut) : cell(_cell), ncenter(_ncenter), rcut(_rcut),
+    centers(_centers, _centers + 3*_ncenter), wraps(3*_ncenter, 0) {
+
+    if (rcut <= 0) {
+        throw std::domain_error("The cutoff radius of a neighbor list must be strictly positive.");
+    }
+    int nvec = cell->get_nvec();
+
+    // Fractional coordinates of the centers. The periodic ones are wrapped
+    // into [0, 1[. For the non-periodic directions, the (normalized) vectors
+    // added by the Cell constructor are used.
+    std::vector<double> fracs(3*ncenter);
+    for (long icenter=0; icenter < ncenter; icenter++) {
+        double* frac = &fracs[3*icenter];
+        cell->to_frac(&centers[3*icenter], frac);
+        for (int i=0; i < nvec; i++) {
+            wraps[3*icenter+i] = floor(frac[i]);
+            frac[i] -= wraps[3*icenter+i];
+        }
+    }
+
+    // Determine the bins. In the periodic directions, the bins are at least
+    // rcut wide. In the other directions, the bins cover all centers.
+    for (int i=0; i < 3; i++) {
+        if (i < nvec) {
+            nbins[i] = std::max(1L, (long)floor(cell->get_rspacing(i)/rcut));
+            lows[i] = 0.0;
+            widths[i] = 1.0/nbins[i];
+        } else {
+            double low = 0.0;
+            double high = 0.0;
+            for (long icenter=0; icenter < ncenter; icenter++) {
+                double f = fracs[3*icenter+i];
+                if ((icenter == 0) || (f < low)) low = f;
+                if ((icenter == 0) || (f > high)) high = f;
+            }
+            nbins[i] = (long)floor((high - low)/rcut) + 1;
+            lows[i] = low;
+            widths[i] = rcut;
+        }
+    }
+
+    // Avoid an excessive number of (mostly empty) bins.
+    long nbin_max = std::max(8*ncenter, 1L);
+    while (nbins[0]*nbins[1]*nbins[2] > nbin_max) {
+        int i = std::max_element(nbins, nbins + 3) - nbins;
+        nbins[i] = (nbins[i] + 1)/2;
+        if (i < nvec) {
+            widths[i] = 1.0/nbins[i];
+        } else {
+            widths[i] *= 2;
+        }
+    }
+
+    // Sort the centers into bins (counting sort).
+    long nbin = nbins[0]*nbins[1]*nbins[2];
+    std::vector<long> ibins(ncenter);
+    bin_offsets.assign(nbin+1, 0);
+    for (long icenter=0; icenter < ncenter; icenter++) {
+        long ibin = 0;
+        for (int i=0; i < 3; i++) {
+            long j = floor((fracs[3*icenter+i] - lows[i])/widths[i]);
+            j = std::min(std::max(j, 0L), nbins[i]-1);
+            ibin = ibin*nbins[i] + j;
+        }
+        ibins[icenter] = ibin;
+        bin_offsets[ibin+1]++;
+    }
+    for (long ibin=0; ibin < nbin; ibin++) {
+        bin_offsets[ibin+1] += bin_offsets[ibin];
+    }
+    bin_centers.resize(ncenter);
+    std::vector<long> fill(bin_offsets.begin(), bin_offsets.end()-1);
+    for (long icenter=0; icenter < ncenter; icenter++) {
+        bin_centers[fill[ibins[icenter]]++] = icenter;
+    }
+}
+
+
+void NeighborList::query(double* point, double r,
+    std::vector<Neighbor>& neighbors) const {
+    /*
+        Append all images of centers within a distance r from the point to the
+        neighbors vector.
+    */
+    int nvec = cell->get_nvec();
+    double frac[3];
+    cell->to_frac(point, frac);
+
+    // Ranges of (unwrapped) bins that overlap with the query sphere
+    long begin[3], end[3];
+    for (int i=0; i < 3; i++) {
+        if (i < nvec) {
+            double step = r/cell->get_rspacing(i);
+            begin[i] = floor((frac[i] - step)/widths[i]);
+            end[i] = floor((frac[i] + step)/widths[i]) + 1;
+        } else {
+            begin[i] = std::max((long)floor((frac[i] - r - lows[i])/widths[i]), 0L);
+            end[i] = std::min((long)floor((frac[i] + r - lows[i])/widths[i]) + 1, nbins[i]);
+            if (begin[i] >= end[i]) return;
+        }
+    }
+
+    long u[3], w[3], shift[3];
+    for (u[0]=begin[0]; u[0] < end[0]; u[0]++) {
+        for (u[1]=begin[1]; u[1] < end[1]; u[1]++) {
+            for (u[2]=begin[2]; u[2] < end[2]; u[2]++) {
+                // Split the unwrapped bin in a bin and a periodic image
+                for (int i=0; i < 3; i++) {
+                    w[i] = u[i];
+                    shift[i] = 0;
+                    if (i < nvec) {
+                        w[i] = smart_wrap(u[i], nbins[i], 1);
+                        shift[i] = (u[i] - w[i])/nbins[i];
+                    }
+                }
+                long ibin = (w[0]*nbins[1] + w[1])*nbins[2] + w[2];
+                for (long k=bin_offsets[ibin]; k < bin_offsets[ibin+1]; k++) {
+                    long icenter = bin_centers[k];
+                    Neighbor neighbor;
+                    neighbor.icenter = icenter;
+                    double image[3];
+                    for (int i=0; i < 3; i++) {
+                        neighbor.image[i] = 0;
+                        if (i < nvec) neighbor.image[i] = shift[i] - wraps[3*icenter+i];
+                        image[i] = neighbor.image[i];
+                    }
+                    double cart[3];
+                    cell->to_cart(image, cart);
+                    for (int i=0; i < 3; i++) {
+                        neighbor.delta[i] = point[i] - centers[3*icenter+i] - cart[i];
+                    }
+                    neighbor.distance = sqrt(
+                        neighbor.delta[0]*neighbor.delta[0] +
+                        neighbor.delta[1]*neighbor.delta[1] +
+                        neighbor.delta[2]*neighbor.delta[2]);
+                    if (neighbor.distance < r) {
+                        neighbors.push_back(neighbor);
+                    }
+                }
+            }
+        }
+    }
+}
+
+
+long NeighborList::get_nbin(int i) const {
+    if ((i < 0) || (i > 2)) {
+        throw std::domain_error("Index must be 0, 1 or 2.");
+    }
+    return nbins[i];
+}
@@ -22,6 +22,8 @@
 #ifndef HORTON_CELL_H
 #define HORTON_CELL_H
 
+#include <vector>
+
 
 class Cell {
     private:
@@ -64,4 +66,42 @@ class Cell {
 
 long smart_wrap(long i, long shape, long pbc);
 
+
+struct Neighbor {
+    long icenter;       // the index of the center
+    long image[3];      // the cell vectors added to the center to get its image
+    double delta[3];    // the relative vector from the image to the query point
+    double distance;    // the norm of delta
+};
+
+
+class NeighborList {
+    /*
+        A linked-cell list of centers in a (periodic) cell.
+
+        The centers are wrapped into the cell and sorted into bins. A query
+        only visits the bins (and their periodic images) that overlap with the
+        query sphere. The query radius may differ from the radius that was
+        used to construct the bins.
+    */
+    private:
+        const Cell* cell;
+        long ncenter;
+        double rcut;
+        std::vector<double> centers;
+        std::vector<long> wraps;
+        long nbins[3];
+        double lows[3], widths[3];
+        std::vector<long> bin_offsets;
+        std::vector<long> bin_centers;
+    public:
+        NeighborList(const Cell* _cell, double* _centers, long _ncenter, double _rcut);
+
+        void query(double* point, double r, std::vector<Neighbor>& neighbors) const;
+
+        long get_ncenter() const {return ncenter;};
+        double get_rcut() const {return rcut;};
+        long get_nbin(int i) const;
+};
+
 #endif
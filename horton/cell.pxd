@@ -20,6 +20,9 @@
 #--
 
 
+from libcpp.vector cimport vector
+
+
 cdef extern from "cell.h":
     cdef cppclass Cell:
         Cell(double* _rvecs, int _nvec) except +
@@ -51,3 +54,17 @@ cdef extern from "cell.h":
             long* pbc, long* indexes) except +
 
     long smart_wrap(long i, long shape, long pbc)
+
+    cdef struct Neighbor:
+        long icenter
+        long image[3]
+        double delta[3]
+        double distance
+
+    cdef cppclass NeighborList:
+        NeighborList(Cell* _cell, double* _centers, long _ncenter, double _rcut) except +
+        void query(double* point, double r, vector[Neighbor]& neighbors)
+
+        long get_ncenter()
+        double get_rcut()
+        long get_nbin(int i) except +
@@ -26,13 +26,15 @@ import numpy as np
 cimport numpy as np
 np.import_array()
 
+from libcpp.vector cimport vector
+
 cimport cell
 cimport moments
 cimport nucpot
 
 __all__ = [
     # cell.cpp
-    'Cell', 'smart_wrap',
+    'Cell', 'smart_wrap', 'NeighborList',
     # moments.cpp
     'fill_cartesian_polynomials', 'fill_pure_polynomials', 'fill_radial_polynomials',
     # nucpot.cpp
@@ -299,6 +301,10 @@ cdef class Cell:
         assert r.size == self.nvec
         self._this.add_rvec(&delta[0], <long*>np.PyArray_DATA(r))
 
+    def get_neighbor_list(self, np.ndarray[double, ndim=2] centers not None, double rcut):
+        '''Return a NeighborList for the given centers and cutoff radius'''
+        return NeighborList(self, centers, rcut)
+
     def get_ranges_rcut(self, np.ndarray[double, ndim=1] delta not None, double rcut):
         '''Return the integer ranges for linear combinations of cell vectors.
 
@@ -365,6 +371,108 @@ def smart_wrap(long i, long shape, long pbc ):
     return cell.smart_wrap(i, shape, pbc)
 
 
+cdef class NeighborList:
+    '''A linked-cell list to find nearby centers and their periodic images
+
+       The list is built once for a set of centers and a cutoff radius. It can
+       then be queried many times for all (images of) centers near a point,
+       or near a block of points with a bounding sphere.
+    '''
+    cdef cell.NeighborList* _this
+    cdef Cell _cell
+    cdef np.ndarray _centers
+
+    def __cinit__(self, Cell mycell not None,
+                  np.ndarray[double, ndim=2] centers not None, double rcut):
+        '''
+           **Arguments:**
+
+           mycell
+                A Cell instance.
+
+           centers
+                An array with Cartesian coordinates of the centers, shape
+                (ncenter, 3).
+
+           rcut
+                The cutoff radius used to construct the bins. Queries with
+                the same or a slightly larger radius are the most efficient.
+        '''
+        assert centers.flags['C_CONTIGUOUS']
+        assert centers.shape[1] == 3
+        self._cell = mycell
+        self._centers = centers.copy()
+        self._this = new cell.NeighborList(
+            mycell._this, <double*>np.PyArray_DATA(self._centers),
+            centers.shape[0], rcut)
+
+    def __dealloc__(self):
+        if self._this != NULL:
+            del self._this
+
+    property cell:
+        def __get__(self):
+            return self._cell
+
+    property centers:
+        def __get__(self):
+            return self._centers.view()
+
+    property ncenter:
+        def __get__(self):
+            return self._this.get_ncenter()
+
+    property rcut:
+        def __get__(self):
+            return self._this.get_rcut()
+
+    property nbins:
+        def __get__(self):
+            return np.array([self._this.get_nbin(i) for i in xrange(3)])
+
+    def query(self, np.ndarray[double, ndim=1] point not None, r=None):
+        '''Find all (images of) centers within a distance from a point
+
+           **Arguments:**
+
+           point
+                The Cartesian coordinates of the point.
+
+           **Optional arguments:**
+
+           r
+                The distance. When not given, the cutoff radius of the list is
+                used. To find the neighbors of a block of points, use the
+                center of its bounding sphere and add the radius of the sphere
+                to the cutoff.
+
+           **Returns:** four arrays: the indexes of the centers, the integer
+           linear combinations of cell vectors added to the centers (shape
+           (nneighbor, 3)), the relative vectors from the images of the
+           centers to the point (shape (nneighbor, 3)) and the distances.
+        '''
+        assert point.flags['C_CONTIGUOUS']
+        assert point.size == 3
+        if r is None:
+            r = self._this.get_rcut()
+        cdef vector[cell.Neighbor] neighbors
+        self._this.query(&point[0], r, neighbors)
+        cdef long nneighbor = neighbors.size()
+        cdef np.ndarray[long, ndim=1] icenters = np.zeros(nneighbor, int)
+        cdef np.ndarray[long, ndim=2] images = np.zeros((nneighbor, 3), int)
+        cdef np.ndarray[double, ndim=2] deltas = np.zeros((nneighbor, 3), float)
+        cdef np.ndarray[double, ndim=1] distances = np.zeros(nneighbor, float)
+        cdef long ineighbor
+        cdef int i
+        for ineighbor in xrange(nneighbor):
+            icenters[ineighbor] = neighbors[ineighbor].icenter
+            for i in xrange(3):
+                images[ineighbor, i] = neighbors[ineighbor].image[i]
+                deltas[ineighbor, i] = neighbors[ineighbor].delta[i]
+            distances[ineighbor] = neighbors[ineighbor].distance
+        return icenters, images, deltas, distances
+
+
 
 #
 # moments.cpp
@@ -39,7 +39,7 @@ import h5py as h5, numpy as np
 from horton.cache import Cache
 
 
-__all__ = ['attribute_register', 'load_hdf5_low', 'dump_hdf5_low']
+__all__ = ['attribute_register', 'load_hdf5_low', 'dump_hdf5_low', 'load_hdf5_array']
 
 
 class CHKField(object):
@@ -176,6 +176,30 @@ def load_hdf5_low(item, lf):
             return cls.from_hdf5(item, lf)
 
 
+def load_hdf5_array(ds):
+    '''Load a dataset as a numpy array, memory-mapped if possible
+
+       **Arguments:**
+
+       ds
+            An HDF5 dataset.
+
+       When the file is opened read-only and the data is stored contiguously,
+       without compression and in the native byte order, a copy-on-write
+       memory map of the file is returned. The data is then only read from
+       disk when it is used, and changes to the array are not written to the
+       file. Otherwise, the dataset is read into memory.
+    '''
+    f = ds.file
+    if (f.mode == 'r' and f.driver == 'sec2' and ds.chunks is None and
+        ds.compression is None and ds.dtype.isnative and ds.size > 0):
+        offset = ds.id.get_offset()
+        if offset is not None:
+            return np.memmap(f.filename, dtype=ds.dtype, mode='c',
+                             offset=offset, shape=ds.shape)
+    return ds[:]
+
+
 def dump_hdf5_low(grp, name, att):
     '''Low-level routine used to dump data to an HDF5 file.
 
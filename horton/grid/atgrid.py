@@ -24,7 +24,7 @@ from __future__ import division
 from __future__ import absolute_import
 
 
-import numpy as np, os
+import numpy as np, os, weakref
 
 
 from horton.context import context
@@ -37,13 +37,13 @@ from horton.units import angstrom
 
 
 __all__ = [
-    'AtomicGrid', 'get_rotation_matrix',
+    'AtomicGrid', 'get_atomic_grid_template', 'get_rotation_matrix',
     'get_random_rotation', 'AtomicGridSpec',
 ]
 
 
 class AtomicGrid(IntGrid):
-    def __init__(self, number, pseudo_number, center, agspec='medium', random_rotate=True, points=None):
+    def __init__(self, number, pseudo_number, center, agspec='medium', random_rotate=True, points=None, rng=None, rotations=None):
         '''
            **Arguments:**
 
@@ -71,7 +71,46 @@ class AtomicGrid(IntGrid):
 
            points
                 Array to store the grid points
+
+           rng
+                A numpy RandomState object used to generate the random
+                rotations. By default, the global random number generator of
+                numpy is used. Pass a RandomState with a fixed seed to make the
+                random rotations reproducible.
+
+           rotations
+                An array with shape (nsphere, 3, 3) with the rotation matrices
+                of all spheres, e.g. from an earlier grid. When given, no random
+                rotations are generated.
+
+           The unrotated grid points and weights for the given element and
+           agspec are taken from a cache that is shared by all atomic grids.
+           (See ``get_atomic_grid_template``.) One random rotation for each
+           sphere is generated at construction and reused when the center is
+           updated.
         '''
+        self._init_attrs(number, pseudo_number, center, agspec, random_rotate)
+
+        size = self._nlls.sum()
+        if points is None:
+            points = np.zeros((size, 3), float)
+        else:
+            assert len(points) == size
+        weights = self._template[2].copy()
+        self._av_weights = self._template[1].copy()
+        if rotations is not None:
+            assert rotations.shape == (len(self._nlls), 3, 3)
+            self._rotations = rotations
+        elif random_rotate:
+            self._rotations = _get_random_rotations(len(self._nlls), rng)
+        else:
+            self._rotations = None
+
+        IntGrid.__init__(self, points, weights)
+        self._init_low(points)
+        self._log_init()
+
+    def _init_attrs(self, number, pseudo_number, center, agspec, random_rotate):
         self._number = number
         self._pseudo_number = pseudo_number
         self._center = center
@@ -80,42 +119,62 @@ class AtomicGrid(IntGrid):
         self._agspec = agspec
         self._rgrid, self._nlls = self._agspec.get(number, pseudo_number)
         self._random_rotate = random_rotate
+        self._template = get_atomic_grid_template(agspec, number, pseudo_number)
 
-        size = self._nlls.sum()
-        if points is None:
-            points = np.zeros((size, 3), float)
-        else:
-            assert len(points) == size
-        weights = np.zeros(size, float)
-        self._av_weights = np.zeros(size, float)
+    @classmethod
+    def _from_points(cls, number, pseudo_number, center, agspec, random_rotate, points, rotations=None, order=None):
+        '''Construct a grid with points that were computed before
 
-        self._init_low(points, weights)
-        IntGrid.__init__(self, points, weights)
-        self._log_init()
+           **Arguments:**
 
-    def _init_low(self, points, weights):
-        offset = 0
-        nsphere = len(self._nlls)
-        radii = self._rgrid.radii
-        rweights = self._rgrid.weights
-
-        for i in xrange(nsphere):
-            nll = self._nlls[i]
-            my_points = points[offset:offset+nll]
-            my_av_weights = self._av_weights[offset:offset+nll]
-            my_weights = weights[offset:offset+nll]
-
-            lebedev_laikov_sphere(my_points, my_av_weights)
-            my_points *= radii[i]
-            if self.random_rotate:
-                rotmat = get_random_rotation()
-                my_points[:] = np.dot(my_points, rotmat)
-            my_weights[:] = my_av_weights
-            my_weights *= rweights[i]
+           number, pseudo_number, center, agspec, random_rotate
+                See ``__init__``.
 
-            offset += nll
+           points
+                The grid points of an earlier grid with the same arguments,
+                e.g. loaded from a file. They are used as such and they are
+                never written, such that they may be memory-mapped.
+
+           **Optional arguments:**
 
-        points[:] += self.center
+           rotations
+                The rotation matrices used to compute the points.
+
+           order
+                The permutation of the points of the earlier grid, if it was
+                sorted. The weights are permuted in the same way.
+        '''
+        result = cls.__new__(cls)
+        result._init_attrs(number, pseudo_number, center, agspec, random_rotate)
+        assert len(points) == result._nlls.sum()
+        if rotations is not None:
+            assert rotations.shape == (len(result._nlls), 3, 3)
+        result._rotations = rotations
+        result._av_weights = result._template[1].copy()
+        IntGrid.__init__(result, points, result._template[2].copy())
+        if order is not None:
+            result._apply_order(order, permute_points=False)
+        result._log_init()
+        return result
+
+    def _init_low(self, points):
+        template_points = self._template[0]
+        if self._rotations is None:
+            new_points = template_points.copy()
+        else:
+            # Rotate all spheres at once. Each point gets the rotation matrix
+            # of its sphere.
+            rotations = self._rotations.repeat(self._nlls, axis=0)
+            new_points = np.einsum('ij,ijk->ik', template_points, rotations)
+        new_points += self.center
+        if self.order is None:
+            points[:] = new_points
+        else:
+            points[:] = new_points[self.order]
+
+    def _apply_order(self, order, permute_points=True):
+        self._av_weights[:] = self._av_weights[order]
+        IntGrid._apply_order(self, order, permute_points)
 
     def _get_number(self):
         '''The element number of the grid.'''
@@ -153,6 +212,12 @@ class AtomicGrid(IntGrid):
 
     random_rotate = property(_get_random_rotate)
 
+    def _get_rotations(self):
+        '''The rotation matrices of the spheres, or None.'''
+        return self._rotations
+
+    rotations = property(_get_rotations)
+
     def _get_av_weights(self):
         '''The weights needed to compute spherical averages.'''
         return self._av_weights
@@ -173,6 +238,27 @@ class AtomicGrid(IntGrid):
         # Cite reference
         log.cite('lebedev1999', 'the use of Lebedev-Laikov grids (quadrature on a sphere)')
 
+    def integrate(self, *args, **kwargs):
+        segments = kwargs.get('segments')
+        if segments is not None and self.order is not None:
+            # After sort_blocks, the points of a sphere are no longer
+            # consecutive. Segments always refer to the original order.
+            inverse = self.order.argsort()
+            grid = IntGrid(self.points[inverse], self.weights[inverse])
+            return grid.integrate(*[arg[inverse] for arg in args], **kwargs)
+        return IntGrid.integrate(self, *args, **kwargs)
+
+    def integrate_batch(self, batch, *args, **kwargs):
+        segments = kwargs.get('segments')
+        if segments is not None and self.order is not None:
+            # See integrate.
+            inverse = self.order.argsort()
+            grid = IntGrid(self.points[inverse], self.weights[inverse])
+            return grid.integrate_batch([vec[inverse] for vec in batch],
+                                        *[arg[inverse] for arg in args if arg is not None],
+                                        **kwargs)
+        return IntGrid.integrate_batch(self, batch, *args, **kwargs)
+
     def get_spherical_average(self, *args, **kwargs):
         '''Returns the spherical average on the radial grid of the product of the given functions'''
         mtype = kwargs.pop('mtype', None)
@@ -189,7 +275,57 @@ class AtomicGrid(IntGrid):
 
     def update_center(self, center):
         self._center[:] = center
-        self._init_low(self.points, self.weights)
+        self._init_low(self.points)
+
+
+# Unrotated atomic grids, shared by all AtomicGrid instances. For every
+# RadialGrid instance, there is a dictionary with a template for each set of
+# Lebedev-Laikov grid sizes. AtomicGridSpec instances created from the same
+# definition share their RadialGrid instances, hence also their templates. The
+# templates of a RadialGrid are discarded as soon as it is no longer used.
+# (See _radial_grids.)
+_atomic_grid_templates = weakref.WeakKeyDictionary()
+
+
+def get_atomic_grid_template(agspec, number, pseudo_number):
+    '''Return the unrotated atomic grid centered at the origin
+
+       **Arguments:**
+
+       agspec
+            An AtomicGridSpec instance.
+
+       number
+            The element number.
+
+       pseudo_number
+            The effective core charge.
+
+       **Returns:** a tuple with three read-only arrays: the grid points, the
+       weights for spherical averages and the integration weights.
+
+       The result is computed only once for each combination of arguments.
+    '''
+    rgrid, nlls = agspec.get(number, pseudo_number)
+    templates = _atomic_grid_templates.setdefault(rgrid, {})
+    key = nlls.tostring()
+    template = templates.get(key)
+    if template is None:
+        size = nlls.sum()
+        points = np.zeros((size, 3), float)
+        av_weights = np.zeros(size, float)
+        offset = 0
+        for i in xrange(len(nlls)):
+            nll = nlls[i]
+            lebedev_laikov_sphere(points[offset:offset+nll], av_weights[offset:offset+nll])
+            points[offset:offset+nll] *= rgrid.radii[i]
+            offset += nll
+        weights = av_weights*rgrid.weights.repeat(nlls)
+        for array in points, av_weights, weights:
+            array.flags.writeable = False
+        template = (points, av_weights, weights)
+        templates[key] = template
+    return template
 
 
 def get_rotation_matrix(axis, angle):
@@ -204,21 +340,62 @@ def get_rotation_matrix(axis, angle):
     ])
 
 
-def get_random_rotation():
-    '''Return a random rotation matrix'''
+def get_random_rotation(rng=None):
+    '''Return a random rotation matrix
+
+       **Optional arguments:**
+
+       rng
+            A numpy RandomState object. By default, the global random number
+            generator of numpy is used.
+    '''
+    if rng is None:
+        rng = np.random
+
     # Get a random unit vector for the axis
     while True:
-        axis = np.random.uniform(-1, 1, 3)
+        axis = rng.uniform(-1, 1, 3)
         norm = np.linalg.norm(axis)
         if norm < 1.0 and norm > 0.1:
             break
 
     # Get a random rotation angle
-    angle = np.random.uniform(0, 2*np.pi)
+    angle = rng.uniform(0, 2*np.pi)
 
     return get_rotation_matrix(axis, angle)
 
 
+def _get_random_rotations(nrot, rng=None):
+    '''Return an array with nrot random rotation matrices
+
+       This is a vectorized version of get_random_rotation.
+    '''
+    if rng is None:
+        rng = np.random
+
+    # Get random unit vectors for the axes
+    axes = np.zeros((0, 3), float)
+    while len(axes) < nrot:
+        trial = rng.uniform(-1, 1, (nrot, 3))
+        norms = np.sqrt((trial**2).sum(axis=1))
+        axes = np.concatenate([axes, trial[(norms < 1.0) & (norms > 0.1)]])
+    axes = axes[:nrot]
+    axes /= np.sqrt((axes**2).sum(axis=1)).reshape(-1, 1)
+    x, y, z = axes.T
+
+    # Get random rotation angles
+    angles = rng.uniform(0, 2*np.pi, nrot)
+    c = np.cos(angles)
+    s = np.sin(angles)
+
+    # Rodrigues' rotation formula
+    return np.array([
+        [x*x*(1-c)+c  , x*y*(1-c)-z*s, x*z*(1-c)+y*s],
+        [x*y*(1-c)+z*s, y*y*(1-c)+c  , y*z*(1-c)-x*s],
+        [x*z*(1-c)-y*s, y*z*(1-c)+x*s, z*z*(1-c)+c  ],
+    ]).transpose(2, 0, 1)
+
+
 def _normalize_nlls(nlls, size):
     '''Make sure nlls is an array of the proper size'''
     if hasattr(nlls, '__iter__'):
@@ -233,6 +410,26 @@ def _normalize_nlls(nlls, size):
     return nlls
 
 
+# Members of atomic grid specifications parsed from files, e.g. in
+# ${HORTONDATA}/grids, and radial grids for RTransform strings. Each file is
+# parsed only once and the resulting RadialGrid instances are shared by all
+# AtomicGridSpec instances that are defined by a string. The members of parsed
+# files are never released, and so are their RadialGrid instances. Other
+# RadialGrid instances, e.g. for specifications loaded from HDF5, are only
+# kept as long as they are used elsewhere.
+_agspec_members = {}
+_radial_grids = weakref.WeakValueDictionary()
+
+
+def _get_radial_grid(rtf_string):
+    '''Return a shared RadialGrid for the given RTransform string'''
+    rgrid = _radial_grids.get(rtf_string)
+    if rgrid is None:
+        rgrid = RadialGrid(RTransform.from_string(rtf_string))
+        _radial_grids[rtf_string] = rgrid
+    return rgrid
+
+
 class AtomicGridSpec(object):
     '''A specification of atomic integration grids for multiple elements.'''
     def __init__(self, definition='medium'):
@@ -292,10 +489,9 @@ class AtomicGridSpec(object):
     def from_hdf5(cls, grp, lf):
         records = []
         for ds in grp.itervalues():
-            rtransform = RTransform.from_string(ds.attrs['rtransform'])
             records.append((
                 ds.attrs['number'], ds.attrs['pseudo_number'],
-                RadialGrid(rtransform), ds[:]
+                _get_radial_grid(ds.attrs['rtransform']), ds[:]
             ))
         return AtomicGridSpec(records)
 
@@ -382,12 +578,23 @@ class AtomicGridSpec(object):
             rmin = float(words[1])*angstrom
             rmax = float(words[2])*angstrom
             nrad = int(words[3])
-            rgrid = RadialGrid(RTransformClass(rmin, rmax, nrad))
+            rgrid = _get_radial_grid(RTransformClass(rmin, rmax, nrad).to_string())
             nll = int(words[4])
             self._init_members_from_tuple((rgrid, nll))
 
     def _load(self, filename):
         fn = context.get_fn(filename)
+        # A file is parsed again only when it is modified.
+        key = (os.path.abspath(fn), os.path.getmtime(fn))
+        members = _agspec_members.get(key)
+        if members is None:
+            members = self._parse(fn)
+            _agspec_members[key] = members
+        self._init_members_from_list(members)
+
+    @staticmethod
+    def _parse(fn):
+        '''Return a list of members in the file fn'''
         members = []
         with open(fn) as f:
             state = 0
@@ -405,11 +612,10 @@ class AtomicGridSpec(object):
                         state = 1
                     elif state == 1:
                         # read rtf string
-                        rtf = RTransform.from_string(line)
+                        rgrid = _get_radial_grid(line)
                         state = 2
                     elif state == 2:
                         nlls = np.array([int(w) for w in line.split()])
                         state = 0
-                        members.append((number, pseudo_number, RadialGrid(rtf), nlls))
-
-        self._init_members_from_list(members)
+                        members.append((number, pseudo_number, rgrid, nlls))
+        return members
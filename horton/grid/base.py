@@ -26,13 +26,13 @@ from __future__ import absolute_import
 
 import numpy as np
 
-from horton.grid.utils import parse_args_integrate
+from horton.grid.utils import parse_args_integrate, get_morton_order
 from horton.grid.cext import dot_multi, eval_spline_grid, \
-    dot_multi_moments
+    eval_splines_grid, dot_multi_moments, dot_multi_batch
 from horton.cext import Cell
 
 
-__all__ = ['IntGrid']
+__all__ = ['IntGrid', 'GridBlocks']
 
 
 # TODO: put some decent class hierarchy in place for all integration grids.
@@ -62,6 +62,8 @@ class IntGrid(object):
         self._points = points
         self._weights = weights
         self._subgrids = subgrids
+        self._order = None
+        self._blocks = None
         # assign begin and end attributes to the subgrids
         if subgrids is not None:
             offset = 0
@@ -100,6 +102,70 @@ class IntGrid(object):
 
     subgrids = property(_get_subgrids)
 
+    def _get_order(self):
+        '''The permutation of the points by sort_blocks, or None'''
+        return self._order
+
+    order = property(_get_order)
+
+    def _get_blocks(self):
+        '''The GridBlocks of this grid after sort_blocks, or None'''
+        return self._blocks
+
+    blocks = property(_get_blocks)
+
+    def sort_blocks(self, size=128):
+        '''Sort the grid points in compact spatial blocks
+
+           **Optional arguments:**
+
+           size
+                The maximum number of points in a block.
+
+           The points are sorted along a Morton (Z-order) curve, such that
+           points that are close in space are also close in memory. When the
+           grid has subgrids, the points of each subgrid are sorted separately
+           and the subgrids still consist of consecutive points. The sorted
+           points are divided in blocks, see ``GridBlocks``. Kernels may use the
+           bounding spheres of the blocks to skip points beyond a cutoff.
+
+           Results that were computed on this grid before sorting (e.g. cached
+           in a System or a Hamiltonian) are no longer valid and must be
+           recomputed, or reordered with the returned permutation.
+
+           **Returns:** the permutation of the points: the new points are
+           ``old_points[order]``.
+        '''
+        order = np.arange(self.size)
+        for begin, end in self._get_block_ranges():
+            order[begin:end] = begin + get_morton_order(self.points[begin:end])
+        self._apply_order(order)
+        self._blocks = GridBlocks(self.points, self._get_block_ranges(), size)
+        return order
+
+    def _get_block_ranges(self):
+        '''The ranges of points that are sorted and divided in blocks'''
+        if self.subgrids is None:
+            return [(0, self.size)]
+        else:
+            return [(subgrid.begin, subgrid.end) for subgrid in self.subgrids]
+
+    def _apply_order(self, order, permute_points=True):
+        '''Permute all arrays with the grid points'''
+        if permute_points:
+            self._points[:] = self._points[order]
+        self._weights[:] = self._weights[order]
+        if self._order is None:
+            self._order = order.copy()
+        else:
+            self._order = self._order[order]
+        if self.subgrids is not None:
+            for subgrid in self.subgrids:
+                suborder = order[subgrid.begin:subgrid.end] - subgrid.begin
+                # Subgrids usually share the array with points.
+                shared = np.may_share_memory(subgrid.points, self._points)
+                subgrid._apply_order(suborder, not shared)
+
     def zeros(self):
         return np.zeros(self.shape)
 
@@ -117,7 +183,11 @@ class IntGrid(object):
 
            center=None
                 When given, multipole moments are computed with respect to
-                this center instead of a plain integral.
+                this center instead of a plain integral. An array with shape
+                (ncenter, 3) computes the moments with respect to all centers
+                in one pass over the grid. An additional index for the
+                centers is then added to the result, just before the index of
+                the moments.
 
            lmax=0
                 The maximum angular momentum to consider when computing multipole
@@ -125,7 +195,9 @@ class IntGrid(object):
 
            mtype=1
                 The type of multipole moments: 1=``cartesian``, 2=``pure``,
-                3=``radial``.
+                3=``radial``. When a list of types is given, all of them are
+                computed in one pass over the grid and a list of results is
+                returned, one for each type.
 
            segments=None
                 This argument can be used to divide the grid in segments. When
@@ -146,7 +218,150 @@ class IntGrid(object):
             center, lmax, mtype = multipole_args
             return dot_multi_moments(args, self.points, center, lmax, mtype, segments)
 
+    def integrate_batch(self, batch, *args, **kwargs):
+        '''Integrate the product of all arguments with each function in batch
+
+           **Arguments:**
+
+           batch
+                A list of arrays with the same size as the number of grid
+                points. For each array, the integral of its product with all
+                other arguments is computed.
+
+           data1, data2, ...
+                All arguments must be arrays with the same size as the number
+                of grid points. The arrays contain the functions, evaluated
+                at the grid points, that are common to all integrals.
+
+           **Optional arguments:**
+
+           segments=None
+                See ``integrate``.
+
+           The product of the common arguments and the weights is computed
+           only once for each grid point, which is much cheaper than calling
+           ``integrate`` for each function in batch.
+
+           **Returns:** an array with the integrals of all functions in batch.
+           When segments are given, the first index runs over the segments.
+        '''
+        args, multipole_args, segments = parse_args_integrate(*args, **kwargs)
+        if multipole_args is not None:
+            raise TypeError('Multipole moments are not supported by integrate_batch.')
+        args.append(self.weights)
+        batch = [vec.ravel() for vec in batch]
+        return dot_multi_batch(args, batch, segments=segments)
+
     def eval_spline(self, cubic_spline, center, output, cell=None):
         if cell is None:
             cell = Cell(None)
-        eval_spline_grid(cubic_spline, center, output, self.points, cell)
+        if self._blocks is None or cell.nvec > 0 or cubic_spline.extrapolation.has_tail():
+            eval_spline_grid(cubic_spline, center, output, self.points, cell)
+        else:
+            # Only blocks within the cutoff of the spline get a contribution.
+            rcut = cubic_spline.rtransform.get_radii()[-1]
+            for begin, end in self._blocks.get_ranges(center, rcut):
+                eval_spline_grid(cubic_spline, center, output[begin:end],
+                                 self.points[begin:end], cell)
+
+    def eval_splines(self, cubic_splines, center, output, cell=None):
+        '''Add several spherically symmetric functions to an output array
+
+           **Arguments:**
+
+           cubic_splines
+                A list of CubicSpline objects with the same rtransform.
+
+           center
+                The center of the spherically symmetric functions.
+
+           output
+                An array with shape (nspline, npoint).
+
+           **Optional arguments:**
+
+           cell
+                A Cell object with periodic boundary conditions.
+        '''
+        if cell is None:
+            cell = Cell(None)
+        tail = any(cubic_spline.extrapolation.has_tail() for cubic_spline in cubic_splines)
+        if self._blocks is None or cell.nvec > 0 or tail:
+            eval_splines_grid(cubic_splines, center, output, self.points, cell)
+        else:
+            # Only blocks within the cutoff of the splines get a contribution.
+            rcut = cubic_splines[0].rtransform.get_radii()[-1]
+            for begin, end in self._blocks.get_ranges(center, rcut):
+                tmp = np.zeros((len(cubic_splines), end - begin))
+                eval_splines_grid(cubic_splines, center, tmp,
+                                  self.points[begin:end], cell)
+                output[:,begin:end] += tmp
+
+
+class GridBlocks(object):
+    '''Compact spatial blocks of consecutive grid points'''
+    def __init__(self, points, ranges, size):
+        '''
+           **Arguments:**
+
+           points
+                The grid points, sorted such that consecutive points are close
+                in space.
+
+           ranges
+                A list of (begin, end) tuples. Each range of points is divided
+                in blocks separately.
+
+           size
+                The maximum number of points in a block.
+        '''
+        self.size = size
+        offsets = [0]
+        for begin, end in ranges:
+            if end > begin:
+                offsets.extend(range(begin+size, end, size))
+                offsets.append(end)
+        self.offsets = np.array(offsets)
+        if len(offsets) > 1:
+            begins = self.offsets[:-1]
+            self.lows = np.minimum.reduceat(points, begins)
+            self.highs = np.maximum.reduceat(points, begins)
+            self.centers = 0.5*(self.lows + self.highs)
+            iblocks = np.arange(self.nblock).repeat(self.offsets[1:] - begins)
+            distances = np.sqrt(((points - self.centers[iblocks])**2).sum(axis=1))
+            self.radii = np.maximum.reduceat(distances, begins)
+        else:
+            self.lows = np.zeros((0, 3))
+            self.highs = np.zeros((0, 3))
+            self.centers = np.zeros((0, 3))
+            self.radii = np.zeros(0)
+
+    def _get_nblock(self):
+        '''The number of blocks'''
+        return len(self.offsets) - 1
+
+    nblock = property(_get_nblock)
+
+    def get_ranges(self, center, rcut):
+        '''Return ranges of points that contain all points within a cutoff
+
+           **Arguments:**
+
+           center
+                The center of the cutoff sphere.
+
+           rcut
+                The cutoff radius.
+
+           **Returns:** a list of (begin, end) tuples. Consecutive blocks are
+           merged into one range.
+        '''
+        distances = np.sqrt(((self.centers - center)**2).sum(axis=1))
+        iblocks = (distances - self.radii < rcut).nonzero()[0]
+        if len(iblocks) == 0:
+            return []
+        # split in runs of consecutive blocks
+        splits = (iblocks[1:] != iblocks[:-1] + 1).nonzero()[0] + 1
+        firsts = iblocks[np.concatenate([[0], splits])]
+        lasts = iblocks[np.concatenate([splits - 1, [len(iblocks) - 1]])]
+        return zip(self.offsets[firsts], self.offsets[lasts+1])
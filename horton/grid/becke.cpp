@@ -24,8 +24,10 @@
 #ifdef DEBUG
 #include <cstdio>
 #endif
+#include <algorithm>
 #include <cmath>
 #include <stdexcept>
+#include <vector>
 
 #include "becke.h"
 
@@ -46,6 +48,236 @@ static double dist(double* p0, double* p1) {
 }
 
 
+/* becke_switch
+
+   Computes the switching function s(mu_ij) for one atom pair. The distances
+   from the grid point to the atoms are precomputed in point_dists.
+*/
+static double becke_switch(int iatom0, int iatom1, double* point_dists,
+                           double* alphas, double* atomic_dists, int order)
+{
+    // compute offset for alpha and interatomic distance
+    long offset;
+    if (iatom0 < iatom1) {
+        offset = (iatom1*(iatom1+1))/2+iatom0;
+    } else {
+        offset = (iatom0*(iatom0+1))/2+iatom1;
+    }
+
+    // Diatomic switching function
+    double s = (point_dists[iatom0] - point_dists[iatom1])/atomic_dists[offset]; // Eq. (11)
+    s = s + alphas[offset]*(1 - 2*(iatom0<iatom1))*(1-s*s); // Eq. (A2)
+
+    for (int k=1; k <= order; k++) { // Eq. (19) and (20)
+        s = 0.5*s*(3-s*s);
+    }
+    return 0.5*(1-s); // Eq. (18)
+}
+
+
+/* ssf_switch
+
+   Computes the switching function of Stratmann, Scuseria and Frisch for one
+   atom pair. It has a compact support: it is exactly one for mu <= -SSF_A and
+   exactly zero for mu >= SSF_A. The arguments alphas and order are not used.
+*/
+static double ssf_switch(int iatom0, int iatom1, double* point_dists,
+                         double* alphas, double* atomic_dists, int order)
+{
+    long offset;
+    if (iatom0 < iatom1) {
+        offset = (iatom1*(iatom1+1))/2+iatom0;
+    } else {
+        offset = (iatom0*(iatom0+1))/2+iatom1;
+    }
+
+    double mu = (point_dists[iatom0] - point_dists[iatom1])/atomic_dists[offset];
+    if (mu <= -SSF_A) return 1;
+    if (mu >= SSF_A) return 0;
+    double x = mu/SSF_A;
+    double x2 = x*x;
+    return 0.5*(1 - x*(35 + x2*(-35 + x2*(21 - 5*x2)))/16); // Eq. (14) in SSF paper
+}
+
+
+typedef double (*switch_function)(int, int, double*, double*, double*, int);
+
+
+/* becke_cell
+
+   Computes the cell function P_i (Eq. (13)) of one atom in a grid point.
+
+   The partners are visited in order of increasing distance to the grid point,
+   as given by the array atom_order. The first factors are then the smallest ones
+   for atoms far from the grid point. As soon as the product drops below eps,
+   the cell function is neglected (set to zero) and the remaining pairs are
+   skipped.
+*/
+static double becke_cell(switch_function sw, int iatom0, int natom, int* atom_order,
+                         double* point_dists, double* alphas, double* atomic_dists,
+                         int order, double eps)
+{
+    double p = 1;
+    for (int i = 0; i < natom; i++) {
+        int iatom1 = atom_order[i];
+        if (iatom0 == iatom1) continue;
+        p *= sw(iatom0, iatom1, point_dists, alphas, atomic_dists, order); // Eq. (13)
+#ifdef DEBUG
+        printf("iatom0=%i  iatom1=%i p=%f\n", iatom0, iatom1, p);
+#endif
+        if (p <= eps) return 0;
+    }
+    return p;
+}
+
+
+/* DistanceOrder
+
+   Comparison of two atom indexes by their distance to a grid point.
+*/
+struct DistanceOrder {
+    double* point_dists;
+    DistanceOrder(double* _point_dists) : point_dists(_point_dists) {}
+    bool operator()(int iatom0, int iatom1) const {
+        return point_dists[iatom0] < point_dists[iatom1];
+    }
+};
+
+
+/* compute_atomic_dists
+
+   Fills the lower triangle of the matrix with interatomic distances.
+*/
+static void compute_atomic_dists(int natom, double* centers, double* atomic_dists) {
+    long offset = 0;
+    for (int iatom0 = 0; iatom0 < natom; iatom0++) {
+        for (int iatom1 = 0; iatom1 <= iatom0; iatom1++) {
+            atomic_dists[offset] = dist(&centers[3*iatom0], &centers[3*iatom1]);
+            offset += 1;
+        }
+    }
+}
+
+
+/* partition_point
+
+   Multiplies the weight of one grid point with the cell function of the
+   selected atom, normalized by the sum over all cell functions.
+
+   point_dists and atom_order are work arrays with natom elements. Cell functions
+   smaller than eps are neglected. (See becke_cell.)
+*/
+static void partition_point(switch_function sw, double* point, double* weight,
+                            int natom, double* centers, int select,
+                            double* point_dists, int* atom_order, double* alphas,
+                            double* atomic_dists, int order, double eps)
+{
+    // distances between the grid point and all atoms, sorted
+    for (int iatom = 0; iatom < natom; iatom++) {
+        point_dists[iatom] = dist(point, &centers[3*iatom]);
+        atom_order[iatom] = iatom;
+    }
+    std::sort(atom_order, atom_order + natom, DistanceOrder(point_dists));
+
+    double nom = 0;   // The nominator in the weight definition
+    double denom = 0; // The denominator in the weight definition
+    for (int iatom0 = 0; iatom0 < natom; iatom0++) {
+        double p = becke_cell(sw, iatom0, natom, atom_order, point_dists, alphas,
+                              atomic_dists, order, eps);
+        if (iatom0 == select) nom = p;
+        denom += p; // Eq. (22)
+    }
+#ifdef DEBUG
+    printf("nom=%f  denom=%f\n", nom, denom);
+#endif
+
+    // Weight function at this grid point:
+    *weight *= nom/denom; // Eq. (22)
+}
+
+
+/* compute_becke_alphas
+
+   Fills the lower triangle of the matrix with the alpha parameters of Becke's
+   size adjustments. (Appendix in Becke's paper.)
+*/
+static void compute_becke_alphas(int natom, double* radii, double* alphas) {
+    long offset = 0;
+    for (int iatom0 = 0; iatom0 < natom; iatom0++) {
+        for (int iatom1 = 0; iatom1 <= iatom0; iatom1++) {
+            // Heteronuclear assignment of the boundary. (Appendix in Becke's paper.)
+            double alpha = (radii[iatom0] - radii[iatom1])/(radii[iatom0] + radii[iatom1]); // Eq. (A6)
+            alpha = alpha/(alpha*alpha-1); // Eq. (A5)
+            // Eq. (A3), except that we use some safe margin (0.45 instead of 0.5)
+            // to stay away from a ridiculous imbalance.
+            if (alpha > 0.45) {
+                alpha = 0.45;
+            } else if (alpha < -0.45) {
+                alpha = -0.45;
+            }
+            alphas[offset] = alpha;
+            offset += 1;
+        }
+    }
+}
+
+
+/* compute_ssf_rskip
+
+   Computes for every atom the radius of the sphere in which all SSF weights
+   are exactly one: 0.5*(1-SSF_A)*R_nn, where R_nn is the distance to the
+   nearest neighbouring atom. Eq. (15) in the SSF paper. When there is only one
+   atom, the radius is negative, i.e. no points are skipped.
+*/
+static void compute_ssf_rskip(int natom, double* centers, double* rskip) {
+    for (int iatom0 = 0; iatom0 < natom; iatom0++) {
+        rskip[iatom0] = -1;
+        for (int iatom1 = 0; iatom1 < natom; iatom1++) {
+            if (iatom0 == iatom1) continue;
+            double d = dist(&centers[3*iatom0], &centers[3*iatom1]);
+            if ((rskip[iatom0] < 0) || (d < rskip[iatom0])) rskip[iatom0] = d;
+        }
+        rskip[iatom0] *= 0.5*(1 - SSF_A);
+    }
+}
+
+
+/* partition_molgrid
+
+   Multiplies the weights of the atomic subgrids begin to end (not included)
+   of a molecular grid with the partitioning function of the corresponding
+   atoms. The grid points of atom i are points offsets[i] to offsets[i+1].
+
+   The work is distributed over OpenMP threads. Every thread has its own work
+   array with distances, and the points of each atom are divided dynamically
+   over the threads. No thread has to wait at the end of an atomic subgrid.
+   When rskip is not NULL, points within a radius rskip[i] of atom i are not
+   modified.
+*/
+static void partition_molgrid(switch_function sw, double* points, double* weights,
+                              int natom, double* centers, long* offsets,
+                              int begin, int end, double* alphas,
+                              double* atomic_dists, double* rskip, int order,
+                              double eps)
+{
+    #pragma omp parallel
+    {
+        // work arrays for the distances between one grid point and all atoms
+        std::vector<double> point_dists(natom);
+        std::vector<int> atom_order(natom);
+        for (int select = begin; select < end; select++) {
+            #pragma omp for schedule(dynamic, 64) nowait
+            for (long ipoint = offsets[select]; ipoint < offsets[select+1]; ipoint++) {
+                if ((rskip != NULL) && (dist(&points[3*ipoint], &centers[3*select]) < rskip[select])) continue;
+                partition_point(sw, &points[3*ipoint], &weights[ipoint], natom,
+                                centers, select, &point_dists[0], &atom_order[0],
+                                alphas, atomic_dists, order, eps);
+            }
+        }
+    }
+}
+
+
 /* becke_helper_atom
 
    Computes the Becke weighting function for every point in the grid
@@ -78,88 +310,123 @@ static double dist(double* p0, double* p1) {
    See Becke's paper for the details:
    A. D. Becke, The Journal of Chemical Physics 88, 2547 (1988)
    URL http://dx.doi.org/10.1063/1.454033.
+
+   For every grid point, the distances to all atoms are computed only once and
+   the atoms are sorted by their distance to the point. Cell functions are
+   neglected as soon as the product of their switching functions drops below
+   BECKE_EPS. (See becke_cell.) For atoms far from the grid point, this happens
+   after one or two factors, such that the cost per point grows nearly linearly
+   with the number of atoms instead of quadratically. Each neglected cell
+   function is smaller than BECKE_EPS, so the weights deviate at most
+   natom*BECKE_EPS/sum_i(P_i) from the exact Becke weights.
 */
 void becke_helper_atom(int npoint, double* points, double* weights, int natom,
                        double* radii, double* centers, int select, int order)
 {
-    double nom, denom; // The nominator and the denominator in the weight definition
-    double p, s; // Used to build up the value of the switching function
-
     // precompute the the alpha parameters for each atom pair
-    double alphas[(natom*(natom+1))/2];
-    long offset = 0;
-    for (int iatom0 = 0; iatom0 < natom; iatom0++) {
-        for (int iatom1 = 0; iatom1 <= iatom0; iatom1++) {
-            // Heteronuclear assignment of the boundary. (Appendix in Becke's paper.)
-            double alpha = (radii[iatom0] - radii[iatom1])/(radii[iatom0] + radii[iatom1]); // Eq. (A6)
-            alpha = alpha/(alpha*alpha-1); // Eq. (A5)
-            // Eq. (A3), except that we use some safe margin (0.45 instead of 0.5)
-            // to stay away from a ridiculous imbalance.
-            if (alpha > 0.45) {
-                alpha = 0.45;
-            } else if (alpha < -0.45) {
-                alpha = -0.45;
-            }
-            alphas[offset] = alpha;
-            offset += 1;
-        }
-    }
+    std::vector<double> alphas((natom*(natom+1))/2);
+    compute_becke_alphas(natom, radii, &alphas[0]);
 
     // precompute interatomic distances
-    double atomic_dists[(natom*(natom+1))/2];
-    offset = 0;
-    for (int iatom0 = 0; iatom0 < natom; iatom0++) {
-        for (int iatom1 = 0; iatom1 <= iatom0; iatom1++) {
-            atomic_dists[offset] = dist(&centers[3*iatom0], &centers[3*iatom1]);
-            offset += 1;
-        }
-    }
+    std::vector<double> atomic_dists((natom*(natom+1))/2);
+    compute_atomic_dists(natom, centers, &atomic_dists[0]);
+
+    // work arrays for the distances between one grid point and all atoms
+    std::vector<double> point_dists(natom);
+    std::vector<int> atom_order(natom);
 
     // actual computations of Becke weights
-    for (int ipoint = npoint-1; ipoint>=0; ipoint--) {
-        nom = 0;
-        denom = 0;
-        for (int iatom0 = 0; iatom0 < natom; iatom0++) {
-            p = 1;
-            for (int iatom1 = 0; iatom1 < natom; iatom1++) {
-                if (iatom0 == iatom1) continue;
-
-                // compute offset for alpha and interatomic distance
-                if (iatom0 < iatom1) {
-                    offset = (iatom1*(iatom1+1))/2+iatom0;
-                } else {
-                    offset = (iatom0*(iatom0+1))/2+iatom1;
-                }
-
-                // Diatomic switching function
-                s = (dist(points, &centers[3*iatom0])
-                     -dist(points, &centers[3*iatom1]))
-                    /atomic_dists[offset]; // Eq. (11)
-                s = s + alphas[offset]*(1 - 2*(iatom0<iatom1))*(1-s*s); // Eq. (A2)
-
-                for (int k=1; k <= order; k++) { // Eq. (19) and (20)
-                    s = 0.5*s*(3-s*s);
-                }
-                s = 0.5*(1-s); // Eq. (18)
-
-                p *= s; // Eq. (13)
-#ifdef DEBUG
-                printf("iatom0=%i  iatom1=%i s=%f p=%f\n", iatom0, iatom1, s, p);
-#endif
-            }
+    for (int ipoint = 0; ipoint < npoint; ipoint++) {
+        partition_point(becke_switch, &points[3*ipoint], &weights[ipoint], natom,
+                        centers, select, &point_dists[0], &atom_order[0],
+                        &alphas[0], &atomic_dists[0], order, BECKE_EPS);
+    }
+}
 
-            if (iatom0 == select) nom = p;
-            denom += p; // Eq. (22)
-        }
-#ifdef DEBUG
-        printf("nom=%f  denom=%f\n", nom, denom);
-#endif
 
-        // Weight function at this grid point:
-        *weights *= nom/denom; // Eq. (22)
+/* ssf_helper_atom
+
+   Computes the weighting function of Stratmann, Scuseria and Frisch for every
+   point in the grid. The arguments have the same meaning as in
+   becke_helper_atom.
+
+   See the paper for the details:
+   R. E. Stratmann, G. E. Scuseria and M. J. Frisch, Chemical Physics Letters
+   257, 213 (1996) URL http://dx.doi.org/10.1016/0009-2614(96)00600-8
 
-        // go to next point
-        points += 3;
-        weights++;
+   Points within a radius 0.5*(1-SSF_A)*R_nn around the selected atom, where
+   R_nn is the distance to the nearest neighbouring atom, have a weight of
+   exactly one. Eq. (15) in the SSF paper. For these points, the weight is not
+   computed. The SSF switching function becomes exactly zero, so no cell
+   functions are neglected.
+*/
+void ssf_helper_atom(int npoint, double* points, double* weights, int natom,
+                     double* centers, int select)
+{
+    // precompute interatomic distances
+    std::vector<double> atomic_dists((natom*(natom+1))/2);
+    compute_atomic_dists(natom, centers, &atomic_dists[0]);
+
+    // radius of the sphere around each atom in which all weights are one
+    std::vector<double> rskip(natom);
+    compute_ssf_rskip(natom, centers, &rskip[0]);
+
+    // work arrays for the distances between one grid point and all atoms
+    std::vector<double> point_dists(natom);
+    std::vector<int> atom_order(natom);
+
+    for (int ipoint = 0; ipoint < npoint; ipoint++) {
+        if (dist(&points[3*ipoint], &centers[3*select]) < rskip[select]) continue;
+        partition_point(ssf_switch, &points[3*ipoint], &weights[ipoint], natom,
+                        centers, select, &point_dists[0], &atom_order[0], NULL,
+                        &atomic_dists[0], 0, 0);
     }
 }
+
+
+/* becke_helper_molgrid
+
+   Computes the Becke weighting function for the atomic subgrids begin to end
+   (not included) of a molecular grid in one call.
+
+   points, weights, natom, radii, centers, order
+        See becke_helper_atom. The points and weights are those of the entire
+        molecular grid.
+
+   offsets
+        The subgrid of atom i consists of points offsets[i] to offsets[i+1].
+        Array with natom+1 elements.
+
+   begin, end
+        The range of atoms whose subgrids are treated.
+*/
+void becke_helper_molgrid(double* points, double* weights, int natom,
+                          double* radii, double* centers, long* offsets,
+                          int begin, int end, int order)
+{
+    std::vector<double> alphas((natom*(natom+1))/2);
+    compute_becke_alphas(natom, radii, &alphas[0]);
+    std::vector<double> atomic_dists((natom*(natom+1))/2);
+    compute_atomic_dists(natom, centers, &atomic_dists[0]);
+    partition_molgrid(becke_switch, points, weights, natom, centers, offsets,
+                      begin, end, &alphas[0], &atomic_dists[0], NULL, order,
+                      BECKE_EPS);
+}
+
+
+/* ssf_helper_molgrid
+
+   Computes the SSF weighting function for the atomic subgrids begin to end
+   (not included) of a molecular grid in one call. The arguments have the same
+   meaning as in becke_helper_molgrid.
+*/
+void ssf_helper_molgrid(double* points, double* weights, int natom,
+                        double* centers, long* offsets, int begin, int end)
+{
+    std::vector<double> atomic_dists((natom*(natom+1))/2);
+    compute_atomic_dists(natom, centers, &atomic_dists[0]);
+    std::vector<double> rskip(natom);
+    compute_ssf_rskip(natom, centers, &rskip[0]);
+    partition_molgrid(ssf_switch, points, weights, natom, centers, offsets,
+                      begin, end, NULL, &atomic_dists[0], &rskip[0], 0, 0);
+}
@@ -22,7 +22,19 @@
 #ifndef HORTON_GRID_BECKE_H
 #define HORTON_GRID_BECKE_H
 
+// The parameter a in the switching function of Stratmann, Scuseria and Frisch
+#define SSF_A 0.64
+// Cell functions of the Becke scheme below this threshold are neglected
+#define BECKE_EPS 1e-14
+
 void becke_helper_atom(int npoint, double* points, double* weights, int natom,
                        double* radii, double* centers, int select, int order);
+void ssf_helper_atom(int npoint, double* points, double* weights, int natom,
+                     double* centers, int select);
+void becke_helper_molgrid(double* points, double* weights, int natom,
+                          double* radii, double* centers, long* offsets,
+                          int begin, int end, int order);
+void ssf_helper_molgrid(double* points, double* weights, int natom,
+                        double* centers, long* offsets, int begin, int end);
 
 #endif
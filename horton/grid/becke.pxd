@@ -20,7 +20,14 @@
 #--
 
 
-cdef extern from "becke.h":
+cdef extern from "becke.h" nogil:
     void becke_helper_atom(int npoint, double* points, double* weights,
                            int natom, double* radii, double* centers, int
                            select, int order)
+    void ssf_helper_atom(int npoint, double* points, double* weights,
+                         int natom, double* centers, int select)
+    void becke_helper_molgrid(double* points, double* weights, int natom,
+                              double* radii, double* centers, long* offsets,
+                              int begin, int end, int order)
+    void ssf_helper_molgrid(double* points, double* weights, int natom,
+                            double* centers, long* offsets, int begin, int end)
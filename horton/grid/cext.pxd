@@ -20,6 +20,7 @@
 #--
 
 
+cimport numpy as np
 cimport uniform
 cimport horton.cext
 
@@ -29,3 +30,8 @@ cdef class UniformGrid:
 cdef class UniformGridWindow:
     cdef UniformGrid _ugrid
     cdef uniform.UniformGridWindow* _this
+
+cdef class SparseUniformGridWindow:
+    cdef UniformGridWindow _window
+    cdef np.ndarray _spans
+    cdef long _size
@@ -31,6 +31,7 @@ cimport numpy as np
 np.import_array()
 
 from libc.stdlib cimport malloc, free
+cimport openmp
 
 cimport lebedev_laikov
 cimport becke
@@ -47,26 +48,68 @@ cimport horton.cext
 # See https://groups.google.com/forum/?fromgroups=#!topic/cython-users/vzG58m0Yr2Y
 
 __all__ = [
+    # openmp
+    'set_num_threads', 'get_num_threads',
     # lebedev_laikov
     'lebedev_laikov_npoint', 'lebedev_laikov_sphere', 'lebedev_laikov_npoints',
     # becke
-    'becke_helper_atom',
+    'becke_helper_atom', 'ssf_helper_atom', 'becke_helper_molgrid',
+    'ssf_helper_molgrid',
     # cubic_spline
     'Extrapolation', 'ZeroExtrapolation', 'CuspExtrapolation',
     'PowerExtrapolation', 'tridiagsym_solve', 'CubicSpline',
     'compute_cubic_spline_int_weights',
     # evaluate
-    'index_wrap', 'eval_spline_cube', 'eval_spline_grid',
+    'index_wrap', 'eval_spline_cube', 'eval_spline_grid', 'eval_splines_grid',
     # rtransform
     'RTransform', 'IdentityRTransform', 'LinearRTransform', 'ExpRTransform',
     'ShiftedExpRTransform', 'PowerRTransform',
     # UniformGrid
-    'UniformGrid', 'UniformGridWindow', 'index_wrap', 'Block3Iterator',
+    'UniformGrid', 'UniformGridWindow', 'SparseUniformGridWindow', 'index_wrap',
+    'Block3Iterator',
     # utils
-    'dot_multi', 'dot_multi_moments_cube', 'dot_multi_moments',
+    'dot_multi', 'dot_multi_batch', 'dot_multi_moments_cube', 'dot_multi_moments',
 ]
 
 
+#
+# openmp
+#
+
+
+def set_num_threads(int nthread):
+    '''Set the number of OpenMP threads used by the grid routines
+
+       **Arguments:**
+
+       nthread
+            The number of threads, at least one. By default, the number of
+            threads is determined by the OMP_NUM_THREADS environment variable
+            or the number of cores.
+
+       All parallel routines (e.g. ``dot_multi``, ``eval_spline_grid``,
+       ``eval_spline_cube`` and the Becke weights) give the same results for
+       any number of threads. They do not hold the GIL, so they may also run
+       concurrently in Python threads.
+
+       When work is distributed over several processes, e.g. with
+       ``run_scf_batch``, the number of threads should be set in each
+       process, such that the total number of threads does not exceed the
+       number of cores. (``run_scf_batch`` uses one thread per worker by
+       default.) Processes forked after the parent has run a parallel
+       routine should not use more than one thread, because the OpenMP
+       thread pool of GCC does not survive a fork.
+    '''
+    if nthread < 1:
+        raise ValueError('The number of threads must be at least one.')
+    openmp.omp_set_num_threads(nthread)
+
+
+def get_num_threads():
+    '''Return the number of OpenMP threads used by the grid routines'''
+    return openmp.omp_get_max_threads()
+
+
 #
 # lebedev_laikov
 #
@@ -165,6 +208,157 @@ def becke_helper_atom(np.ndarray[double, ndim=2] points not None,
                             &radii[0], &centers[0, 0], select, order)
 
 
+def ssf_helper_atom(np.ndarray[double, ndim=2] points not None,
+                    np.ndarray[double, ndim=1] weights not None,
+                    np.ndarray[double, ndim=2] centers not None,
+                    int select):
+    '''ssf_helper_atom(points, weights, centers, i)
+
+       Compute the Stratmann-Scuseria-Frisch weights for a given atom an a grid.
+
+       **Arguments:**
+
+       points
+            The Cartesian coordinates of the grid points. Numpy array with
+            shape (npoint, 3)
+
+       weights
+            The output array where the partitioning weights are written.
+            Numpy array with shape (npoint,)
+
+       centers
+            The positions of the nuclei.
+
+       select
+            The selected atom for which the weights should be created.
+
+       See the paper of Stratmann, Scuseria and Frisch for the details:
+       http://dx.doi.org/10.1016/0009-2614(96)00600-8
+    '''
+    assert points.flags['C_CONTIGUOUS']
+    assert points.shape[1] == 3
+    npoint = points.shape[0]
+    assert weights.flags['C_CONTIGUOUS']
+    assert weights.shape[0] == npoint
+    assert centers.flags['C_CONTIGUOUS']
+    natom = centers.shape[0]
+    assert centers.shape[1] == 3
+    assert select >= 0 and select < natom
+
+    becke.ssf_helper_atom(points.shape[0], &points[0, 0], &weights[0], natom,
+                          &centers[0, 0], select)
+
+
+def _check_molgrid_args(np.ndarray[double, ndim=2] points, np.ndarray[double, ndim=1] weights,
+                        np.ndarray[double, ndim=2] centers, np.ndarray[long, ndim=1] offsets,
+                        begin, end):
+    assert points.flags['C_CONTIGUOUS']
+    assert points.shape[1] == 3
+    npoint = points.shape[0]
+    assert weights.flags['C_CONTIGUOUS']
+    assert weights.shape[0] == npoint
+    assert centers.flags['C_CONTIGUOUS']
+    natom = centers.shape[0]
+    assert centers.shape[1] == 3
+    assert offsets.flags['C_CONTIGUOUS']
+    assert offsets.shape[0] == natom+1
+    assert offsets[0] == 0
+    assert offsets[natom] == npoint
+    assert (offsets[1:] >= offsets[:-1]).all()
+    if end is None:
+        end = natom
+    assert begin >= 0 and begin <= end and end <= natom
+    return natom, begin, end
+
+
+def becke_helper_molgrid(np.ndarray[double, ndim=2] points not None,
+                         np.ndarray[double, ndim=1] weights not None,
+                         np.ndarray[double, ndim=1] radii not None,
+                         np.ndarray[double, ndim=2] centers not None,
+                         np.ndarray[long, ndim=1] offsets not None,
+                         int order, begin=0, end=None):
+    '''becke_helper_molgrid(points, weights, radii, centers, offsets, k, begin=0, end=None)
+
+       Compute the Becke weights for the atomic subgrids of a molecular grid.
+
+       **Arguments:**
+
+       points
+            The Cartesian coordinates of all grid points. Numpy array with
+            shape (npoint, 3)
+
+       weights
+            The output array where the Becke partitioning weights are written.
+            Numpy array with shape (npoint,)
+
+       radii
+            The covalent radii used to shrink/enlarge basins in the Becke
+            scheme.
+
+       centers
+            The positions of the nuclei.
+
+       offsets
+            The points of the subgrid of atom i are points[offsets[i]:offsets[i+1]].
+            Numpy integer array with shape (natom+1,)
+
+       order
+            The order of the switching functions. (That is k in Becke's paper.)
+
+       **Optional arguments:**
+
+       begin, end
+            Only the subgrids of atoms begin to end (not included) are treated.
+            By default, all subgrids are treated.
+
+       The result is the same as calling becke_helper_atom for every atomic
+       subgrid, but the computation is parallelized over the grid points with
+       OpenMP and the GIL is released.
+    '''
+    cdef int natom, ibegin, iend
+    natom, ibegin, iend = _check_molgrid_args(points, weights, centers, offsets, begin, end)
+    assert radii.flags['C_CONTIGUOUS']
+    assert radii.shape[0] == natom
+    assert order > 0
+    if offsets[iend] == offsets[ibegin]:
+        return
+
+    cdef double* ppoints = &points[0, 0]
+    cdef double* pweights = &weights[0]
+    cdef double* pradii = &radii[0]
+    cdef double* pcenters = &centers[0, 0]
+    cdef long* poffsets = &offsets[0]
+    with nogil:
+        becke.becke_helper_molgrid(ppoints, pweights, natom, pradii, pcenters,
+                                   poffsets, ibegin, iend, order)
+
+
+def ssf_helper_molgrid(np.ndarray[double, ndim=2] points not None,
+                       np.ndarray[double, ndim=1] weights not None,
+                       np.ndarray[double, ndim=2] centers not None,
+                       np.ndarray[long, ndim=1] offsets not None,
+                       begin=0, end=None):
+    '''ssf_helper_molgrid(points, weights, centers, offsets, begin=0, end=None)
+
+       Compute the Stratmann-Scuseria-Frisch weights for the atomic subgrids of
+       a molecular grid.
+
+       The arguments have the same meaning as in ``becke_helper_molgrid``.
+    '''
+    cdef int natom, ibegin, iend
+    natom, ibegin, iend = _check_molgrid_args(points, weights, centers, offsets, begin, end)
+    if offsets[iend] == offsets[ibegin]:
+        return
+
+    cdef double* ppoints = &points[0, 0]
+    cdef double* pweights = &weights[0]
+    cdef double* pcenters = &centers[0, 0]
+    cdef long* poffsets = &offsets[0]
+    with nogil:
+        becke.ssf_helper_molgrid(ppoints, pweights, natom, pcenters, poffsets,
+                                 ibegin, iend)
+
+
 #
 # cubic_spline
 #
@@ -209,6 +403,10 @@ cdef class Extrapolation(object):
         '''Evaluate the extrapolation function derivative at the right of the cubic spline interval'''
         return self._this.deriv_right(x)
 
+    def has_tail(self):
+        '''Returns True if the extrapolation is not zero at the right of the cubic spline interval'''
+        return self._this.has_tail()
+
     def to_string(self):
         '''Return an extrapolation object in string respresentation'''
         return self.__class__.__name__
@@ -477,8 +675,10 @@ def eval_spline_cube(CubicSpline spline not None,
     assert output.shape[1] == ugrid.shape[1]
     assert output.shape[2] == ugrid.shape[2]
 
-    evaluate.eval_spline_cube(spline._this, &center[0], &output[0, 0, 0],
-                              ugrid._this)
+    cdef double* pcenter = &center[0]
+    cdef double* poutput = &output[0, 0, 0]
+    with nogil:
+        evaluate.eval_spline_cube(spline._this, pcenter, poutput, ugrid._this)
 
 def eval_spline_grid(CubicSpline spline not None,
                      np.ndarray[double, ndim=1] center not None,
@@ -512,8 +712,76 @@ def eval_spline_grid(CubicSpline spline not None,
     assert points.shape[1] == 3
     assert points.shape[0] == output.shape[0]
 
-    evaluate.eval_spline_grid(spline._this, &center[0], &output[0],
-                              &points[0, 0], cell._this, output.shape[0])
+    cdef double* pcenter = &center[0]
+    cdef double* poutput = &output[0]
+    cdef double* ppoints = &points[0, 0]
+    cdef long npoint = output.shape[0]
+    with nogil:
+        evaluate.eval_spline_grid(spline._this, pcenter, poutput, ppoints,
+                                  cell._this, npoint)
+
+
+def eval_splines_grid(splines,
+                      np.ndarray[double, ndim=1] center not None,
+                      np.ndarray[double, ndim=2] output not None,
+                      np.ndarray[double, ndim=2] points not None,
+                      horton.cext.Cell cell not None):
+    '''Evaluate several spherically symmetric functions on a general grid
+
+       **Arguments:**
+
+       splines
+            A list of cubic splines with the radial dependence of the
+            spherically symmetric functions. All splines must use the same
+            rtransform.
+
+       center
+            The center of the spherically symmetric functions.
+
+       output
+            The output array with shape (nspline, N), to which the results are
+            added.
+
+       points
+            An array with grid points, with shape (N, 3)
+
+       cell
+            A specification of the periodic boundary conditions.
+
+       This gives the same result as calling ``eval_spline_grid`` for each
+       spline, but the distances between the center and the grid points and
+       the corresponding positions on the radial grid are computed only once.
+    '''
+    cdef CubicSpline spline
+    cdef cubic_spline.CubicSpline** cpp_splines
+    cdef int nspline = len(splines)
+    assert nspline > 0
+    assert center.flags['C_CONTIGUOUS']
+    assert center.shape[0] == 3
+    assert output.flags['C_CONTIGUOUS']
+    assert output.shape[0] == nspline
+    assert points.flags['C_CONTIGUOUS']
+    assert points.shape[1] == 3
+    assert points.shape[0] == output.shape[1]
+    rtf = splines[0].rtransform
+    for spline in splines:
+        if spline.rtransform is not rtf and spline.rtransform.to_string() != rtf.to_string():
+            raise ValueError('All splines must have the same rtransform.')
+
+    cdef double* pcenter = &center[0]
+    cdef double* poutput = &output[0, 0]
+    cdef double* ppoints = &points[0, 0]
+    cdef long npoint = output.shape[1]
+    cpp_splines = <cubic_spline.CubicSpline**>malloc(nspline*sizeof(cubic_spline.CubicSpline*))
+    try:
+        for i in xrange(nspline):
+            spline = splines[i]
+            cpp_splines[i] = spline._this
+        with nogil:
+            evaluate.eval_splines_grid(cpp_splines, nspline, pcenter, poutput,
+                                       ppoints, cell._this, npoint)
+    finally:
+        free(cpp_splines)
 
 
 #
@@ -1062,7 +1330,10 @@ cdef class UniformGrid(object):
         assert output.shape[1] == self.shape[1]
         assert output.shape[2] == self.shape[2]
 
-        evaluate.eval_spline_cube(spline._this, &center[0], &output[0, 0, 0], self._this)
+        cdef double* pcenter = &center[0]
+        cdef double* poutput = &output[0, 0, 0]
+        with nogil:
+            evaluate.eval_spline_cube(spline._this, pcenter, poutput, self._this)
 
     def integrate(self, *args):
         '''Integrate the product of all arguments
@@ -1080,6 +1351,24 @@ cdef class UniformGrid(object):
         # Similar to conventional integration routine:
         return dot_multi(*args)*abs(np.linalg.det(self.grid_rvecs))
 
+    def integrate_batch(self, batch, *args):
+        '''Integrate the product of all arguments with each function in batch
+
+           **Arguments:**
+
+           batch
+                A list of arrays with the same size as the number of grid
+                points. For each array, the integral of its product with all
+                other arguments is computed.
+
+           data1, data2, ...
+                All arguments must be arrays with the same size as the number
+                of grid points.
+        '''
+        args = [arg.ravel() for arg in args if arg is not None]
+        batch = [vec.ravel() for vec in batch]
+        return dot_multi_batch(args, batch)*abs(np.linalg.det(self.grid_rvecs))
+
     def get_ranges_rcut(self, np.ndarray[double, ndim=1] center not None, double rcut):
         '''Return the ranges if indexes that lie within the cutoff sphere.
 
@@ -1144,7 +1433,7 @@ cdef class UniformGrid(object):
         return result
 
     # TODO: move this to cpart
-    def compute_weight_corrections(self, funcs, rcut_scale=0.9, rcut_max=2.0, rcond=0.1, output=None):
+    def compute_weight_corrections(self, funcs, rcut_scale=0.9, rcut_max=2.0, rcond=0.1, output=None, cache=None):
         '''Computes corrections to the integration weights.
 
            **Arguments:**
@@ -1176,6 +1465,18 @@ cdef class UniformGrid(object):
                 This should not be too low. Current value is a compromise
                 between accuracy and transferability of the weight corrections.
 
+           cache
+                A dictionary in which intermediate results are stored, such
+                that they can be reused in subsequent calls. When not given,
+                intermediate results are only reused within one call.
+
+           Tapered splines and their exact integrals are computed only once
+           for every combination of radial functions and cutoff radius, e.g.
+           once per element. The corrections are also reused for centers that
+           have the same radial functions, the same cutoff radius, the same
+           position relative to the grid points and the same set of grid
+           points inside the cutoff sphere, relative to the center.
+
            **Return value:**
 
            The return value is a data array that can be provided as an
@@ -1189,6 +1490,8 @@ cdef class UniformGrid(object):
             output = np.ones(self.shape, float)
         else:
             output[:] = 1.0
+        if cache is None:
+            cache = {}
         cell = self.get_cell()
         grid_cell = self.get_grid_cell()
         volume = grid_cell.volume
@@ -1198,17 +1501,22 @@ cdef class UniformGrid(object):
             rcut_max = min(rcut_max, 0.5*rcut_scale*cell.rspacings.min())
         rcuts = np.zeros(len(funcs)) + rcut_max
 
-        # determine safe cutoff radii
-        for i0 in xrange(len(funcs)):
-            center0, rcut0 = funcs[i0][:2]
-            for i1 in xrange(i0):
-                center1, rcut1 = funcs[i1][:2]
-                delta = center1 - center0
-                cell.mic(delta)
-                dist = np.linalg.norm(delta)
-                rcut = 0.5*rcut_scale*dist
-                rcuts[i0] = min(rcut, rcuts[i0])
-                rcuts[i1] = min(rcut, rcuts[i1])
+        # determine safe cutoff radii. Only neighbors closer than
+        # rcut_max/(0.5*rcut_scale) can reduce the cutoff radius.
+        if len(funcs) > 1 and rcut_max > 0 and rcut_scale > 0:
+            centers = np.array([func[0] for func in funcs], float)
+            nlist = cell.get_neighbor_list(centers, rcut_max/(0.5*rcut_scale))
+            for i0 in xrange(len(funcs)):
+                icenters, images, deltas, dists = nlist.query(centers[i0])
+                dists = dists[icenters != i0]
+                if len(dists) > 0:
+                    rcuts[i0] = min(0.5*rcut_scale*dists.min(), rcuts[i0])
+
+        def get_spline_key(spline):
+            # Splines of the same element are usually different objects with
+            # the same contents. The contents are compared byte by byte.
+            return (spline.rtransform.to_string(), spline.y.tostring(),
+                    spline.dx.tostring())
 
         def get_aux_grid(center, aux_rcut):
             ranges_begin, ranges_end = grid_cell.get_ranges_rcut(self.origin-center, aux_rcut)
@@ -1219,6 +1527,10 @@ cdef class UniformGrid(object):
             return aux_grid, -ranges_begin
 
         def get_tapered_spline(spline, rcut, aux_rcut):
+            key = ('tapered', get_spline_key(spline), rcut, aux_rcut)
+            result = cache.get(key)
+            if result is not None:
+                return result
             assert rcut < aux_rcut
             rtf = spline.rtransform
             r = rtf.get_radii()
@@ -1249,23 +1561,16 @@ cdef class UniformGrid(object):
                 ty, r, r, int1d.get_weights(len(r)), rtf.get_deriv()
             )
             # done
+            cache[key] = tapered_spline, int_exact
             return tapered_spline, int_exact
 
-        icenter = 0
-        for (center, splines), rcut in zip(funcs, rcuts):
-            # A) Determine the points inside the cutoff sphere.
-            ranges_begin, ranges_end = grid_cell.get_ranges_rcut(self.origin-center, rcut)
-
-            # B) Construct a set of grid indexes that lie inside the sphere.
-            nselect_max = np.product(ranges_end-ranges_begin)
-            indexes = np.zeros((nselect_max, 3), int)
-            nselect = grid_cell.select_inside(self.origin, center, rcut, ranges_begin, ranges_end, self.shape, self.pbc, indexes)
-            indexes = indexes[:nselect]
-
+        def get_corrections(icenter, center, splines, rcut, indexes):
             # C) Set up an integration grid for the tapered spline
+            nselect = len(indexes)
             aux_rcut = 2*rcut
             aux_grid, aux_offset = get_aux_grid(center, aux_rcut)
             aux_indexes = (indexes + aux_offset) % self.shape
+            aux_flat = np.ravel_multi_index(aux_indexes.T, aux_grid.shape)
 
             # D) Allocate the arrays for the least-squares fit of the
             # corrections.
@@ -1274,20 +1579,19 @@ cdef class UniformGrid(object):
             ev = np.zeros(neq+1, float)
 
             # E) Fill in the coefficients. This is the expensive part.
-            ieq = 0
             tmp = np.zeros(aux_grid.shape)
             av = np.zeros(neq+1)
-            for spline in splines:
+            for ieq, spline in enumerate(splines):
                 if log.do_medium:
                     log("Computing spherical function. icenter=%i ieq=%i" % (icenter, ieq))
                 tapered_spline, int_exact = get_tapered_spline(spline, rcut, aux_rcut)
                 tmp[:] = 0.0
                 aux_grid.eval_spline(tapered_spline, center, tmp)
-                int_approx = self.integrate(tmp)
-                dm[ieq] = volume*tmp[aux_indexes[:,0], aux_indexes[:,1], aux_indexes[:,2]]
-                av[ieq] = int_approx
-                ev[ieq] = int_exact - int_approx
-                ieq += 1
+                av[ieq] = self.integrate(tmp)
+                dm[ieq] = tmp.ravel().take(aux_flat)
+                ev[ieq] = int_exact
+            dm[:neq] *= volume
+            ev -= av
 
             # Add error on constant function
             dm[neq] = volume
@@ -1318,18 +1622,63 @@ cdef class UniformGrid(object):
                 for ieq in xrange(neq):
                     log('   spline %3i    error %+.3e   orig %+.3e  exact %+.3e' % (ieq, ev[ieq]-mv[ieq], ev[ieq], ev[ieq]+av[ieq]))
                 log('   constant      error %+.3e' % corrections.sum())
+            return corrections
+
+        for icenter, ((center, splines), rcut) in enumerate(zip(funcs, rcuts)):
+            # A) Determine the points inside the cutoff sphere.
+            ranges_begin, ranges_end = grid_cell.get_ranges_rcut(self.origin-center, rcut)
+
+            # B) Construct a set of grid indexes that lie inside the sphere.
+            nselect_max = np.product(ranges_end-ranges_begin)
+            indexes = np.zeros((nselect_max, 3), int)
+            nselect = grid_cell.select_inside(self.origin, center, rcut, ranges_begin, ranges_end, self.shape, self.pbc, indexes)
+            indexes = indexes[:nselect]
+
+            # C-E) The corrections only depend on the splines, the cutoff
+            # radius, the position of the center relative to the grid points
+            # and the selected grid points relative to the center. (The
+            # latter differ near non-periodic edges of the grid.) Equivalent
+            # centers (e.g. atoms of the same element in a crystal) reuse the
+            # corrections of the first one.
+            frac = np.round(grid_cell.to_frac(center - self.origin), 8)
+            relative = indexes - np.floor(frac).astype(int)
+            periodic = self.pbc.astype(bool)
+            relative[:,periodic] %= self.shape[periodic]
+            key = ('corrections', tuple(get_spline_key(spline) for spline in splines),
+                   round(rcut, 10), tuple(frac % 1.0), relative.tostring(),
+                   tuple(grid_cell.rvecs.ravel()), rcond)
+            corrections = cache.get(key)
+            if corrections is None:
+                corrections = get_corrections(icenter, center, splines, rcut, indexes)
+                cache[key] = corrections
+            elif log.do_medium:
+                log('icenter=%i NSELECT=%i Reusing corrections of an equivalent center.' % (icenter, nselect))
 
             # F) Fill the corrections into the right place:
             output[indexes[:,0], indexes[:,1], indexes[:,2]] += corrections
 
-            icenter += 1
-
         return output
 
     def get_window(self, np.ndarray[double, ndim=1] center not None, double rcut):
         begin, end = self.get_ranges_rcut(center, rcut)
         return UniformGridWindow(self, begin, end)
 
+    def get_sparse_window(self, np.ndarray[double, ndim=1] center not None, double rcut):
+        '''Return a window with only the grid points inside a cutoff sphere
+
+           **Arguments:**
+
+           center
+                The center of the cutoff sphere
+
+           rcut
+                The radius of the cutoff sphere
+
+           **Returns:** a SparseUniformGridWindow instance.
+        '''
+        window = self.get_window(center, rcut)
+        return SparseUniformGridWindow(window, window.get_sphere_spans(center, rcut))
+
 
 cdef class UniformGridWindow(object):
     def __cinit__(self, UniformGrid ugrid not None,
@@ -1386,6 +1735,41 @@ cdef class UniformGridWindow(object):
     def zeros(self):
         return np.zeros(self.shape, float)
 
+    def get_sphere_spans(self, np.ndarray[double, ndim=1] center not None, double rcut):
+        '''Return the spans of the window that lie inside a cutoff sphere
+
+           **Arguments:**
+
+           center
+                The center of the cutoff sphere
+
+           rcut
+                The radius of the cutoff sphere
+
+           **Returns:** an integer array with shape (nspan, 4). Each row
+           contains i0, i1, k_begin and k_end, i.e. the points (i0, i1, k) of
+           the underlying grid, with k_begin <= k < k_end, are inside the
+           sphere.
+        '''
+        begin = self.begin
+        end = self.end
+        grid_rvecs = self._ugrid.grid_rvecs
+        i0, i1 = np.mgrid[begin[0]:end[0], begin[1]:end[1]]
+        i0 = i0.ravel()
+        i1 = i1.ravel()
+        # Relative vectors of the points (i0, i1, 0) with respect to the center
+        delta = self._ugrid.origin - center + np.outer(i0, grid_rvecs[0]) + np.outer(i1, grid_rvecs[1])
+        # Solve |delta + k*grid_rvecs[2]|**2 <= rcut**2 for k
+        a = np.dot(grid_rvecs[2], grid_rvecs[2])
+        b = np.dot(delta, grid_rvecs[2])
+        disc = b*b - a*((delta*delta).sum(axis=1) - rcut*rcut)
+        mask = disc >= 0
+        sqrt_disc = np.sqrt(disc[mask])
+        k_begin = np.maximum(np.ceil((-b[mask] - sqrt_disc)/a).astype(int), begin[2])
+        k_end = np.minimum(np.floor((-b[mask] + sqrt_disc)/a).astype(int) + 1, end[2])
+        spans = np.array([i0[mask], i1[mask], k_begin, k_end], dtype=int).T
+        return np.ascontiguousarray(spans[k_end > k_begin])
+
     def extend(self, np.ndarray[double, ndim=3] cell not None,
                np.ndarray[double, ndim=3] local not None):
         '''Copy a periodic repetation of the cell function to the local grid'''
@@ -1399,7 +1783,10 @@ cdef class UniformGridWindow(object):
         assert local.shape[0] == shape[0]
         assert local.shape[1] == shape[1]
         assert local.shape[2] == shape[2]
-        self._this.extend(&cell[0, 0, 0], &local[0, 0, 0])
+        cdef double* pcell = &cell[0, 0, 0]
+        cdef double* plocal = &local[0, 0, 0]
+        with nogil:
+            self._this.extend(pcell, plocal)
 
     def wrap(self, np.ndarray[double, ndim=3] local not None,
                    np.ndarray[double, ndim=3] cell not None):
@@ -1414,7 +1801,10 @@ cdef class UniformGridWindow(object):
         assert cell.shape[0] == shape[0]
         assert cell.shape[1] == shape[1]
         assert cell.shape[2] == shape[2]
-        self._this.wrap(&local[0, 0, 0], &cell[0, 0, 0])
+        cdef double* plocal = &local[0, 0, 0]
+        cdef double* pcell = &cell[0, 0, 0]
+        with nogil:
+            self._this.wrap(plocal, pcell)
 
     def eval_spline(self, CubicSpline spline not None,
                     np.ndarray[double, ndim=1] center not None,
@@ -1428,7 +1818,10 @@ cdef class UniformGridWindow(object):
 
         # construct an ugrid for this window such that we can reuse an existing routine
         cdef UniformGrid window_ugrid = self.get_window_ugrid()
-        evaluate.eval_spline_cube(spline._this, &center[0], &output[0, 0, 0], window_ugrid._this)
+        cdef double* pcenter = &center[0]
+        cdef double* poutput = &output[0, 0, 0]
+        with nogil:
+            evaluate.eval_spline_cube(spline._this, pcenter, poutput, window_ugrid._this)
 
     def integrate(self, *args, **kwargs):
         '''Integrate the product of all arguments
@@ -1444,7 +1837,11 @@ cdef class UniformGridWindow(object):
 
            center=None
                 When given, multipole moments are computed with respect to
-                this center instead of a plain integral.
+                this center instead of a plain integral. An array with shape
+                (ncenter, 3) computes the moments with respect to all centers
+                in one pass over the grid. An additional index for the
+                centers is then added to the result, just before the index of
+                the moments.
 
            lmax=0
                 The maximum angular momentum to consider when computing multipole
@@ -1452,7 +1849,9 @@ cdef class UniformGridWindow(object):
 
            mtype=1
                 The type of multipole moments: 1=``cartesian``, 2=``pure``,
-                3=``radial``.
+                3=``radial``. When a list of types is given, all of them are
+                computed in one pass over the grid and a list of results is
+                returned, one for each type.
         '''
         args, multipole_args, segments = parse_args_integrate(*args, **kwargs)
         if segments is not None:
@@ -1466,11 +1865,238 @@ cdef class UniformGridWindow(object):
             # computation of multipole expansion of the integrand
             center, lmax, mtype = multipole_args
             window_ugrid = self.get_window_ugrid()
-            return dot_multi_moments_cube(args, window_ugrid, center, lmax, mtype)*volume
+            result = dot_multi_moments_cube(args, window_ugrid, center, lmax, mtype)
+            if isinstance(result, list):
+                return [moments*volume for moments in result]
+            else:
+                return result*volume
+
+    def integrate_batch(self, batch, *args):
+        '''Integrate the product of all arguments with each function in batch
+
+           **Arguments:**
 
-    def compute_weight_corrections(self, funcs, rcut_scale=0.9, rcut_max=2.0, rcond=0.1, output=None):
+           batch
+                A list of arrays with the same size as the number of grid
+                points. For each array, the integral of its product with all
+                other arguments is computed.
+
+           data1, data2, ...
+                All arguments must be arrays with the same size as the number
+                of grid points.
+        '''
+        args = [arg.ravel() for arg in args if arg is not None]
+        batch = [vec.ravel() for vec in batch]
+        volume = abs(np.linalg.det(self._ugrid.grid_rvecs))
+        return dot_multi_batch(args, batch)*volume
+
+    def compute_weight_corrections(self, funcs, rcut_scale=0.9, rcut_max=2.0, rcond=0.1, output=None, cache=None):
         window_ugrid = self.get_window_ugrid()
-        return window_ugrid.compute_weight_corrections(funcs, rcut_scale, rcut_max, rcond, output)
+        return window_ugrid.compute_weight_corrections(funcs, rcut_scale, rcut_max, rcond, output, cache)
+
+
+cdef class SparseUniformGridWindow(object):
+    '''A window of a uniform grid, restricted to the points in a list of spans
+
+       Only the points inside the spans are stored, in one compact (1D) array.
+       This typically represents the points of a cutoff sphere, see
+       ``UniformGrid.get_sparse_window``, which takes about half the memory of
+       the corresponding UniformGridWindow.
+    '''
+    def __cinit__(self, UniformGridWindow window not None,
+                  np.ndarray[long, ndim=2] spans not None):
+        '''
+           **Arguments:**
+
+           window
+                The UniformGridWindow that contains all spans.
+
+           spans
+                An integer array with shape (nspan, 4), see
+                ``UniformGridWindow.get_sphere_spans``.
+        '''
+        assert spans.flags['C_CONTIGUOUS']
+        assert spans.shape[1] == 4
+        begin = window.begin
+        end = window.end
+        assert (spans[:,0] >= begin[0]).all() and (spans[:,0] < end[0]).all()
+        assert (spans[:,1] >= begin[1]).all() and (spans[:,1] < end[1]).all()
+        assert (spans[:,2] >= begin[2]).all() and (spans[:,3] <= end[2]).all()
+        assert (spans[:,3] >= spans[:,2]).all()
+        self._window = window
+        self._spans = spans
+        self._size = (spans[:,3] - spans[:,2]).sum()
+
+    property ugrid:
+        def __get__(self):
+            return self._window.ugrid
+
+    property window:
+        def __get__(self):
+            return self._window
+
+    property spans:
+        def __get__(self):
+            return self._spans.view()
+
+    property shape:
+        def __get__(self):
+            return (self._size,)
+
+    property size:
+        def __get__(self):
+            return self._size
+
+    def get_window_ugrid(self):
+        return self._window.get_window_ugrid()
+
+    def zeros(self):
+        return np.zeros(self._size, float)
+
+    def _get_indexes(self):
+        '''Return the indexes (i0, i1, k) of all points in the spans'''
+        spans = self._spans
+        counts = spans[:,3] - spans[:,2]
+        rows = np.repeat(np.arange(len(spans)), counts)
+        offsets = np.zeros(len(spans), int)
+        offsets[1:] = counts.cumsum()[:-1]
+        k = spans[rows,2] + np.arange(self._size) - offsets[rows]
+        return spans[rows,0], spans[rows,1], k
+
+    def get_points(self):
+        '''Return the Cartesian coordinates of all points in the spans'''
+        i0, i1, k = self._get_indexes()
+        grid_rvecs = self.ugrid.grid_rvecs
+        return self.ugrid.origin + np.outer(i0, grid_rvecs[0]) + \
+               np.outer(i1, grid_rvecs[1]) + np.outer(k, grid_rvecs[2])
+
+    def from_window(self, np.ndarray[double, ndim=3] local not None):
+        '''Return the points of the spans from an array on the full window'''
+        shape = self._window.shape
+        assert local.shape[0] == shape[0]
+        assert local.shape[1] == shape[1]
+        assert local.shape[2] == shape[2]
+        i0, i1, k = self._get_indexes()
+        begin = self._window.begin
+        return local[i0 - begin[0], i1 - begin[1], k - begin[2]]
+
+    def extend(self, np.ndarray[double, ndim=3] cell not None,
+               np.ndarray[double, ndim=1] local not None):
+        '''Copy a periodic repetation of the cell function to the sparse window'''
+        assert cell.flags['C_CONTIGUOUS']
+        shape = self.ugrid.shape
+        assert cell.shape[0] == shape[0]
+        assert cell.shape[1] == shape[1]
+        assert cell.shape[2] == shape[2]
+        assert local.flags['C_CONTIGUOUS']
+        assert local.shape[0] == self._size
+        if self._size == 0:
+            return
+        cdef np.ndarray[long, ndim=2] spans = self._spans
+        cdef long nspan = spans.shape[0]
+        cdef long* pspans = &spans[0, 0]
+        cdef double* pcell = &cell[0, 0, 0]
+        cdef double* plocal = &local[0]
+        cdef uniform.UniformGrid* ugrid = self._window._ugrid._this
+        with nogil:
+            uniform.extend_spans(ugrid, nspan, pspans, pcell, plocal)
+
+    def wrap(self, np.ndarray[double, ndim=1] local not None,
+                   np.ndarray[double, ndim=3] cell not None):
+        '''Add the sparse function to the periodic array, wrapping around the edges'''
+        assert local.flags['C_CONTIGUOUS']
+        assert local.shape[0] == self._size
+        assert cell.flags['C_CONTIGUOUS']
+        shape = self.ugrid.shape
+        assert cell.shape[0] == shape[0]
+        assert cell.shape[1] == shape[1]
+        assert cell.shape[2] == shape[2]
+        if self._size == 0:
+            return
+        cdef np.ndarray[long, ndim=2] spans = self._spans
+        cdef long nspan = spans.shape[0]
+        cdef long* pspans = &spans[0, 0]
+        cdef double* plocal = &local[0]
+        cdef double* pcell = &cell[0, 0, 0]
+        cdef uniform.UniformGrid* ugrid = self._window._ugrid._this
+        with nogil:
+            uniform.wrap_spans(ugrid, nspan, pspans, plocal, pcell)
+
+    def eval_spline(self, CubicSpline spline not None,
+                    np.ndarray[double, ndim=1] center not None,
+                    np.ndarray[double, ndim=1] output not None):
+        assert center.flags['C_CONTIGUOUS']
+        assert center.shape[0] == 3
+        assert output.flags['C_CONTIGUOUS']
+        assert output.shape[0] == self._size
+        if self._size == 0:
+            return
+        cdef np.ndarray[long, ndim=2] spans = self._spans
+        cdef long nspan = spans.shape[0]
+        cdef long* pspans = &spans[0, 0]
+        cdef double* pcenter = &center[0]
+        cdef double* poutput = &output[0]
+        cdef uniform.UniformGrid* ugrid = self._window._ugrid._this
+        with nogil:
+            evaluate.eval_spline_spans(spline._this, pcenter, poutput, ugrid,
+                                       nspan, pspans)
+
+    def integrate(self, *args, **kwargs):
+        '''Integrate the product of all arguments
+
+           **Arguments:**
+
+           data1, data2, ...
+                All arguments must be arrays with the same size as the number
+                of grid points. The arrays contain the functions, evaluated
+                at the grid points, that must be multiplied and integrated.
+
+           **Optional arguments:**
+
+           center, lmax, mtype
+                See ``UniformGridWindow.integrate``.
+        '''
+        args, multipole_args, segments = parse_args_integrate(*args, **kwargs)
+        if segments is not None:
+            raise TypeError('Unexpected argument: segments')
+
+        volume = abs(np.linalg.det(self.ugrid.grid_rvecs))
+        if multipole_args is None:
+            # regular integration
+            return dot_multi(*args)*volume
+        else:
+            # computation of multipole expansion of the integrand
+            center, lmax, mtype = multipole_args
+            result = dot_multi_moments(args, self.get_points(), center, lmax, mtype, None)
+            if isinstance(result, list):
+                return [moments*volume for moments in result]
+            else:
+                return result*volume
+
+    def integrate_batch(self, batch, *args):
+        '''Integrate the product of all arguments with each function in batch
+
+           See ``UniformGridWindow.integrate_batch``.
+        '''
+        args = [arg.ravel() for arg in args if arg is not None]
+        batch = [vec.ravel() for vec in batch]
+        volume = abs(np.linalg.det(self.ugrid.grid_rvecs))
+        return dot_multi_batch(args, batch)*volume
+
+    def compute_weight_corrections(self, funcs, rcut_scale=0.9, rcut_max=2.0, rcond=0.1, output=None, cache=None):
+        '''Compute weight corrections for the points of the spans
+
+           See ``UniformGrid.compute_weight_corrections``. The corrections are
+           computed on the full window and then the points of the spans are
+           copied to the output array.
+        '''
+        corrections = self._window.compute_weight_corrections(funcs, rcut_scale, rcut_max, rcond, cache=cache)
+        if output is None:
+            output = self.zeros()
+        else:
+            assert output.shape == (self._size,)
+        output[:] = self.from_window(corrections)
+        return output
 
 
 def index_wrap(long i, long high):
@@ -1546,6 +2172,7 @@ def _parse_segments(segments, npoint):
     if segments is None:
         segments = np.array([npoint])
     assert segments.flags['C_CONTIGUOUS']
+    assert segments.sum() == npoint
     nsegment = segments.shape[0]
     return segments, nsegment
 
@@ -1569,9 +2196,13 @@ def dot_multi(*integranda, np.ndarray[long, ndim=1] segments=None):
     cdef long npoint = _check_integranda(integranda)
     segments, nsegment = _parse_segments(segments, npoint)
     cdef np.ndarray[double, ndim=1] output = np.zeros(nsegment)
+    cdef long nvector = len(integranda)
+    cdef long* psegments = &segments[0]
+    cdef double* poutput = &output[0]
     cdef double** pointers = _parse_integranda(integranda)
     try:
-        utils.dot_multi(npoint, len(integranda), pointers, &segments[0], &output[0])
+        with nogil:
+            utils.dot_multi(npoint, nvector, pointers, psegments, poutput)
     finally:
         free(pointers)
     if nsegment == 1:
@@ -1580,6 +2211,57 @@ def dot_multi(*integranda, np.ndarray[long, ndim=1] segments=None):
         return output
 
 
+def dot_multi_batch(integranda, batch, np.ndarray[long, ndim=1] segments=None):
+    '''Multiply the integranda piecewise with each array in batch and sum up
+
+       **Arguments:**
+
+       integranda
+            A list of arrays of the same size, whose elements are multiplied
+            piecewise.
+
+       batch
+            A list of arrays with the same size as the integranda. For each
+            array in batch, the sum of its piecewise product with all
+            integranda is computed.
+
+       **Optional arguments:**
+
+       segments
+            An array with segment sizes (integer). If given, the summation is
+            carried out in segments of the given sizes.
+
+       The product of the integranda is computed only once for each point.
+       The result is the same as ``np.array([dot_multi(*(integranda + [vec]))
+       for vec in batch])``, apart from rounding errors.
+
+       **Returns:** an array with shape (len(batch),), or with shape
+       (nsegment, len(batch)) when segments are given.
+    '''
+    cdef long npoint = _check_integranda(integranda)
+    _check_integranda(batch, npoint)
+    segments, nsegment = _parse_segments(segments, npoint)
+    cdef long nbatch = len(batch)
+    cdef np.ndarray[double, ndim=2] output = np.zeros((nsegment, nbatch))
+    cdef long nvector = len(integranda)
+    cdef long* psegments = &segments[0]
+    cdef double* poutput = &output[0, 0]
+    cdef double** pointers = _parse_integranda(integranda)
+    cdef double** batch_pointers = NULL
+    try:
+        batch_pointers = _parse_integranda(batch)
+        with nogil:
+            utils.dot_multi_batch(npoint, nvector, pointers, nbatch,
+                                  batch_pointers, psegments, poutput)
+    finally:
+        free(pointers)
+        free(batch_pointers)
+    if nsegment == 1:
+        return output[0]
+    else:
+        return output
+
+
 cdef long _get_nmoment(long lmax, long mtype):
     if mtype==1:
         # cartesian moments
@@ -1594,10 +2276,46 @@ cdef long _get_nmoment(long lmax, long mtype):
         raise ValueError('Unsupported mtype.')
 
 
+def _parse_moments_args(center, lmax, mtype):
+    '''Convert center and mtype arguments to the arrays used by the C++ code'''
+    centers = np.ascontiguousarray(center, dtype=float)
+    if centers.ndim == 1:
+        centers = centers.reshape(1, -1)
+    assert centers.ndim == 2
+    assert centers.shape[1] == 3
+    if isinstance(mtype, (int, long, np.integer)):
+        mtypes = np.array([mtype], dtype=int)
+    else:
+        mtypes = np.array(mtype, dtype=int)
+        assert mtypes.ndim == 1
+        assert len(mtypes) > 0
+    nmoments = np.array([_get_nmoment(lmax, m) for m in mtypes])
+    return centers, mtypes, nmoments
+
+
+def _split_moments(output, center, mtype, nmoments):
+    '''Split the output of the C++ code over the mtypes
+
+       The first index of output runs over the segments, the second over the
+       centers and the last over the moments of all mtypes.
+    '''
+    if output.shape[0] == 1:
+        output = output[0]
+    if np.ndim(center) == 1:
+        output = output[...,0,:]
+    result = []
+    begin = 0
+    for nmoment in nmoments:
+        result.append(output[...,begin:begin+nmoment])
+        begin += nmoment
+    if isinstance(mtype, (int, long, np.integer)):
+        return result[0]
+    else:
+        return result
+
 
-def dot_multi_moments_cube(integranda, UniformGrid ugrid not None,
-                           np.ndarray[double, ndim=1] center not None,
-                           long lmax, long mtype):
+def dot_multi_moments_cube(integranda, UniformGrid ugrid not None, center,
+                           long lmax, mtype):
     '''Multiply the arguments piecewise, including one of a series of multipole functions at a time, and sum up the products.
 
        **Arguments:**
@@ -1607,17 +2325,23 @@ def dot_multi_moments_cube(integranda, UniformGrid ugrid not None,
             and then added.
 
        center
-            The origin for the multipole functions
+            The origin for the multipole functions. This may also be an array
+            with shape (ncenter, 3), in which case the moments with respect to
+            all centers are computed in one pass over the grid.
 
        lmax
             The maximum angular momentum for the moments
 
        mtype
             The type of moments: 1=``cartesian``, 2=``pure``,
-            3=``radial``, 4=``surface``.
+            3=``radial``. This may also be a list of types, in which case the
+            moments of all types are computed in one pass over the grid.
 
        **Returns:** an array where the number of elements matches the number of
-       multipole moments for the given combiantion of lmax and mtype.
+       multipole moments for the given combiantion of lmax and mtype. When
+       multiple centers are given, the array gets an additional first index
+       for the centers. When a list of mtypes is given, a list of such arrays
+       is returned, one for each mtype.
     '''
 
 
@@ -1626,24 +2350,31 @@ def dot_multi_moments_cube(integranda, UniformGrid ugrid not None,
     assert ugrid.pbc[0] == 0
     assert ugrid.pbc[1] == 0
     assert ugrid.pbc[2] == 0
-    #
-    assert center.flags['C_CONTIGUOUS']
-    assert center.shape[0] == 3
 
-    cdef long nmoment = _get_nmoment(lmax, mtype)
-    cdef np.ndarray[double, ndim=1] output = np.zeros(nmoment)
+    cdef np.ndarray[double, ndim=2] centers
+    cdef np.ndarray[long, ndim=1] mtypes
+    centers, mtypes, nmoments = _parse_moments_args(center, lmax, mtype)
+    cdef long ncenter = centers.shape[0]
+    cdef long nmtype = mtypes.shape[0]
+    cdef long nmoment = nmoments.sum()
+    cdef np.ndarray[double, ndim=3] output = np.zeros((1, ncenter, nmoment))
+    cdef long nvector = len(integranda)
+    cdef double* pcenters = &centers[0, 0]
+    cdef long* pmtypes = &mtypes[0]
+    cdef double* poutput = &output[0, 0, 0]
     cdef double** pointers = _parse_integranda(integranda)
     try:
-        utils.dot_multi_moments_cube(len(integranda), pointers, ugrid._this, &center[0], lmax, mtype, &output[0], nmoment)
+        with nogil:
+            utils.dot_multi_moments_cube(nvector, pointers, ugrid._this,
+                ncenter, pcenters, lmax, nmtype, pmtypes, poutput, nmoment)
     finally:
         free(pointers)
-    return output
+    return _split_moments(output, center, mtype, nmoments)
 
 
 def dot_multi_moments(integranda,
                       np.ndarray[double, ndim=2] points not None,
-                      np.ndarray[double, ndim=1] center not None,
-                      long lmax, long mtype,
+                      center, long lmax, mtype,
                       np.ndarray[long, ndim=1] segments):
     '''Multiply the arguments piecewise, including one of a series of multipole functions at a time, and sum up the products.
 
@@ -1654,14 +2385,17 @@ def dot_multi_moments(integranda,
             and then added.
 
        center
-            The origin for the multipole functions
+            The origin for the multipole functions. This may also be an array
+            with shape (ncenter, 3), in which case the moments with respect to
+            all centers are computed in one pass over the grid.
 
        lmax
             The maximum angular momentum for the moments
 
        mtype
             The type of moments: 1=``cartesian``, 2=``pure``,
-            3=``radial``, 4=``surface``.
+            3=``radial``. This may also be a list of types, in which case the
+            moments of all types are computed in one pass over the grid.
 
        segments
             An array with segment sizes (integer). If given, the summation is
@@ -1671,26 +2405,35 @@ def dot_multi_moments(integranda,
        multipole moments for the given combiantion of lmax and mtype. If
        ``segments`` is given, the return array has two indices, the first one
        running over the segments and the second one running over the moments.
+       When multiple centers are given, the array gets an additional index for
+       the centers, just before the index of the moments. When a list of mtypes
+       is given, a list of such arrays is returned, one for each mtype.
     '''
 
     assert points.flags['C_CONTIGUOUS']
     assert points.shape[1] == 3
     cdef long npoint = _check_integranda(integranda, points.shape[0])
-    #
-    assert center.flags['C_CONTIGUOUS']
-    assert center.shape[0] == 3
 
-    cdef long nmoment = _get_nmoment(lmax, mtype)
+    cdef np.ndarray[double, ndim=2] centers
+    cdef np.ndarray[long, ndim=1] mtypes
+    centers, mtypes, nmoments = _parse_moments_args(center, lmax, mtype)
+    cdef long ncenter = centers.shape[0]
+    cdef long nmtype = mtypes.shape[0]
+    cdef long nmoment = nmoments.sum()
     segments, nsegment = _parse_segments(segments, npoint)
-    cdef np.ndarray[double, ndim=2] output = np.zeros((nsegment, nmoment))
+    cdef np.ndarray[double, ndim=3] output = np.zeros((nsegment, ncenter, nmoment))
+    cdef long nvector = len(integranda)
+    cdef double* ppoints = &points[0, 0]
+    cdef double* pcenters = &centers[0, 0]
+    cdef long* pmtypes = &mtypes[0]
+    cdef long* psegments = &segments[0]
+    cdef double* poutput = &output[0, 0, 0]
     cdef double** pointers = _parse_integranda(integranda)
     try:
-        utils.dot_multi_moments(npoint, len(integranda), pointers,
-            &points[0, 0], &center[0], lmax, mtype,
-            &segments[0], &output[0, 0], nmoment)
+        with nogil:
+            utils.dot_multi_moments(npoint, nvector, pointers, ppoints,
+                ncenter, pcenters, lmax, nmtype, pmtypes, psegments, poutput,
+                nmoment)
     finally:
         free(pointers)
-    if nsegment == 1:
-        return output[0]
-    else:
-        return output
+    return _split_moments(output, center, mtype, nmoments)
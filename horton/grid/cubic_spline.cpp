@@ -133,70 +133,242 @@ void compute_cubic_spline_int_weights(double* weights, int npoint) {
 }
 
 /*
-   CubicSpline class.
+   Inlined coordinate transformations for the specialized evaluation kernels.
+   Each class implements the same inv and deriv functions as the corresponding
+   RTransform, but without virtual calls.
 */
 
-CubicSpline::CubicSpline(double* y, double* dt, Extrapolation* extrapolation, RTransform* rtf, int n):
-    extrapolation(extrapolation), rtf(rtf), first_x(0.0), last_x(0.0), y(y), dt(dt), n(n)
-{
-    first_x = rtf->radius(0);
-    last_x = rtf->radius(n-1);
-    extrapolation->prepare(this);
-}
+class GenericKernel {
+    private:
+        RTransform* rtf;
+    public:
+        GenericKernel(RTransform* rtf): rtf(rtf) {};
+        inline double inv(double r) {return rtf->inv(r);};
+        inline double deriv(double t) {return rtf->deriv(t);};
+    };
+
+
+class IdentityKernel {
+    public:
+        IdentityKernel(RTransform* rtf) {};
+        inline double inv(double r) {return r;};
+        inline double deriv(double t) {return 1.0;};
+    };
+
+
+class LinearKernel {
+    private:
+        double rmin, alpha;
+    public:
+        LinearKernel(RTransform* rtf):
+            rmin(((LinearRTransform*)rtf)->get_rmin()),
+            alpha(((LinearRTransform*)rtf)->get_alpha()) {};
+        inline double inv(double r) {return (r-rmin)/alpha;};
+        inline double deriv(double t) {return alpha;};
+    };
+
+
+class ExpKernel {
+    private:
+        double rmin, alpha;
+    public:
+        ExpKernel(RTransform* rtf):
+            rmin(((ExpRTransform*)rtf)->get_rmin()),
+            alpha(((ExpRTransform*)rtf)->get_alpha()) {};
+        inline double inv(double r) {return log(r/rmin)/alpha;};
+        inline double deriv(double t) {return rmin*alpha*exp(t*alpha);};
+    };
+
+
+class ShiftedExpKernel {
+    private:
+        double rshift, r0, alpha;
+    public:
+        ShiftedExpKernel(RTransform* rtf):
+            rshift(((ShiftedExpRTransform*)rtf)->get_rshift()),
+            r0(((ShiftedExpRTransform*)rtf)->get_r0()),
+            alpha(((ShiftedExpRTransform*)rtf)->get_alpha()) {};
+        inline double inv(double r) {return log((r + rshift)/r0)/alpha;};
+        inline double deriv(double t) {return r0*alpha*exp(t*alpha);};
+    };
+
+
+class PowerKernel {
+    private:
+        double rmin, power;
+    public:
+        PowerKernel(RTransform* rtf):
+            rmin(((PowerRTransform*)rtf)->get_rmin()),
+            power(((PowerRTransform*)rtf)->get_power()) {};
+        inline double inv(double r) {return pow(r/rmin, 1.0/power)-1;};
+        inline double deriv(double t) {return power*rmin*pow(t+1, power-1);};
+    };
 
 
-void CubicSpline::eval(double* new_x, double* new_y, int new_n) {
+/*
+   Evaluation kernels, specialized for each type of RTransform.
+*/
+
+template <class Kernel>
+static void eval_kernel(Kernel kernel, CubicSpline* cs, double* new_x,
+                        double* new_y, int new_n) {
+    const double first_x = cs->get_first_x();
+    const double last_x = cs->get_last_x();
+    const int n = cs->n;
     for (int i=0; i<new_n; i++) {
-        if (*new_x < first_x) {
+        double x = new_x[i];
+        if (x < first_x) {
             // Left extrapolation
-            *new_y = extrapolation->eval_left(*new_x);
-        } else if (*new_x <= last_x) {
+            new_y[i] = cs->get_extrapolation()->eval_left(x);
+        } else if (x <= last_x) {
             // Cubic Spline interpolation
-            // 1) transform *new_x to t
-            double t = rtf->inv(*new_x);
-//#ifdef DEBUG
-//            printf("X_TO_T x=%f t=%f\n", *new_x, t);
-//#endif
+            // 1) transform x to t
+            double t = kernel.inv(x);
             // 2) find the index of the interval in which t lies.
             int j = (int)floor(t);
             if (j==n - 1) j = n - 2;
             // 3) do the interpolation
-            double u = t - j;
-            double z = y[j+1] - y[j];
-            *new_y = y[j] + u*(dt[j] + u*(3*z - 2*dt[j] - dt[j+1] + u*(-2*z + dt[j] + dt[j+1])));
+            new_y[i] = cs->eval_interval(j, t - j);
         } else {
             // Right extrapolation
-            *new_y = extrapolation->eval_right(*new_x);
+            new_y[i] = cs->get_extrapolation()->eval_right(x);
         }
-        new_x++;
-        new_y++;
     }
 }
 
-void CubicSpline::eval_deriv(double* new_x, double* new_dx, int new_n) {
+
+template <class Kernel>
+static void to_t_kernel(Kernel kernel, double* new_x, double* new_t, int new_n) {
     for (int i=0; i<new_n; i++) {
-        if (*new_x < first_x) {
+        new_t[i] = kernel.inv(new_x[i]);
+    }
+}
+
+
+template <class Kernel>
+static void eval_deriv_kernel(Kernel kernel, CubicSpline* cs, double* new_x,
+                              double* new_dx, int new_n) {
+    const double first_x = cs->get_first_x();
+    const double last_x = cs->get_last_x();
+    const double* y = cs->y;
+    const double* dt = cs->dt;
+    const int n = cs->n;
+    for (int i=0; i<new_n; i++) {
+        double x = new_x[i];
+        if (x < first_x) {
             // Left extrapolation
-            *new_dx = extrapolation->deriv_left(*new_x);
-        } else if (*new_x <= last_x) {
+            new_dx[i] = cs->get_extrapolation()->deriv_left(x);
+        } else if (x <= last_x) {
             // Cubic Spline interpolation
-            // 1) transform *new_x to t
-            double t = rtf->inv(*new_x);
+            // 1) transform x to t
+            double t = kernel.inv(x);
             // 2) find the index of the interval in which t lies.
             int j = (int)floor(t);
             if (j==n - 1) j = n - 2;
             // 3) do the interpolation
             double u = t - j;
             double z = y[j+1] - y[j];
-            *new_dx = dt[j] + u*(6*z - 4*dt[j] - 2*dt[j+1] + u*(-6*z + 3*dt[j] + 3*dt[j+1]));
+            double d = dt[j] + u*(6*z - 4*dt[j] - 2*dt[j+1] + u*(-6*z + 3*dt[j] + 3*dt[j+1]));
             // 4) transform the derivative, from dy/dt to dy/dr
-            *new_dx /= rtf->deriv(t);
+            new_dx[i] = d/kernel.deriv(t);
         } else {
             // Right extrapolation
-            *new_dx = extrapolation->deriv_right(*new_x);
+            new_dx[i] = cs->get_extrapolation()->deriv_right(x);
         }
-        new_x++;
-        new_dx++;
+    }
+}
+
+
+/*
+   CubicSpline class.
+*/
+
+CubicSpline::CubicSpline(double* y, double* dt, Extrapolation* extrapolation, RTransform* rtf, int n):
+    extrapolation(extrapolation), rtf(rtf), rtf_kind(RTF_GENERIC), first_x(0.0),
+    last_x(0.0), y(y), dt(dt), n(n)
+{
+    first_x = rtf->radius(0);
+    last_x = rtf->radius(n-1);
+    // The type of transformation is determined only once.
+    if (dynamic_cast<IdentityRTransform*>(rtf) != NULL) {
+        rtf_kind = RTF_IDENTITY;
+    } else if (dynamic_cast<LinearRTransform*>(rtf) != NULL) {
+        rtf_kind = RTF_LINEAR;
+    } else if (dynamic_cast<ExpRTransform*>(rtf) != NULL) {
+        rtf_kind = RTF_EXP;
+    } else if (dynamic_cast<ShiftedExpRTransform*>(rtf) != NULL) {
+        rtf_kind = RTF_SHIFTED_EXP;
+    } else if (dynamic_cast<PowerRTransform*>(rtf) != NULL) {
+        rtf_kind = RTF_POWER;
+    }
+    extrapolation->prepare(this);
+}
+
+
+void CubicSpline::eval(double* new_x, double* new_y, int new_n) {
+    switch (rtf_kind) {
+        case RTF_IDENTITY:
+            eval_kernel(IdentityKernel(rtf), this, new_x, new_y, new_n);
+            break;
+        case RTF_LINEAR:
+            eval_kernel(LinearKernel(rtf), this, new_x, new_y, new_n);
+            break;
+        case RTF_EXP:
+            eval_kernel(ExpKernel(rtf), this, new_x, new_y, new_n);
+            break;
+        case RTF_SHIFTED_EXP:
+            eval_kernel(ShiftedExpKernel(rtf), this, new_x, new_y, new_n);
+            break;
+        case RTF_POWER:
+            eval_kernel(PowerKernel(rtf), this, new_x, new_y, new_n);
+            break;
+        default:
+            eval_kernel(GenericKernel(rtf), this, new_x, new_y, new_n);
+    }
+}
+
+void CubicSpline::to_t(double* new_x, double* new_t, int new_n) {
+    // Only meaningful for x in the interval [first_x, last_x].
+    switch (rtf_kind) {
+        case RTF_IDENTITY:
+            to_t_kernel(IdentityKernel(rtf), new_x, new_t, new_n);
+            break;
+        case RTF_LINEAR:
+            to_t_kernel(LinearKernel(rtf), new_x, new_t, new_n);
+            break;
+        case RTF_EXP:
+            to_t_kernel(ExpKernel(rtf), new_x, new_t, new_n);
+            break;
+        case RTF_SHIFTED_EXP:
+            to_t_kernel(ShiftedExpKernel(rtf), new_x, new_t, new_n);
+            break;
+        case RTF_POWER:
+            to_t_kernel(PowerKernel(rtf), new_x, new_t, new_n);
+            break;
+        default:
+            to_t_kernel(GenericKernel(rtf), new_x, new_t, new_n);
+    }
+}
+
+void CubicSpline::eval_deriv(double* new_x, double* new_dx, int new_n) {
+    switch (rtf_kind) {
+        case RTF_IDENTITY:
+            eval_deriv_kernel(IdentityKernel(rtf), this, new_x, new_dx, new_n);
+            break;
+        case RTF_LINEAR:
+            eval_deriv_kernel(LinearKernel(rtf), this, new_x, new_dx, new_n);
+            break;
+        case RTF_EXP:
+            eval_deriv_kernel(ExpKernel(rtf), this, new_x, new_dx, new_n);
+            break;
+        case RTF_SHIFTED_EXP:
+            eval_deriv_kernel(ShiftedExpKernel(rtf), this, new_x, new_dx, new_n);
+            break;
+        case RTF_POWER:
+            eval_deriv_kernel(PowerKernel(rtf), this, new_x, new_dx, new_n);
+            break;
+        default:
+            eval_deriv_kernel(GenericKernel(rtf), this, new_x, new_dx, new_n);
     }
 }
 
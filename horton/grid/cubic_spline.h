@@ -34,10 +34,16 @@ void compute_cubic_spline_int_weights(double* weights, int npoint);
 class Extrapolation;
 
 
+// The type of the RTransform of a CubicSpline, used to select a specialized
+// evaluation kernel without virtual calls for every point.
+enum RTransformKind {RTF_GENERIC, RTF_IDENTITY, RTF_LINEAR, RTF_EXP, RTF_SHIFTED_EXP, RTF_POWER};
+
+
 class CubicSpline {
     private:
         Extrapolation* extrapolation;
         RTransform* rtf;
+        RTransformKind rtf_kind;
         double first_x, last_x;
     public:
         double* y;
@@ -48,8 +54,17 @@ class CubicSpline {
 
         void eval(double* new_x, double* new_y, int new_n);
         void eval_deriv(double* new_x, double* new_dx, int new_n);
+        void to_t(double* new_x, double* new_t, int new_n);
+
+        // Interpolation in the interval [j, j+1] of the standard grid, with
+        // u = t - j.
+        inline double eval_interval(int j, double u) {
+            double z = y[j+1] - y[j];
+            return y[j] + u*(dt[j] + u*(3*z - 2*dt[j] - dt[j+1] + u*(-2*z + dt[j] + dt[j+1])));
+        };
 
         RTransform* get_rtransform() {return rtf;}
+        RTransformKind get_rtf_kind() {return rtf_kind;}
         double get_first_x() {return first_x;}; // position of first (transformed) grid point
         double get_last_x() {return last_x;}; // position of first (transformed) last point
         Extrapolation* get_extrapolation() {return extrapolation;};
@@ -32,6 +32,7 @@ cdef extern from "cubic_spline.h":
         double eval_right(double x)
         double deriv_left(double x)
         double deriv_right(double x)
+        bint has_tail()
 
     cdef cppclass CubicSpline:
         CubicSpline(double* y, double* dt, Extrapolation* extrapolation, rtransform.RTransform* rtf, int n)
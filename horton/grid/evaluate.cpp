@@ -24,16 +24,25 @@
 #include <cstdio>
 #endif
 
+#include <algorithm>
 #include <cmath>
 #include <stdexcept>
+#include <vector>
 #include "evaluate.h"
 
 
+// The number of points for which a spline is evaluated with one call.
+#define SPLINE_CHUNK 64
+// The number of points in the blocks that are processed in parallel.
+#define SPLINE_BLOCK 256
+
+
 void eval_spline_cube(CubicSpline* spline, double* center, double* output,
                       UniformGrid* ugrid) {
 
     // Find the ranges for the triple loop
     double rcut = spline->get_last_x();
+    bool tail = spline->get_extrapolation()->has_tail();
     long begin[3], end[3];
     ugrid->set_ranges_rcut(center, rcut, begin, end);
 
@@ -48,41 +57,147 @@ void eval_spline_cube(CubicSpline* spline, double* center, double* output,
         long cube_end[3];
         b3i.set_cube_ranges(b, cube_begin, cube_end);
 
-        // Run triple loop within one block (parallel)
+        // Run triple loop within one block (parallel). The spline is
+        // evaluated for chunks of points at once.
         Cube3Iterator c3i = Cube3Iterator(cube_begin, cube_end);
+        long npoint = c3i.get_npoint();
+        long nchunk = (npoint + SPLINE_CHUNK - 1)/SPLINE_CHUNK;
         #pragma omp parallel for
-        for (long ipoint=c3i.get_npoint()-1; ipoint>=0; ipoint--) {
-            long j[3];
-            long jwrap[3];
-            c3i.set_point(ipoint, jwrap);
-            b3i.translate(b, jwrap, j);
-
-            double d = ugrid->dist_grid_point(center, j);
-
-            // Evaluate spline if needed
-            if ((d < rcut) || spline->get_extrapolation()->has_tail()) {
-                double s;
-                spline->eval(&d, &s, 1);
-                *(ugrid->get_pointer(output, jwrap)) += s;
-            }
+        for (long ichunk=nchunk-1; ichunk>=0; ichunk--) {
+            double ds[SPLINE_CHUNK];
+            double ss[SPLINE_CHUNK];
+            double* ptrs[SPLINE_CHUNK];
+            int nselect = 0;
+            long ipoint_end = std::min((ichunk+1)*SPLINE_CHUNK, npoint);
+            for (long ipoint=ichunk*SPLINE_CHUNK; ipoint<ipoint_end; ipoint++) {
+                long j[3];
+                long jwrap[3];
+                c3i.set_point(ipoint, jwrap);
+                b3i.translate(b, jwrap, j);
+
+                double d = ugrid->dist_grid_point(center, j);
 
+                // Evaluate spline if needed
+                if ((d < rcut) || tail) {
+                    ds[nselect] = d;
+                    ptrs[nselect] = ugrid->get_pointer(output, jwrap);
+                    nselect++;
+                }
+            }
+            spline->eval(ds, ss, nselect);
+            for (int i=0; i<nselect; i++) {
+                *(ptrs[i]) += ss[i];
+            }
         }
     }
 }
 
-void eval_spline_grid(CubicSpline* spline, double* center, double* output,
-                      double* points, Cell* cell, long npoint) {
+void eval_spline_spans(CubicSpline* spline, double* center, double* output,
+                       UniformGrid* ugrid, long nspan, long* spans) {
+    // Same as eval_spline_cube, but only for the points in the spans. The
+    // output array is compact, see extend_spans.
     double rcut = spline->get_last_x();
+    bool tail = spline->get_extrapolation()->has_tail();
+    std::vector<long> offsets;
+    get_span_offsets(nspan, spans, offsets);
 
-    while (npoint > 0) {
-        // Find the ranges for the triple loop
+    #pragma omp parallel for schedule(dynamic)
+    for (long ispan=0; ispan < nspan; ispan++) {
+        long* span = spans + 4*ispan;
+        long j[3];
+        j[0] = span[0];
+        j[1] = span[1];
+        // The spline is evaluated for chunks of points at once.
+        for (long k_begin=span[2]; k_begin < span[3]; k_begin += SPLINE_CHUNK) {
+            double ds[SPLINE_CHUNK];
+            double ss[SPLINE_CHUNK];
+            double* ptrs[SPLINE_CHUNK];
+            int nselect = 0;
+            long k_end = std::min(k_begin + SPLINE_CHUNK, span[3]);
+            for (long k=k_begin; k < k_end; k++) {
+                j[2] = k;
+                double d = ugrid->dist_grid_point(center, j);
+                if ((d < rcut) || tail) {
+                    ds[nselect] = d;
+                    ptrs[nselect] = output + offsets[ispan] + (k - span[2]);
+                    nselect++;
+                }
+            }
+            spline->eval(ds, ss, nselect);
+            for (int i=0; i<nselect; i++) {
+                *(ptrs[i]) += ss[i];
+            }
+        }
+    }
+}
+
+static void add_splines_chunk(CubicSpline** splines, int nspline, double* ds,
+                              double* ts, long* indexes, int nselect,
+                              double* output, long npoint) {
+    // All splines have the same transformation, so the distances are
+    // transformed only once.
+    double first_x = splines[0]->get_first_x();
+    double last_x = splines[0]->get_last_x();
+    int n = splines[0]->n;
+    int js[SPLINE_CHUNK];
+    double us[SPLINE_CHUNK];
+    splines[0]->to_t(ds, ts, nselect);
+    for (int i=0; i<nselect; i++) {
+        // Outside the radial grid, t may be out of range or infinite, which
+        // can not be converted to an integer. The extrapolation is used there.
+        if ((ds[i] < first_x) || (ds[i] > last_x)) {
+            js[i] = 0;
+            us[i] = 0.0;
+            continue;
+        }
+        int j = (int)floor(ts[i]);
+        if (j==n - 1) j = n - 2;
+        js[i] = j;
+        us[i] = ts[i] - j;
+    }
+
+    for (int ispline=0; ispline<nspline; ispline++) {
+        CubicSpline* spline = splines[ispline];
+        Extrapolation* extrapolation = spline->get_extrapolation();
+        double* spline_output = output + ispline*npoint;
+        for (int i=0; i<nselect; i++) {
+            double d = ds[i];
+            double s;
+            if (d < first_x) {
+                s = extrapolation->eval_left(d);
+            } else if (d <= last_x) {
+                s = spline->eval_interval(js[i], us[i]);
+            } else {
+                s = extrapolation->eval_right(d);
+            }
+            spline_output[indexes[i]] += s;
+        }
+    }
+}
+
+
+static void eval_splines_block(CubicSpline** splines, int nspline, double* center,
+                               double* output, double* points, Cell* cell,
+                               long npoint, long begin, long end, bool tail) {
+    // Evaluate the splines for the points begin to end. The distances (also
+    // to periodic images) are collected in chunks.
+    double rcut = splines[0]->get_last_x();
+    double ds[SPLINE_CHUNK];
+    double ts[SPLINE_CHUNK];
+    long indexes[SPLINE_CHUNK];
+    int nselect = 0;
+
+    for (long ipoint=begin; ipoint<end; ipoint++) {
         double delta[3];
-        delta[0] = points[0] - center[0];
-        delta[1] = points[1] - center[1];
-        delta[2] = points[2] - center[2];
-        long ranges_begin[3], ranges_end[3];
-        cell->set_ranges_rcut(delta, rcut, ranges_begin, ranges_end);
+        delta[0] = points[3*ipoint] - center[0];
+        delta[1] = points[3*ipoint+1] - center[1];
+        delta[2] = points[3*ipoint+2] - center[2];
 
+        // Find the ranges for the triple loop
+        long ranges_begin[3], ranges_end[3];
+        if (cell->get_nvec() > 0) {
+            cell->set_ranges_rcut(delta, rcut, ranges_begin, ranges_end);
+        }
         for (int i=cell->get_nvec(); i < 3; i++) {
             ranges_begin[i] = 0;
             ranges_end[i] = 1;
@@ -103,28 +218,130 @@ void eval_spline_grid(CubicSpline* spline, double* center, double* output,
                     double z = cart[2] + delta[2];
                     double d = sqrt(x*x+y*y+z*z);
 
-                    // Evaluate spline if needed
-                    if ((d < rcut) || spline->get_extrapolation()->has_tail()) {
-                        double s;
-                        spline->eval(&d, &s, 1);
-#ifdef DEBUG
-                        printf("i=[%li,%li,%li] d=%f s=%f ||", i0, i1, i2, d, s);
-#endif
-                        *output += s;
+                    // Evaluate splines if needed
+                    if ((d < rcut) || tail) {
+                        ds[nselect] = d;
+                        indexes[nselect] = ipoint;
+                        nselect++;
+                        if (nselect == SPLINE_CHUNK) {
+                            add_splines_chunk(splines, nspline, ds, ts, indexes,
+                                              nselect, output, npoint);
+                            nselect = 0;
+                        }
                     }
-
                 }
             }
         }
+    }
+    add_splines_chunk(splines, nspline, ds, ts, indexes, nselect, output, npoint);
+}
+
+
+static void eval_splines_block_nlist(CubicSpline** splines, int nspline,
+                                     double* center, double* output,
+                                     double* points, Cell* cell,
+                                     const NeighborList* nlist, long npoint,
+                                     long begin, long end) {
+    // Evaluate the splines for the points begin to end. The periodic images of
+    // the center near the bounding sphere of the block are looked up once.
+    double rcut = splines[0]->get_last_x();
+    double ds[SPLINE_CHUNK];
+    double ts[SPLINE_CHUNK];
+    long indexes[SPLINE_CHUNK];
+    int nselect = 0;
 
-        // move on
-        points += 3;
-        output++;
-        npoint--;
+    // Bounding sphere of the block
+    double sphere_center[3] = {0.0, 0.0, 0.0};
+    for (long ipoint=begin; ipoint<end; ipoint++) {
+        sphere_center[0] += points[3*ipoint];
+        sphere_center[1] += points[3*ipoint+1];
+        sphere_center[2] += points[3*ipoint+2];
+    }
+    sphere_center[0] /= end - begin;
+    sphere_center[1] /= end - begin;
+    sphere_center[2] /= end - begin;
+    double radius = 0.0;
+    for (long ipoint=begin; ipoint<end; ipoint++) {
+        double x = points[3*ipoint] - sphere_center[0];
+        double y = points[3*ipoint+1] - sphere_center[1];
+        double z = points[3*ipoint+2] - sphere_center[2];
+        radius = std::max(radius, sqrt(x*x+y*y+z*z));
+    }
+    if (radius > rcut) {
+        // The points in the block are too far apart, e.g. when they are not
+        // sorted spatially. Look up the images for each point separately.
+        eval_splines_block(splines, nspline, center, output, points, cell,
+                           npoint, begin, end, false);
+        return;
     }
 
-#ifdef DEBUG
-    printf("\n");
-#endif
+    // Positions of the images that may be within rcut of a point in the block
+    std::vector<Neighbor> neighbors;
+    nlist->query(sphere_center, rcut + radius, neighbors);
+    long nimage = neighbors.size();
+    std::vector<double> images(3*nimage);
+    for (long iimage=0; iimage<nimage; iimage++) {
+        images[3*iimage] = sphere_center[0] - neighbors[iimage].delta[0];
+        images[3*iimage+1] = sphere_center[1] - neighbors[iimage].delta[1];
+        images[3*iimage+2] = sphere_center[2] - neighbors[iimage].delta[2];
+    }
+
+    for (long ipoint=begin; ipoint<end; ipoint++) {
+        for (long iimage=0; iimage<nimage; iimage++) {
+            double x = points[3*ipoint] - images[3*iimage];
+            double y = points[3*ipoint+1] - images[3*iimage+1];
+            double z = points[3*ipoint+2] - images[3*iimage+2];
+            double d = sqrt(x*x+y*y+z*z);
+            if (d < rcut) {
+                ds[nselect] = d;
+                indexes[nselect] = ipoint;
+                nselect++;
+                if (nselect == SPLINE_CHUNK) {
+                    add_splines_chunk(splines, nspline, ds, ts, indexes,
+                                      nselect, output, npoint);
+                    nselect = 0;
+                }
+            }
+        }
+    }
+    add_splines_chunk(splines, nspline, ds, ts, indexes, nselect, output, npoint);
+}
 
+
+void eval_spline_grid(CubicSpline* spline, double* center, double* output,
+                      double* points, Cell* cell, long npoint) {
+    eval_splines_grid(&spline, 1, center, output, points, cell, npoint);
+}
+
+
+void eval_splines_grid(CubicSpline** splines, int nspline, double* center,
+                       double* output, double* points, Cell* cell, long npoint) {
+    bool tail = false;
+    for (int ispline=0; ispline<nspline; ispline++) {
+        tail |= splines[ispline]->get_extrapolation()->has_tail();
+    }
+
+    // The points are divided in blocks that are processed in parallel. Each
+    // output value is computed by one thread, so the result does not depend
+    // on the number of threads.
+    long nblock = (npoint + SPLINE_BLOCK - 1)/SPLINE_BLOCK;
+    if ((cell->get_nvec() > 0) && !tail) {
+        // With periodic boundary conditions, the images of the center are
+        // found with a neighbor list, once per block instead of per point.
+        NeighborList nlist(cell, center, 1, splines[0]->get_last_x());
+        #pragma omp parallel for schedule(dynamic)
+        for (long iblock=0; iblock<nblock; iblock++) {
+            long end = std::min((iblock+1)*SPLINE_BLOCK, npoint);
+            eval_splines_block_nlist(splines, nspline, center, output, points,
+                                     cell, &nlist, npoint, iblock*SPLINE_BLOCK,
+                                     end);
+        }
+    } else {
+        #pragma omp parallel for schedule(dynamic)
+        for (long iblock=0; iblock<nblock; iblock++) {
+            long end = std::min((iblock+1)*SPLINE_BLOCK, npoint);
+            eval_splines_block(splines, nspline, center, output, points, cell,
+                               npoint, iblock*SPLINE_BLOCK, end, tail);
+        }
+    }
 }
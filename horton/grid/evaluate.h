@@ -32,7 +32,13 @@
 void eval_spline_cube(CubicSpline* spline, double* center, double* output,
                       UniformGrid* ugrid);
 
+void eval_spline_spans(CubicSpline* spline, double* center, double* output,
+                       UniformGrid* ugrid, long nspan, long* spans);
+
 void eval_spline_grid(CubicSpline* spline, double* center, double* output,
                       double* points, Cell* cell, long npoint);
 
+void eval_splines_grid(CubicSpline** splines, int nspline, double* center,
+                       double* output, double* points, Cell* cell, long npoint);
+
 #endif
@@ -24,10 +24,18 @@ cimport cell
 cimport cubic_spline
 cimport uniform
 
-cdef extern from "evaluate.h":
+cdef extern from "evaluate.h" nogil:
     void eval_spline_cube(cubic_spline.CubicSpline* spline, double* center,
                           double* output, uniform.UniformGrid* ugrid)
 
+    void eval_spline_spans(cubic_spline.CubicSpline* spline, double* center,
+                           double* output, uniform.UniformGrid* ugrid,
+                           long nspan, long* spans)
+
     void eval_spline_grid(cubic_spline.CubicSpline* spline, double* center,
                           double* output, double* points, cell.Cell* cell,
                           long npoint)
+
+    void eval_splines_grid(cubic_spline.CubicSpline** splines, int nspline,
+                           double* center, double* output, double* points,
+                           cell.Cell* cell, long npoint)
@@ -27,9 +27,10 @@ from __future__ import absolute_import
 
 import numpy as np
 
-from horton.grid.base import IntGrid
+from horton.checkpoint import load_hdf5_array
+from horton.grid.base import IntGrid, GridBlocks
 from horton.grid.atgrid import AtomicGrid, AtomicGridSpec
-from horton.grid.cext import becke_helper_atom
+from horton.grid.cext import becke_helper_molgrid, ssf_helper_molgrid
 from horton.log import log, timer
 from horton.periodic import periodic
 from horton.system import System
@@ -45,7 +46,7 @@ class BeckeMolGrid(IntGrid):
     '''Molecular integration grid using Becke weights'''
 
     @timer.with_section('Becke-Lebedev')
-    def __init__(self, system, agspec='medium', k=3, random_rotate=True, mode='discard'):
+    def __init__(self, system, agspec='medium', k=3, random_rotate=True, mode='discard', scheme='becke', seed=None, prune=None):
         '''
            **Arguments:**
 
@@ -79,32 +80,49 @@ class BeckeMolGrid(IntGrid):
                 * ``'only'`` means that only the subgrids are constructed and
                   that the computation of the molecular integration weights
                   (based on the Becke partitioning) is skipped.
-        '''
-        if isinstance(system, System):
-            self._centers = system.coordinates.copy()
-            self._numbers = system.numbers.copy()
-            self._pseudo_numbers = system.pseudo_numbers.copy()
-            natom = system.natom
-        else:
-            self._centers, self._numbers, self._pseudo_numbers = system
-            natom = len(self.centers)
-
-        # check if the mode argument is valid
-        if mode not in ['discard', 'keep', 'only']:
-            raise ValueError('The mode argument must be \'discard\', \'keep\' or \'only\'.')
-
-        # transform agspec into a usable format
-        if not isinstance(agspec, AtomicGridSpec):
-            agspec = AtomicGridSpec(agspec)
-        self._agspec = agspec
 
-        # assign attributes
-        self._k = k
-        self._random_rotate = random_rotate
-        self._mode = mode
+           scheme
+                The weighting scheme used to partition the molecular grid into
+                atomic contributions:
+
+                * ``'becke'`` (the default): Becke's smooth partitioning with
+                  switching functions of order k and size adjustments based on
+                  covalent radii.
+
+                * ``'ssf'``: the scheme of Stratmann, Scuseria and Frisch. The
+                  switching function has a compact support, such that the
+                  weights of most grid points are trivially zero or one. This
+                  makes the construction of grids for large molecules much
+                  cheaper. The arguments k and the covalent radii are not used.
+
+           seed
+                When given, the random rotations of the atomic grids are
+                generated with ``np.random.RandomState(seed)``, which makes the
+                molecular grid reproducible.
+
+           prune
+                When given, all points whose molecular integration weight is
+                smaller than this threshold (in absolute value) are removed
+                from the grid after the partitioning. The sum of the absolute
+                values of the removed weights is an upper bound for the
+                integration error of a function whose absolute value does not
+                exceed one (see the prune_error attribute). This can not be
+                combined with mode='only'.
+
+           When the grid is pruned with mode='keep', the atomic grids keep all
+           their points, in arrays that are no longer shared with the molecular
+           grid. The begin and end attributes of the atomic grids refer to the
+           points that remain in the molecular grid and the prune_indexes
+           attribute relates these points to the points of the atomic grids.
+        '''
+        natom = self._init_attrs(system, agspec, k, random_rotate, mode, scheme, seed, prune)
+        agspec = self._agspec
 
         # allocate memory for the grid
-        size = sum(agspec.get_size(self.numbers[i], self.pseudo_numbers[i]) for i in xrange(natom))
+        offsets = np.zeros(natom+1, int)
+        for i in xrange(natom):
+            offsets[i+1] = offsets[i] + agspec.get_size(self.numbers[i], self.pseudo_numbers[i])
+        size = offsets[natom]
         points = np.zeros((size, 3), float)
         weights = np.zeros(size, float)
         log.mem.announce(points.nbytes + weights.nbytes)
@@ -114,53 +132,186 @@ class BeckeMolGrid(IntGrid):
             atgrids = []
         else:
             atgrids = None
-        offset = 0
-
-        if mode != 'only':
-            # More recent covalent radii are used than in the original work of Becke.
-            cov_radii = np.array([periodic[n].cov_radius for n in self.numbers])
 
-        # The actual work:
+        # The actual work: the partitioning is computed for batches of atoms
+        # with one (parallel) call. The progress bar is updated after each batch.
         if log.do_medium:
             log('Preparing Becke-Lebedev molecular integration grid.')
         pb = log.progress(natom)
+        if seed is None:
+            rng = None
+        else:
+            rng = np.random.RandomState(seed)
+        nbatch = max(1, natom//20)
+        begin = 0
         for i in xrange(natom):
-            atsize = agspec.get_size(self.numbers[i], self.pseudo_numbers[i])
             atgrid = AtomicGrid(
                 self.numbers[i], self.pseudo_numbers[i],
                 self.centers[i], agspec, random_rotate,
-                points[offset:offset+atsize])
+                points[offsets[i]:offsets[i+1]], rng)
             if mode != 'only':
-                weights[offset:offset+atsize] = atgrid.weights
-                becke_helper_atom(
-                    points[offset:offset+atsize], weights[offset:offset+atsize],
-                    cov_radii, self.centers, i, self._k)
+                weights[offsets[i]:offsets[i+1]] = atgrid.weights
             if mode != 'discard':
                 atgrids.append(atgrid)
-            offset += atsize
-            pb()
+            if i - begin + 1 == nbatch or i == natom - 1:
+                if mode != 'only':
+                    self._compute_partition(points, weights, offsets, begin, i+1)
+                pb(i - begin + 1)
+                begin = i + 1
 
         # finish
+        if prune is not None:
+            points, weights = self._prune_arrays(points, weights)
         IntGrid.__init__(self, points, weights, atgrids)
+        if prune is not None:
+            self._init_pruned_subgrids()
 
         # Some screen info
         self._log_init()
 
+    def _init_attrs(self, system, agspec, k, random_rotate, mode, scheme, seed, prune):
+        '''Check and assign the attributes of the grid. Returns natom.'''
+        if isinstance(system, System):
+            self._centers = system.coordinates.copy()
+            self._numbers = system.numbers.copy()
+            self._pseudo_numbers = system.pseudo_numbers.copy()
+            natom = system.natom
+        else:
+            self._centers, self._numbers, self._pseudo_numbers = system
+            natom = len(self.centers)
+
+        # check if the mode argument is valid
+        if mode not in ['discard', 'keep', 'only']:
+            raise ValueError('The mode argument must be \'discard\', \'keep\' or \'only\'.')
+
+        # check if the scheme argument is valid
+        if scheme not in ['becke', 'ssf']:
+            raise ValueError('The scheme argument must be \'becke\' or \'ssf\'.')
+
+        # check if the prune argument is valid
+        if prune is not None:
+            if mode == 'only':
+                raise ValueError('A grid can not be pruned when mode==\'only\'.')
+            if prune <= 0:
+                raise ValueError('The prune threshold must be strictly positive.')
+
+        # transform agspec into a usable format
+        if not isinstance(agspec, AtomicGridSpec):
+            agspec = AtomicGridSpec(agspec)
+        self._agspec = agspec
+
+        # assign attributes
+        self._k = k
+        self._random_rotate = random_rotate
+        self._mode = mode
+        self._scheme = scheme
+        self._seed = seed
+        self._prune = prune
+        self._prune_indexes = None
+        self._prune_error = 0.0
+        # More recent covalent radii are used than in the original work of Becke.
+        self._cov_radii = np.array([periodic[n].cov_radius for n in self.numbers])
+        return natom
+
     def __del__(self):
         if log is not None and hasattr(self, 'weights'):
             log.mem.denounce(self.points.nbytes + self.weights.nbytes)
 
     @classmethod
     def from_hdf5(cls, grp, lf):
-        return BeckeMolGrid(
+        args = (
             (grp['centers'][:], grp['numbers'][:], grp['psuedo_numbers'][:]),
             AtomicGridSpec.from_hdf5(grp['agspec'], lf),
             grp['k'][()],
             grp['random_rotate'][()],
             grp.attrs['mode'],
+            grp.attrs.get('scheme', 'becke'),
+            grp.attrs.get('seed'),
+            grp.attrs.get('prune'),
         )
+        if 'points' in grp:
+            return cls._from_hdf5_arrays(grp, *args)
+        else:
+            return BeckeMolGrid(*args)
 
-    def to_hdf5(self, grp):
+    @classmethod
+    def _from_hdf5_arrays(cls, grp, *args):
+        '''Construct a grid with the points and weights stored in a HDF5 group'''
+        result = cls.__new__(cls)
+        natom = result._init_attrs(*args)
+        points = load_hdf5_array(grp['points'])
+        weights = load_hdf5_array(grp['weights'])
+        offsets = grp['offsets'][:]
+        log.mem.announce(points.nbytes + weights.nbytes)
+        if 'prune_indexes' in grp:
+            result._prune_indexes = grp['prune_indexes'][:]
+            result._prune_error = grp.attrs['prune_error']
+            # The atomic grids have their own array with all points.
+            atgrid_points = np.zeros((offsets[-1], 3), float)
+        else:
+            atgrid_points = points
+        if 'order' in grp:
+            order = grp['order'][:]
+        else:
+            order = None
+        if result.mode == 'discard':
+            atgrids = None
+        else:
+            if 'rotations' in grp:
+                rotations = grp['rotations'][:]
+            else:
+                rotations = None
+            atgrids = []
+            isphere = 0
+            for i in xrange(natom):
+                nsphere = len(result.agspec.get(result.numbers[i], result.pseudo_numbers[i])[1])
+                args = (result.numbers[i], result.pseudo_numbers[i],
+                        result.centers[i], result.agspec, result.random_rotate)
+                begin, end = offsets[i], offsets[i+1]
+                atrotations = None if rotations is None else rotations[isphere:isphere+nsphere]
+                if result._prune_indexes is None:
+                    # The subgrids are views on the stored points, which are
+                    # not written. (They may be a copy-on-write memmap.) When
+                    # the stored points are sorted in blocks, only the weights
+                    # of the subgrids are reordered in the same way.
+                    atgrids.append(AtomicGrid._from_points(
+                        *args, points=atgrid_points[begin:end], rotations=atrotations,
+                        order=None if order is None else order[begin:end] - begin))
+                else:
+                    # The points of the subgrids are not stored and are
+                    # reconstructed with the stored rotations. (The stored
+                    # prune_indexes already take into account the order.)
+                    atgrids.append(AtomicGrid(
+                        *args, points=atgrid_points[begin:end], rotations=atrotations))
+                isphere += nsphere
+        IntGrid.__init__(result, points, weights, atgrids)
+        if result._prune_indexes is not None:
+            result._init_pruned_subgrids()
+        if order is not None:
+            result._order = order
+            result._blocks = GridBlocks(points, result._get_block_ranges(), grp.attrs['block_size'])
+        result._log_init()
+        return result
+
+    def to_hdf5(self, grp, arrays=False):
+        '''Write the grid to a HDF5 group
+
+           **Arguments:**
+
+           grp
+                A HDF5 group.
+
+           **Optional arguments:**
+
+           arrays
+                When True, also the grid points, the weights and the offsets
+                of the atomic subgrids are written. (With subgrids, also the
+                rotation matrices of the spheres. With pruning, also the
+                prune_indexes.) from_hdf5 then loads this
+                grid instead of constructing a new one, which is much faster
+                and gives exactly the same grid. When the file is opened
+                read-only, the points and weights are memory-mapped.
+        '''
         grp.attrs['class'] = self.__class__.__name__
         grp['centers'] = self._centers
         grp['numbers'] = self._numbers
@@ -170,6 +321,23 @@ class BeckeMolGrid(IntGrid):
         grp['random_rotate'] = self._random_rotate
         grp['k'] = self._k
         grp.attrs['mode'] = self._mode
+        grp.attrs['scheme'] = self._scheme
+        if self._seed is not None:
+            grp.attrs['seed'] = self._seed
+        if self._prune is not None:
+            grp.attrs['prune'] = self._prune
+        if arrays:
+            grp['points'] = self.points
+            grp['weights'] = self.weights
+            grp['offsets'] = self._get_atgrid_offsets()
+            if self._prune_indexes is not None:
+                grp['prune_indexes'] = self._prune_indexes
+                grp.attrs['prune_error'] = self._prune_error
+            if self.subgrids is not None and self.subgrids[0].rotations is not None:
+                grp['rotations'] = np.concatenate([atgrid.rotations for atgrid in self.subgrids])
+            if self.order is not None:
+                grp['order'] = self.order
+                grp.attrs['block_size'] = self.blocks.size
 
     def _get_centers(self):
         '''The positions of the nuclei'''
@@ -213,23 +381,126 @@ class BeckeMolGrid(IntGrid):
 
     mode = property(_get_mode)
 
+    def _get_scheme(self):
+        '''The weighting scheme, \'becke\' or \'ssf\'.'''
+        return self._scheme
+
+    scheme = property(_get_scheme)
+
+    def _get_seed(self):
+        '''The seed for the random rotations, or None.'''
+        return self._seed
+
+    seed = property(_get_seed)
+
+    def _get_prune(self):
+        '''The threshold for the pruning of small weights, or None.'''
+        return self._prune
+
+    prune = property(_get_prune)
+
+    def _get_prune_error(self):
+        '''The sum of the absolute values of the weights removed by pruning.'''
+        return self._prune_error
+
+    prune_error = property(_get_prune_error)
+
+    def _get_prune_indexes(self):
+        '''The indexes of the remaining points in the concatenation of all atomic grids, or None.'''
+        return self._prune_indexes
+
+    prune_indexes = property(_get_prune_indexes)
+
+    def _get_atgrid_offsets(self):
+        '''The offsets of the atomic grids in the concatenation of all their points'''
+        natom = len(self._numbers)
+        offsets = np.zeros(natom+1, int)
+        for i in xrange(natom):
+            offsets[i+1] = offsets[i] + self.agspec.get_size(self._numbers[i], self._pseudo_numbers[i])
+        return offsets
+
+    def _prune_arrays(self, points, weights):
+        '''Return the points and weights whose weight exceeds the prune threshold'''
+        mask = abs(weights) >= self._prune
+        self._prune_indexes = mask.nonzero()[0]
+        self._prune_error = abs(weights[~mask]).sum()
+        log.mem.denounce(points.nbytes + weights.nbytes)
+        points = points[self._prune_indexes]
+        weights = weights[self._prune_indexes]
+        log.mem.announce(points.nbytes + weights.nbytes)
+        return points, weights
+
+    def _init_pruned_subgrids(self):
+        '''Let begin and end of the subgrids refer to the remaining points'''
+        if self.subgrids is None:
+            return
+        atgrid_offsets = self._get_atgrid_offsets()
+        iatoms = atgrid_offsets.searchsorted(self._prune_indexes, 'right') - 1
+        counts = np.bincount(iatoms, minlength=len(self.subgrids))
+        offset = 0
+        for atgrid, count in zip(self.subgrids, counts):
+            atgrid.begin = offset
+            offset += count
+            atgrid.end = offset
+
+    def _apply_order(self, order, permute_points=True):
+        if self._prune_indexes is None:
+            IntGrid._apply_order(self, order, permute_points)
+        else:
+            # The atomic grids are not sorted because they do not share
+            # points with the pruned molecular grid.
+            self._points[:] = self._points[order]
+            self._weights[:] = self._weights[order]
+            if self._order is None:
+                self._order = order.copy()
+            else:
+                self._order = self._order[order]
+            self._prune_indexes = self._prune_indexes[order]
+
+    def _compute_partition(self, points, weights, offsets, begin, end):
+        '''Multiply the weights of the subgrids of atoms begin to end with the partitioning'''
+        if self._scheme == 'becke':
+            becke_helper_molgrid(points, weights, self._cov_radii, self.centers,
+                                 offsets, self._k, begin, end)
+        else:
+            ssf_helper_molgrid(points, weights, self.centers, offsets, begin, end)
+
     def _log_init(self):
         if log.do_medium:
             log('Initialized: %s' % self)
-            log.deflist([
+            if self._scheme == 'becke':
+                switching = 'k=%i' % self._k
+            else:
+                switching = 'Stratmann-Scuseria-Frisch'
+            items = [
                 ('Size', self.size),
-                ('Switching function', 'k=%i' % self._k),
-            ])
+                ('Switching function', switching),
+            ]
+            if self._prune is not None:
+                items.extend([
+                    ('Prune threshold', '%.1e' % self._prune),
+                    ('Pruned points', self._get_atgrid_offsets()[-1] - self.size),
+                    ('Pruning error bound', '%.3e' % self._prune_error),
+                ])
+            log.deflist(items)
             log.blank()
         # Cite reference
         log.cite('becke1988_multicenter', 'the multicenter integration scheme used for the molecular integration grid')
-        log.cite('cordero2008', 'the covalent radii used for the Becke-Lebedev molecular integration grid')
+        if self._scheme == 'becke':
+            log.cite('cordero2008', 'the covalent radii used for the Becke-Lebedev molecular integration grid')
+        else:
+            log.cite('stratmann1996', 'the weighting scheme used for the molecular integration grid')
 
     def integrate(self, *args, **kwargs):
         if self.mode == 'only':
             raise NotImplementedError('When mode==\'only\', only the subgrids can be used for integration.')
         return IntGrid.integrate(self, *args, **kwargs)
 
+    def integrate_batch(self, batch, *args, **kwargs):
+        if self.mode == 'only':
+            raise NotImplementedError('When mode==\'only\', only the subgrids can be used for integration.')
+        return IntGrid.integrate_batch(self, batch, *args, **kwargs)
+
     def update_centers(self, system):
         if self.subgrids is None:
             raise RuntimeError('It is only possible to update the centers of a molecular grid when the subgrids are kept.')
@@ -237,17 +508,30 @@ class BeckeMolGrid(IntGrid):
             raise ValueError('The number of grid centers and the number of atoms does not match.')
         if (self.numbers != system.numbers).any() or (self.pseudo_numbers != system.pseudo_numbers).any():
             raise ValueError('The elements of the grid and the system do not match.')
-        offset = 0
-        # More recent covalent radii are used than in the original work of Becke.
+        offsets = np.zeros(system.natom+1, int)
         self.centers[:] = system.coordinates
-        cov_radii = np.array([periodic[n].cov_radius for n in self.numbers])
+        if self._prune_indexes is None:
+            points = self.points
+            weights = self.weights
+        else:
+            # The partitioning is computed for all points of the atomic grids.
+            # The same points are kept, such that the size of the grid does
+            # not change. The error bound is updated.
+            points = np.zeros((self._get_atgrid_offsets()[-1], 3), float)
+            weights = np.zeros(len(points), float)
         for i in xrange(system.natom):
             atgrid = self.subgrids[i]
-            atsize = atgrid.size
+            offsets[i+1] = offsets[i] + atgrid.size
             atgrid.update_center(self.centers[i])
-            self.weights[offset:offset+atsize] = atgrid.weights
-            becke_helper_atom(
-                self.points[offset:offset+atsize],
-                self.weights[offset:offset+atsize],
-                cov_radii, self.centers, i, self._k)
-            offset += atgrid.size
+            weights[offsets[i]:offsets[i+1]] = atgrid.weights
+            if self._prune_indexes is not None:
+                points[offsets[i]:offsets[i+1]] = atgrid.points
+        self._compute_partition(points, weights, offsets, 0, system.natom)
+        if self._prune_indexes is not None:
+            self.points[:] = points[self._prune_indexes]
+            self.weights[:] = weights[self._prune_indexes]
+            mask = np.ones(len(weights), bool)
+            mask[self._prune_indexes] = False
+            self._prune_error = abs(weights[mask]).sum()
+        if self.blocks is not None:
+            self._blocks = GridBlocks(self.points, self._get_block_ranges(), self.blocks.size)
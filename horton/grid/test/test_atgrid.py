@@ -24,7 +24,7 @@
 from __future__ import print_function
 from __future__ import division
 from __future__ import absolute_import
-import os, shutil, numpy as np, h5py as h5
+import os, gc, shutil, numpy as np, h5py as h5
 from nose.tools import assert_raises
 
 from horton.test.common import tmpdir
@@ -114,6 +114,41 @@ def test_agspec_local_file():
         assert (nlls == np.array([6, 6, 6, 6, 6, 6, 6, 6, 14, 14, 26, 38, 50, 86, 110, 110, 110, 110, 86, 50, 50, 14, 6, 6])).all()
 
 
+def test_agspec_memoized():
+    # Specifications with the same definition share their radial grids, also
+    # when loaded through a different name.
+    agspec1 = AtomicGridSpec('fine')
+    agspec2 = AtomicGridSpec('tv-13.7-5')
+    rgrid1, nlls1 = agspec1.get(8, 8)
+    rgrid2, nlls2 = agspec2.get(8, 8)
+    assert rgrid1 is rgrid2
+    assert (nlls1 == nlls2).all()
+    # ... but the nlls arrays can not be modified through another spec
+    assert nlls1 is not nlls2
+    # ... and they share the unrotated atomic grids
+    assert get_atomic_grid_template(agspec1, 8, 8)[0] is get_atomic_grid_template(agspec2, 8, 8)[0]
+    # The same for simple definitions
+    rgrid3 = AtomicGridSpec('exp:0.001:10.0:30:50').get(1, 1)[0]
+    assert AtomicGridSpec('exp:0.001:10.0:30:50').get(6, 6)[0] is rgrid3
+
+
+def test_agspec_local_file_modified():
+    with tmpdir('horton.grid.test.test_atgrid.test_agspec_local_file_modified') as dn:
+        fn = os.path.join(dn, 'mygrid.txt')
+        with open(fn, 'w') as f:
+            print('1', file=f)
+            print('ExpRTransform 0.001 10.0 8', file=f)
+            print('6 14 26 26 26 26 14 6', file=f)
+        os.utime(fn, (0, 0))
+        assert AtomicGridSpec(fn).get_size(1, 1) == 144
+        with open(fn, 'w') as f:
+            print('1', file=f)
+            print('ExpRTransform 0.001 10.0 8', file=f)
+            print('6 6 6 6 6 6 6 6', file=f)
+        os.utime(fn, (10, 10))
+        assert AtomicGridSpec(fn).get_size(1, 1) == 48
+
+
 def test_agspec_load_simple_names():
     nrads = [20, 24, 34, 41, 49, 59]
     for name in 'coarse', 'medium', 'fine', 'veryfine', 'ultrafine', 'insane':
@@ -254,6 +289,83 @@ def test_random_rotation():
         assert abs(np.dot(rotmat.T, rotmat) - np.identity(3)).max() < 1e-10
 
 
+def test_random_rotation_rng():
+    rotmat1 = get_random_rotation(np.random.RandomState(1))
+    rotmat2 = get_random_rotation(np.random.RandomState(1))
+    assert (rotmat1 == rotmat2).all()
+    assert abs(np.dot(rotmat1, rotmat1.T) - np.identity(3)).max() < 1e-10
+
+
+def test_random_rotations():
+    from horton.grid.atgrid import _get_random_rotations
+    rotmats = _get_random_rotations(20)
+    assert rotmats.shape == (20, 3, 3)
+    for rotmat in rotmats:
+        assert abs(np.dot(rotmat, rotmat.T) - np.identity(3)).max() < 1e-10
+        assert abs(np.linalg.det(rotmat) - 1.0) < 1e-10
+    rotmats1 = _get_random_rotations(20, np.random.RandomState(3))
+    rotmats2 = _get_random_rotations(20, np.random.RandomState(3))
+    assert (rotmats1 == rotmats2).all()
+
+
+def test_atomic_grid_template():
+    agspec = AtomicGridSpec('coarse')
+    points, av_weights, weights = get_atomic_grid_template(agspec, 8, 8)
+    assert get_atomic_grid_template(agspec, 8, 8)[0] is points
+    assert not points.flags.writeable
+    assert not weights.flags.writeable
+    assert len(points) == agspec.get_size(8, 8)
+
+    center = np.array([0.1, -0.3, 0.2])
+    ag = AtomicGrid(8, 8, center, agspec, random_rotate=False)
+    assert (ag.points == points + center).all()
+    assert (ag.weights == weights).all()
+    assert (ag.av_weights == av_weights).all()
+
+    # the grid may be modified without affecting the template
+    ag.weights[:] = 0.0
+    assert (get_atomic_grid_template(agspec, 8, 8)[2] == weights).all()
+    assert (weights != 0.0).any()
+
+
+def test_radial_grids_released():
+    from horton.grid.atgrid import _get_radial_grid, _radial_grids, \
+        _atomic_grid_templates
+    rtf_string = ExpRTransform(1.234e-4, 2.345e1, 17).to_string()
+    agspec = AtomicGridSpec((_get_radial_grid(rtf_string), 6))
+    assert agspec.get(1, 1)[0] is _get_radial_grid(rtf_string)
+    get_atomic_grid_template(agspec, 1, 1)
+    assert rtf_string in _radial_grids
+    ntemplate = len(_atomic_grid_templates)
+    # When the RadialGrid is no longer used, it is discarded together with its
+    # templates.
+    del agspec
+    gc.collect()
+    assert rtf_string not in _radial_grids
+    assert len(_atomic_grid_templates) == ntemplate - 1
+
+
+def test_atomic_grid_rng():
+    center = np.array([0.1, -0.3, 0.2])
+    agspec = AtomicGridSpec('coarse')
+    ag1 = AtomicGrid(8, 8, center, agspec, rng=np.random.RandomState(5))
+    ag2 = AtomicGrid(8, 8, center, agspec, rng=np.random.RandomState(5))
+    ag3 = AtomicGrid(8, 8, center, agspec, rng=np.random.RandomState(6))
+    assert (ag1.points == ag2.points).all()
+    assert abs(ag1.points - ag3.points).max() > 1e-3
+    assert (ag1.weights == ag3.weights).all()
+
+
+def test_atomic_grid_update_center():
+    center = np.array([0.1, -0.3, 0.2])
+    ag = AtomicGrid(8, 8, center.copy(), 'coarse')
+    points = ag.points.copy()
+    delta = np.array([0.5, 0.1, -1.0])
+    ag.update_center(center + delta)
+    # The random rotations are kept, i.e. the grid is only translated.
+    assert abs(ag.points - points - delta).max() < 1e-10
+
+
 def test_agspec_hdf5_coarse():
     agspec1 = AtomicGridSpec('coarse')
     with h5.File('horton.grid.test.test_atgrid.test_agspec_hdf5_coarse', driver='core', backing_store=False) as f:
@@ -25,6 +25,7 @@ from __future__ import print_function
 from __future__ import division
 from __future__ import absolute_import
 import numpy as np
+from nose.tools import assert_raises
 from horton import *
 from horton.grid.test.common import get_cosine_spline
 from horton.test.common import get_random_cell
@@ -83,6 +84,27 @@ def test_grid_integrate_segments():
     assert abs(ints[2] - grid.weights[7:].sum()) < 1e-10
 
 
+def test_grid_integrate_batch():
+    npoint = 10
+    segments = np.array([2, 5, 3])
+    grid = IntGrid(np.random.normal(0, 1, (npoint,3)), np.random.normal(0, 1, npoint))
+    pot = np.random.normal(0, 1, npoint)
+    batch = np.random.normal(0, 1, (4, npoint))
+
+    ints = grid.integrate_batch(batch, pot)
+    assert ints.shape == (4,)
+    for i in xrange(4):
+        assert abs(ints[i] - grid.integrate(batch[i], pot)) < 1e-10
+
+    ints = grid.integrate_batch(batch, pot, None, segments=segments)
+    assert ints.shape == (3, 4)
+    for i in xrange(4):
+        assert abs(ints[:,i] - grid.integrate(batch[i], pot, segments=segments)).max() < 1e-10
+
+    with assert_raises(TypeError):
+        grid.integrate_batch(batch, pot, center=np.zeros(3))
+
+
 def test_grid_integrate_cartesian_moments():
     npoint = 10
     grid = IntGrid(np.random.normal(0, 1, (npoint,3)), np.random.normal(0, 1, npoint))
@@ -223,6 +245,75 @@ def test_eval_spline_grid_simplest():
     assert abs(output1 - output2).max() < 1e-10
 
 
+def test_eval_spline_grid_nocell():
+    # The spline is evaluated in chunks without a periodic cell.
+    npoint = 1000
+    points = np.random.normal(0, 3.0, (npoint,3))
+    g = IntGrid(points, np.random.normal(0, 1.0, npoint))
+    center = np.array([0.1, -0.2, 0.3])
+    distances = np.sqrt(((points - center)**2).sum(axis=1))
+    rtf = ExpRTransform(1e-3, 5.0, 50)
+    r = rtf.get_radii()
+    for extrapolation in CuspExtrapolation(), PowerExtrapolation(-2):
+        cs = CubicSpline(np.exp(-r), rtransform=rtf, extrapolation=extrapolation)
+        output = np.zeros(npoint)
+        g.eval_spline(cs, center, output)
+        expected = cs(distances)
+        if not extrapolation.has_tail():
+            expected[distances > r[-1]] = 0.0
+        assert abs(output - expected).max() < 1e-15
+        assert (output[distances > r[-1]] != 0).any() == extrapolation.has_tail()
+
+
+def check_eval_splines_grid(cell):
+    npoint = 500
+    points = np.random.normal(0, 3.0, (npoint,3))
+    g = IntGrid(points, np.random.normal(0, 1.0, npoint))
+    center = np.array([0.1, -0.2, 0.3])
+    rtf = ExpRTransform(1e-3, 5.0, 50)
+    r = rtf.get_radii()
+    splines = [
+        CubicSpline(np.exp(-r), rtransform=rtf),
+        CubicSpline(np.exp(-2*r), rtransform=ExpRTransform(1e-3, 5.0, 50)),
+        CubicSpline(1/(1+r**2), rtransform=rtf, extrapolation=PowerExtrapolation(-2)),
+        CubicSpline(np.exp(-r**2), rtransform=rtf, extrapolation=ZeroExtrapolation()),
+    ]
+    output = np.zeros((len(splines), npoint))
+    g.eval_splines(splines, center, output, cell)
+    for i, spline in enumerate(splines):
+        expected = np.zeros(npoint)
+        g.eval_spline(spline, center, expected, cell)
+        assert abs(output[i] - expected).max() < 1e-14
+    return g, splines, center, output
+
+
+def test_eval_splines_grid_nocell():
+    g, splines, center, output = check_eval_splines_grid(None)
+    # also with blocks, without a tail
+    order = g.sort_blocks(32)
+    output2 = np.zeros((2, g.size))
+    g.eval_splines([splines[0], splines[3]], center, output2)
+    assert abs(output2 - output[[0,3]][:,order]).max() < 1e-14
+
+
+def test_eval_splines_grid_cell():
+    check_eval_splines_grid(get_random_cell(3.0, 3))
+    check_eval_splines_grid(get_random_cell(3.0, 1))
+
+
+def test_eval_splines_grid_rtransform_error():
+    rtf = ExpRTransform(1e-3, 5.0, 50)
+    r = rtf.get_radii()
+    splines = [
+        CubicSpline(np.exp(-r), rtransform=rtf),
+        CubicSpline(np.exp(-r), rtransform=ExpRTransform(1e-3, 6.0, 50)),
+    ]
+    points = np.random.normal(0, 3.0, (10, 3))
+    output = np.zeros((2, 10))
+    with assert_raises(ValueError):
+        eval_splines_grid(splines, np.zeros(3), output, points, Cell(None))
+
+
 def test_eval_spline_grid_3d_random():
     npoint = 10
     for i in xrange(10):
@@ -242,6 +333,29 @@ def test_eval_spline_grid_3d_random():
         assert abs(output1 - output2).max() < 1e-10
 
 
+def test_eval_spline_grid_periodic_blocks():
+    # Spatially sorted points, such that the periodic images are found once
+    # per block of points with a neighbor list.
+    from horton.grid.utils import get_morton_order
+    npoint = 20000
+    cs = get_cosine_spline()
+    for nvec in 1, 2, 3:
+        cell = get_random_cell(3.0, nvec)
+        points = np.random.uniform(0, 10, (npoint,3))
+        points = points[get_morton_order(points)]
+        center = np.random.uniform(0, 10, 3)
+        output1 = np.zeros(npoint)
+        eval_spline_grid(cs, center, output1, points, cell)
+
+        # In random order, the images are looked up for each point separately.
+        shuffle = np.random.permutation(npoint)
+        output2 = np.zeros(npoint)
+        eval_spline_grid(cs, center, output2, points[shuffle], cell)
+        output2[shuffle] = output2.copy()
+        assert abs(output2).max() > 1
+        assert abs(output1 - output2).max() < 1e-10
+
+
 def test_eval_spline_grid_2d_random():
     npoint = 10
     cs = get_cosine_spline()
@@ -324,3 +438,70 @@ def test_eval_spline_grid_add_random():
         g.eval_spline(cs, center2, output3, cell)
 
         assert abs(output1 + output2 - output3).max() < 1e-10
+
+
+def test_morton_order():
+    from horton.grid.utils import get_morton_order
+    points = np.random.uniform(-1, 1, (1000, 3))
+    order = get_morton_order(points)
+    assert (np.sort(order) == np.arange(1000)).all()
+    # Consecutive points are much closer than random pairs.
+    sorted_points = points[order]
+    d_sorted = np.sqrt(((sorted_points[1:] - sorted_points[:-1])**2).sum(axis=1)).mean()
+    d_random = np.sqrt(((points[1:] - points[:-1])**2).sum(axis=1)).mean()
+    assert d_sorted < 0.3*d_random
+    assert len(get_morton_order(np.zeros((0, 3)))) == 0
+    assert (get_morton_order(np.zeros((5, 3))) == np.arange(5)).all()
+
+
+def test_grid_sort_blocks():
+    npoint = 1000
+    points = np.random.uniform(-5, 5, (npoint, 3))
+    weights = np.random.uniform(0, 1, npoint)
+    grid = IntGrid(points.copy(), weights.copy())
+    assert grid.blocks is None
+    assert grid.order is None
+    order = grid.sort_blocks(64)
+    assert (grid.points == points[order]).all()
+    assert (grid.weights == weights[order]).all()
+    assert (grid.order == order).all()
+
+    blocks = grid.blocks
+    assert blocks.nblock == 16
+    assert blocks.offsets[0] == 0
+    assert blocks.offsets[-1] == npoint
+    for iblock in xrange(blocks.nblock):
+        begin, end = blocks.offsets[iblock], blocks.offsets[iblock+1]
+        assert end - begin <= 64
+        block_points = grid.points[begin:end]
+        assert (block_points >= blocks.lows[iblock]).all()
+        assert (block_points <= blocks.highs[iblock]).all()
+        distances = np.sqrt(((block_points - blocks.centers[iblock])**2).sum(axis=1))
+        assert abs(distances.max() - blocks.radii[iblock]) < 1e-10
+
+    # The ranges within a cutoff include all points within that cutoff.
+    center = np.array([1.0, 0.5, -2.0])
+    ranges = blocks.get_ranges(center, 2.0)
+    mask = np.zeros(npoint, bool)
+    for begin, end in ranges:
+        mask[begin:end] = True
+    distances = np.sqrt(((grid.points - center)**2).sum(axis=1))
+    assert mask[distances < 2.0].all()
+    assert mask.sum() < npoint
+    assert blocks.get_ranges(center + 100.0, 2.0) == []
+
+
+def test_grid_sort_blocks_eval_spline():
+    cs = get_cosine_spline()
+    npoint = 2000
+    points = np.random.uniform(-5, 5, (npoint, 3))
+    grid1 = IntGrid(points.copy(), np.ones(npoint))
+    grid2 = IntGrid(points.copy(), np.ones(npoint))
+    order = grid2.sort_blocks(32)
+    center = np.array([1.0, 0.5, -2.0])
+    output1 = np.zeros(npoint)
+    grid1.eval_spline(cs, center, output1)
+    output2 = np.zeros(npoint)
+    grid2.eval_spline(cs, center, output2)
+    assert (output1[order] == output2).all()
+    assert (output1 != 0).any()
@@ -65,6 +65,79 @@ def test_becke_sum3_one():
     assert abs(weights0+weights1+weights2 - 1).max() < 1e-10
 
 
+def test_becke_sum_many_one():
+    # Many atoms, such that most pairs are screened in becke_helper_atom
+    npoint = 200
+    natom = 40
+    centers = np.random.uniform(-8, 8, (natom, 3))
+    radii = np.random.uniform(0.5, 2.0, natom)
+    points = np.concatenate([
+        np.random.uniform(-10, 10, (npoint, 3)),
+        centers + np.random.normal(0, 0.1, (natom, 3)),
+    ])
+
+    total = np.zeros(len(points), float)
+    for iatom in xrange(natom):
+        weights = np.ones(len(points), float)
+        becke_helper_atom(points, weights, radii, centers, iatom, 3)
+        assert (weights >= 0).all()
+        assert (weights <= 1).all()
+        total += weights
+
+    assert abs(total - 1).max() < 1e-10
+
+
+def get_becke_weights_reference(points, radii, centers, select, order):
+    '''Straightforward implementation of Becke's weights, without screening'''
+    # Eq. (11) for all pairs of atoms
+    point_dists = np.sqrt(((points[:,None,:] - centers)**2).sum(axis=2))
+    atomic_dists = np.sqrt(((centers[:,None,:] - centers)**2).sum(axis=2))
+    np.fill_diagonal(atomic_dists, 1.0)
+    mu = (point_dists[:,:,None] - point_dists[:,None,:])/atomic_dists
+    # Eqs. (A2), (A3), (A5) and (A6), with a margin of 0.45 instead of 0.5
+    chi = (radii[:,None] - radii)/(radii[:,None] + radii)
+    alphas = np.clip(chi/(chi*chi-1), -0.45, 0.45)
+    s = mu + alphas*(1-mu*mu)
+    # Eqs. (18), (19) and (20)
+    for k in xrange(order):
+        s = 0.5*s*(3-s*s)
+    s = 0.5*(1-s)
+    # Eq. (13): products over all partners, excluding the atom itself
+    natom = len(centers)
+    s[:,np.arange(natom),np.arange(natom)] = 1.0
+    cells = s.prod(axis=2)
+    # Eq. (22)
+    return cells[:,select]/cells.sum(axis=1)
+
+
+def test_becke_reference_many():
+    # Compare with the unscreened formula for many atoms, such that most cell
+    # functions are neglected in becke_helper_atom.
+    npoint = 300
+    natom = 80
+    centers = np.random.uniform(-12, 12, (natom, 3))
+    radii = np.random.uniform(0.5, 2.0, natom)
+    points = np.concatenate([
+        np.random.uniform(-14, 14, (npoint, 3)),
+        centers + np.random.normal(0, 0.5, (natom, 3)),
+    ])
+    for iatom in xrange(0, natom, 7):
+        expected = get_becke_weights_reference(points, radii, centers, iatom, 3)
+        weights = np.ones(len(points), float)
+        becke_helper_atom(points, weights, radii, centers, iatom, 3)
+        assert abs(weights - expected).max() < 1e-10
+
+    # all atoms in one call to becke_helper_molgrid
+    offsets = np.arange(natom+1)*(len(points)//natom)
+    offsets[-1] = len(points)
+    weights = np.ones(len(points), float)
+    becke_helper_molgrid(points, weights, radii, centers, offsets, 3)
+    for iatom in xrange(natom):
+        begin, end = offsets[iatom], offsets[iatom+1]
+        expected = get_becke_weights_reference(points[begin:end], radii, centers, iatom, 3)
+        assert abs(weights[begin:end] - expected).max() < 1e-10
+
+
 def test_becke_special_points():
     radii = np.array([0.5, 0.8, 5.0])
     centers = np.array([[1.2, 2.3, 0.1], [-0.4, 0.0, -2.2], [2.2, -1.5, 0.0]])
@@ -86,3 +159,84 @@ def test_becke_special_points():
     assert abs(weights[0]) < 1e-10
     assert abs(weights[1]) < 1e-10
     assert abs(weights[2] - 1.0) < 1e-10
+
+
+def test_ssf_sum_one():
+    npoint = 200
+    natom = 10
+    centers = np.random.uniform(-3, 3, (natom, 3))
+    points = np.concatenate([
+        np.random.uniform(-5, 5, (npoint, 3)),
+        centers + np.random.normal(0, 0.1, (natom, 3)),
+    ])
+
+    total = np.zeros(len(points), float)
+    for iatom in xrange(natom):
+        weights = np.ones(len(points), float)
+        ssf_helper_atom(points, weights, centers, iatom)
+        assert (weights >= 0).all()
+        assert (weights <= 1).all()
+        total += weights
+
+    assert abs(total - 1).max() < 1e-10
+
+
+def test_ssf_special_points():
+    centers = np.array([[1.2, 2.3, 0.1], [-0.4, 0.0, -2.2], [2.2, -1.5, 0.0]])
+
+    for iatom in xrange(3):
+        weights = np.ones(3, float)
+        ssf_helper_atom(centers, weights, centers, iatom)
+        expected = np.zeros(3, float)
+        expected[iatom] = 1.0
+        assert (weights == expected).all()
+
+    # Points close to a nucleus get exactly the same weights in the
+    # partitioning of that nucleus. (The computation is skipped.)
+    points = centers[0] + np.random.normal(0, 0.1, (100, 3))
+    weights = np.random.uniform(0, 1, 100)
+    orig_weights = weights.copy()
+    ssf_helper_atom(points, weights, centers, 0)
+    assert (weights == orig_weights).all()
+
+
+def check_helper_molgrid(scheme):
+    natom = 6
+    centers = np.random.uniform(-3, 3, (natom, 3))
+    radii = np.random.uniform(0.5, 2.0, natom)
+    sizes = np.random.randint(50, 150, natom)
+    offsets = np.zeros(natom+1, int)
+    offsets[1:] = np.cumsum(sizes)
+    points = np.random.uniform(-5, 5, (offsets[-1], 3))
+    weights0 = np.random.uniform(0, 1, offsets[-1])
+
+    # reference: one atom at a time
+    weights1 = weights0.copy()
+    for iatom in xrange(natom):
+        begin, end = offsets[iatom], offsets[iatom+1]
+        if scheme == 'becke':
+            becke_helper_atom(points[begin:end], weights1[begin:end], radii, centers, iatom, 3)
+        else:
+            ssf_helper_atom(points[begin:end], weights1[begin:end], centers, iatom)
+
+    # all atoms in one call, and in two batches
+    weights2 = weights0.copy()
+    weights3 = weights0.copy()
+    if scheme == 'becke':
+        becke_helper_molgrid(points, weights2, radii, centers, offsets, 3)
+        becke_helper_molgrid(points, weights3, radii, centers, offsets, 3, 0, 2)
+        becke_helper_molgrid(points, weights3, radii, centers, offsets, 3, 2)
+    else:
+        ssf_helper_molgrid(points, weights2, centers, offsets)
+        ssf_helper_molgrid(points, weights3, centers, offsets, 0, 2)
+        ssf_helper_molgrid(points, weights3, centers, offsets, 2)
+    assert (weights1 == weights2).all()
+    assert (weights1 == weights3).all()
+
+
+def test_becke_helper_molgrid():
+    check_helper_molgrid('becke')
+
+
+def test_ssf_helper_molgrid():
+    check_helper_molgrid('ssf')
@@ -368,3 +368,31 @@ def test_power_extrapolation_string():
     ep = Extrapolation.from_string(PowerExtrapolation(5.1247953315476).to_string())
     assert isinstance(ep, PowerExtrapolation)
     assert ep.power == 5.1247953315476
+
+
+def check_rtransform_kernel(rtf):
+    # Compare the specialized evaluation kernel with a reference implementation
+    r = rtf.get_radii()
+    y = np.exp(-r)
+    cs = CubicSpline(y, rtransform=rtf)
+    x = np.random.uniform(r[0], r[-1], 1000)
+    x[:2] = r[0], r[-1]
+    t = rtf.inv(x)
+    j = np.floor(t).astype(int)
+    j[j == rtf.npoint - 1] = rtf.npoint - 2
+    u = t - j
+    z = y[j+1] - y[j]
+    d0 = cs.dt[j]
+    d1 = cs.dt[j+1]
+    expected = y[j] + u*(d0 + u*(3*z - 2*d0 - d1 + u*(-2*z + d0 + d1)))
+    assert abs(cs(x) - expected).max() < 1e-14
+    expected = (d0 + u*(6*z - 4*d0 - 2*d1 + u*(-6*z + 3*d0 + 3*d1)))/rtf.deriv(t)
+    assert abs(cs.deriv(x) - expected).max() < 1e-12
+
+
+def test_rtransform_kernels():
+    check_rtransform_kernel(IdentityRTransform(50))
+    check_rtransform_kernel(LinearRTransform(0.1, 10.0, 50))
+    check_rtransform_kernel(ExpRTransform(1e-3, 1e1, 50))
+    check_rtransform_kernel(ShiftedExpRTransform(0.1, 0.1, 10.0, 50))
+    check_rtransform_kernel(PowerRTransform(1e-3, 1e1, 50))
@@ -24,8 +24,10 @@
 from __future__ import print_function
 from __future__ import division
 from __future__ import absolute_import
-import numpy as np, h5py as h5
+import numpy as np, h5py as h5, os
+from nose.tools import assert_raises
 
+from horton.test.common import tmpdir
 from horton import *
 
 
@@ -77,6 +79,31 @@ def test_integrate_hydrogen_trimer_1s():
     assert abs(occupation - 3.0) < 1e-3
 
 
+def test_integrate_hydrogen_trimer_1s_ssf():
+    numbers = np.array([1, 1, 1], int)
+    coordinates = np.array([[0.0, 0.0, -0.5], [0.0, 0.0, 0.5], [0.0, 0.5, 0.0]], float)
+    sys = System(coordinates, numbers)
+    rtf = ExpRTransform(1e-3, 1e1, 100)
+    rgrid = RadialGrid(rtf)
+
+    mg = BeckeMolGrid(sys, (rgrid, 110), random_rotate=False, scheme='ssf')
+    assert mg.scheme == 'ssf'
+    dist0 = np.sqrt(((coordinates[0] - mg.points)**2).sum(axis=1))
+    dist1 = np.sqrt(((coordinates[1] - mg.points)**2).sum(axis=1))
+    dist2 = np.sqrt(((coordinates[2] - mg.points)**2).sum(axis=1))
+    fn = np.exp(-2*dist0)/np.pi + np.exp(-2*dist1)/np.pi + np.exp(-2*dist2)/np.pi
+    occupation = mg.integrate(fn)
+    assert abs(occupation - 3.0) < 1e-3
+
+
+def test_molgrid_scheme_error():
+    numbers = np.array([6, 8], int)
+    coordinates = np.array([[0.0, 0.2, -0.5], [0.1, 0.0, 0.5]], float)
+    sys = System(coordinates, numbers)
+    with assert_raises(ValueError):
+        BeckeMolGrid(sys, 'tv-13.7-3', scheme='foo')
+
+
 def test_molgrid_attrs_subgrid():
     numbers = np.array([6, 8], int)
     coordinates = np.array([[0.0, 0.2, -0.5], [0.1, 0.0, 0.5]], float)
@@ -221,3 +248,264 @@ def test_molgrid_hdf5():
     assert mg1.mode == mg2.mode
     assert (mg1.points == mg2.points).all()
     assert (mg1.weights == mg2.weights).all()
+
+
+def test_molgrid_seed():
+    numbers = np.array([6, 8], int)
+    coordinates = np.array([[0.0, 0.2, -0.5], [0.1, 0.0, 0.5]], float)
+    sys = System(coordinates, numbers)
+    mg1 = BeckeMolGrid(sys, 'tv-13.7-3', seed=1)
+    mg2 = BeckeMolGrid(sys, 'tv-13.7-3', seed=1)
+    mg3 = BeckeMolGrid(sys, 'tv-13.7-3', seed=2)
+    assert mg1.seed == 1
+    assert (mg1.points == mg2.points).all()
+    assert (mg1.weights == mg2.weights).all()
+    assert abs(mg1.points - mg3.points).max() > 1e-3
+
+    with h5.File('horton.grid.test.test_molgrid.test_molgrid_seed', driver='core', backing_store=False) as f:
+        mg1.to_hdf5(f)
+        mg4 = BeckeMolGrid.from_hdf5(f, None)
+    assert mg4.seed == 1
+    assert (mg1.points == mg4.points).all()
+    assert (mg1.weights == mg4.weights).all()
+
+
+def get_private_copies(fn):
+    '''Return the size (in kB) of the pages copied on write in all memory maps of a file'''
+    result = 0
+    fn = os.path.realpath(fn)
+    with open('/proc/self/smaps') as f:
+        current = False
+        for line in f:
+            words = line.split()
+            if '-' in words[0]:
+                current = words[-1] == fn
+            elif current and words[0] == 'Anonymous:':
+                result += int(words[1])
+    return result
+
+
+def check_molgrid_hdf5_arrays(mode, sort=False):
+    numbers = np.array([6, 8, 1], int)
+    coordinates = np.array([[0.0, 0.2, -0.5], [0.1, 0.0, 0.5], [1.0, 1.0, 1.0]], float)
+    sys = System(coordinates, numbers)
+    mg1 = BeckeMolGrid(sys, 'tv-13.7-3', mode=mode)
+    if sort:
+        mg1.sort_blocks()
+
+    with tmpdir('horton.grid.test.test_molgrid.check_molgrid_hdf5_arrays') as dn:
+        fn_h5 = '%s/grid.h5' % dn
+        with h5.File(fn_h5, 'w') as f:
+            mg1.to_hdf5(f, arrays=True)
+        with h5.File(fn_h5, 'r') as f:
+            mg2 = BeckeMolGrid.from_hdf5(f, None)
+        assert isinstance(mg2.points, np.memmap)
+        assert isinstance(mg2.weights, np.memmap)
+        assert mg2.mode == mode
+        assert (mg1.points == mg2.points).all()
+        assert (mg1.weights == mg2.weights).all()
+        if mode == 'discard':
+            assert mg2.subgrids is None
+        else:
+            assert len(mg2.subgrids) == 3
+            for atgrid1, atgrid2 in zip(mg1.subgrids, mg2.subgrids):
+                # The subgrids are views on the memory-mapped points.
+                assert np.may_share_memory(atgrid2.points, mg2.points)
+                assert (atgrid1.rotations == atgrid2.rotations).all()
+                assert (atgrid1.points == atgrid2.points).all()
+                assert (atgrid1.weights == atgrid2.weights).all()
+                assert (atgrid1.av_weights == atgrid2.av_weights).all()
+                if sort:
+                    assert (atgrid1.order == atgrid2.order).all()
+                else:
+                    assert atgrid2.order is None
+        check_smaps = os.path.isfile('/proc/self/smaps')
+        if check_smaps:
+            # Loading the grid did not write to the memory maps.
+            assert get_private_copies(fn_h5) == 0
+        # The file is not modified when the grid is changed.
+        mg2.weights[:] = 0.0
+        if check_smaps:
+            assert get_private_copies(fn_h5) > 0
+        with h5.File(fn_h5, 'r') as f:
+            assert (f['weights'][:] == mg1.weights).all()
+        del mg2
+
+
+def test_molgrid_hdf5_arrays_discard():
+    check_molgrid_hdf5_arrays('discard')
+
+
+def test_molgrid_hdf5_arrays_keep():
+    check_molgrid_hdf5_arrays('keep')
+
+
+def test_molgrid_hdf5_arrays_keep_sort():
+    check_molgrid_hdf5_arrays('keep', sort=True)
+
+
+def test_molgrid_hdf5_arrays_core():
+    # Without memory-mapping
+    numbers = np.array([6, 8], int)
+    coordinates = np.array([[0.0, 0.2, -0.5], [0.1, 0.0, 0.5]], float)
+    sys = System(coordinates, numbers)
+    mg1 = BeckeMolGrid(sys, 'tv-13.7-3')
+    with h5.File('horton.grid.test.test_molgrid.test_molgrid_hdf5_arrays_core', driver='core', backing_store=False) as f:
+        mg1.to_hdf5(f, arrays=True)
+        mg2 = BeckeMolGrid.from_hdf5(f, None)
+    assert not isinstance(mg2.points, np.memmap)
+    assert (mg1.points == mg2.points).all()
+    assert (mg1.weights == mg2.weights).all()
+
+
+def test_molgrid_hdf5_ssf():
+    numbers = np.array([6, 8], int)
+    coordinates = np.array([[0.0, 0.2, -0.5], [0.1, 0.0, 0.5]], float)
+    sys = System(coordinates, numbers)
+    mg1 = BeckeMolGrid(sys, 'tv-13.7-3', random_rotate=False, scheme='ssf')
+
+    with h5.File('horton.grid.test.test_molgrid.test_molgrid_hdf5_ssf', driver='core', backing_store=False) as f:
+        mg1.to_hdf5(f)
+        mg2 = BeckeMolGrid.from_hdf5(f, None)
+
+    assert mg2.scheme == 'ssf'
+    assert (mg1.weights == mg2.weights).all()
+
+
+def test_molgrid_sort_blocks():
+    numbers = np.array([6, 8, 1], int)
+    coordinates = np.array([[0.0, 0.2, -0.5], [0.1, 0.0, 0.5], [1.0, 1.0, 1.0]], float)
+    sys = System(coordinates, numbers)
+    mg1 = BeckeMolGrid(sys, 'tv-13.7-3', mode='keep', seed=1)
+    mg2 = BeckeMolGrid(sys, 'tv-13.7-3', mode='keep', seed=1)
+    order = mg2.sort_blocks()
+    assert (mg2.points == mg1.points[order]).all()
+    assert (mg2.weights == mg1.weights[order]).all()
+
+    dist0 = np.sqrt(((coordinates[0] - mg1.points)**2).sum(axis=1))
+    fn1 = np.exp(-2*dist0)
+    fn2 = fn1[order]
+    assert abs(mg1.integrate(fn1) - mg2.integrate(fn2)) < 1e-10
+
+    for atgrid1, atgrid2 in zip(mg1.subgrids, mg2.subgrids):
+        # the subgrids are sorted separately
+        assert (atgrid1.begin, atgrid1.end) == (atgrid2.begin, atgrid2.end)
+        assert (mg2.points[atgrid2.begin:atgrid2.end] == atgrid2.points).all()
+        suborder = order[atgrid1.begin:atgrid1.end] - atgrid1.begin
+        assert (atgrid2.order == suborder).all()
+        assert (atgrid2.weights == atgrid1.weights[suborder]).all()
+        # spherical averages still work
+        sub_fn1 = fn1[atgrid1.begin:atgrid1.end]
+        sub_fn2 = fn2[atgrid2.begin:atgrid2.end]
+        assert abs(atgrid1.get_spherical_average(sub_fn1) - atgrid2.get_spherical_average(sub_fn2)).max() < 1e-10
+
+    # moving the atoms preserves the order
+    coordinates = np.array([[0.3, 0.0, 0.1], [-0.1, -0.2, 0.3], [1.1, 1.0, 0.9]], float)
+    sys.update_coordinates(coordinates)
+    mg1.update_centers(sys)
+    mg2.update_centers(sys)
+    assert (mg2.points == mg1.points[order]).all()
+    assert abs(mg2.weights - mg1.weights[order]).max() < 1e-15
+
+    # reload from a checkpoint
+    with h5.File('horton.grid.test.test_molgrid.test_molgrid_sort_blocks', driver='core', backing_store=False) as f:
+        mg2.to_hdf5(f, arrays=True)
+        mg3 = BeckeMolGrid.from_hdf5(f, None)
+    assert (mg3.points == mg2.points).all()
+    assert (mg3.weights == mg2.weights).all()
+    assert (mg3.order == mg2.order).all()
+    assert (mg3.blocks.offsets == mg2.blocks.offsets).all()
+    for atgrid2, atgrid3 in zip(mg2.subgrids, mg3.subgrids):
+        assert (atgrid2.order == atgrid3.order).all()
+        assert (atgrid2.weights == atgrid3.weights).all()
+
+
+def check_molgrid_prune(mode):
+    numbers = np.array([6, 8, 1], int)
+    coordinates = np.array([[0.0, 0.2, -0.5], [0.1, 0.0, 0.5], [1.0, 1.0, 1.0]], float)
+    sys = System(coordinates, numbers)
+    mg1 = BeckeMolGrid(sys, 'tv-13.7-3', mode=mode, seed=1)
+    mg2 = BeckeMolGrid(sys, 'tv-13.7-3', mode=mode, seed=1, prune=1e-10)
+    assert mg1.prune is None
+    assert mg1.prune_indexes is None
+    assert mg1.prune_error == 0.0
+    assert mg2.prune == 1e-10
+    assert mg2.size < mg1.size
+    assert (abs(mg2.weights) >= 1e-10).all()
+    assert (mg2.points == mg1.points[mg2.prune_indexes]).all()
+    assert (mg2.weights == mg1.weights[mg2.prune_indexes]).all()
+    mask = np.ones(mg1.size, bool)
+    mask[mg2.prune_indexes] = False
+    assert abs(abs(mg1.weights[mask]).sum() - mg2.prune_error) < 1e-20
+    assert mg2.prune_error < 1e-10*mg1.size
+
+    # The error on an integral is bounded by prune_error
+    dist0 = np.sqrt(((coordinates[0] - mg1.points)**2).sum(axis=1))
+    fn = np.exp(-dist0)
+    assert abs(mg1.integrate(fn) - mg2.integrate(fn[mg2.prune_indexes])) <= mg2.prune_error
+
+    if mode == 'keep':
+        offsets = np.cumsum([0] + [atgrid.size for atgrid in mg1.subgrids])
+        for i, atgrid in enumerate(mg2.subgrids):
+            assert atgrid.size == mg1.subgrids[i].size
+            assert (atgrid.points == mg1.subgrids[i].points).all()
+            indexes = mg2.prune_indexes[atgrid.begin:atgrid.end] - offsets[i]
+            assert (indexes >= 0).all()
+            assert (indexes < atgrid.size).all()
+            assert (mg2.points[atgrid.begin:atgrid.end] == atgrid.points[indexes]).all()
+        assert mg2.subgrids[-1].end == mg2.size
+
+        # Moving the nuclei keeps the same points
+        coordinates = np.array([[0.3, 0.0, 0.1], [-0.1, -0.2, 0.3], [1.1, 1.0, 0.9]], float)
+        sys.update_coordinates(coordinates)
+        mg1.update_centers(sys)
+        mg2.update_centers(sys)
+        assert (mg2.points == mg1.points[mg2.prune_indexes]).all()
+        assert abs(mg2.weights - mg1.weights[mg2.prune_indexes]).max() < 1e-15
+        assert abs(abs(mg1.weights[mask]).sum() - mg2.prune_error) < 1e-12
+
+    # Sorting the pruned grid
+    order = mg2.sort_blocks()
+    assert (mg2.points == mg1.points[mg2.prune_indexes]).all()
+    assert (mg2.weights == mg1.weights[mg2.prune_indexes]).all()
+    if mode == 'keep':
+        for i, atgrid in enumerate(mg2.subgrids):
+            indexes = mg2.prune_indexes[atgrid.begin:atgrid.end] - offsets[i]
+            assert (mg2.points[atgrid.begin:atgrid.end] == atgrid.points[indexes]).all()
+
+    # Checkpoint with and without arrays
+    for arrays in False, True:
+        with h5.File('horton.grid.test.test_molgrid.check_molgrid_prune', driver='core', backing_store=False) as f:
+            mg2.to_hdf5(f, arrays=arrays)
+            mg3 = BeckeMolGrid.from_hdf5(f, None)
+        assert mg3.prune == 1e-10
+        if not arrays:
+            # a new grid is constructed for the current geometry
+            assert (abs(mg3.weights) >= 1e-10).all()
+        else:
+            assert (mg3.points == mg2.points).all()
+            assert (mg3.weights == mg2.weights).all()
+            assert (mg3.prune_indexes == mg2.prune_indexes).all()
+            assert mg3.prune_error == mg2.prune_error
+            if mode == 'keep':
+                for atgrid2, atgrid3 in zip(mg2.subgrids, mg3.subgrids):
+                    assert (atgrid2.begin, atgrid2.end) == (atgrid3.begin, atgrid3.end)
+                    assert (atgrid2.points == atgrid3.points).all()
+
+
+def test_molgrid_prune_discard():
+    check_molgrid_prune('discard')
+
+
+def test_molgrid_prune_keep():
+    check_molgrid_prune('keep')
+
+
+def test_molgrid_prune_error():
+    numbers = np.array([6, 8], int)
+    coordinates = np.array([[0.0, 0.2, -0.5], [0.1, 0.0, 0.5]], float)
+    sys = System(coordinates, numbers)
+    with assert_raises(ValueError):
+        BeckeMolGrid(sys, 'tv-13.7-3', mode='only', prune=1e-10)
+    with assert_raises(ValueError):
+        BeckeMolGrid(sys, 'tv-13.7-3', prune=0.0)
@@ -295,6 +295,62 @@ def test_weight_corrections():
     assert abs(ugrid.integrate(mol_dens)-14.0) > 5e-2
 
 
+def test_weight_corrections_cache():
+    ugrid = UniformGrid(np.zeros(3), np.identity(3)*0.2, np.array([40, 40, 40]), np.ones(3, int))
+    rtf = ExpRTransform(1e-3, 2e1, 100)
+    r = rtf.get_radii()
+    def get_spline():
+        return CubicSpline(np.exp(-2*r**2), -4*r*np.exp(-2*r**2), rtf)
+    # two equivalent centers, 20 grid points apart.
+    center0 = np.array([1.05, 1.13, 1.27])
+    center1 = center0 + np.array([4.0, 0.0, 0.0])
+    funcs = [(center0, [get_spline()]), (center1, [get_spline()])]
+    cache = {}
+    weights = ugrid.compute_weight_corrections(funcs, cache=cache)
+    assert sorted(key[0] for key in cache) == ['corrections', 'tapered']
+    assert (weights != 1.0).any()
+    assert (weights == np.roll(weights, 20, axis=0)).all()
+
+    # the reused corrections must match a direct computation
+    weights1 = ugrid.compute_weight_corrections(funcs[1:], rcut_max=1.8)
+    mask = weights1 != 1.0
+    assert abs(weights[mask] - weights1[mask]).max() < 1e-10
+
+    # the corrections must improve the integral
+    dens = ugrid.zeros()
+    ugrid.eval_spline(get_spline(), center0, dens)
+    ugrid.eval_spline(get_spline(), center1, dens)
+    exact = 2*(np.pi/2)**1.5
+    assert abs(ugrid.integrate(dens, weights) - exact) < abs(ugrid.integrate(dens) - exact)
+
+    # a second call reuses everything
+    nkey = len(cache)
+    weights2 = ugrid.compute_weight_corrections(funcs, cache=cache)
+    assert len(cache) == nkey
+    assert (weights2 == weights).all()
+
+
+def test_weight_corrections_cache_edge():
+    # Same as above, but the second center is close to a non-periodic edge of
+    # the grid, such that part of its cutoff sphere lies outside the grid.
+    ugrid = UniformGrid(np.zeros(3), np.identity(3)*0.2, np.array([40, 40, 40]), np.zeros(3, int))
+    rtf = ExpRTransform(1e-3, 2e1, 100)
+    r = rtf.get_radii()
+    def get_spline():
+        return CubicSpline(np.exp(-2*r**2), -4*r*np.exp(-2*r**2), rtf)
+    center0 = np.array([4.05, 4.13, 4.27])
+    center1 = center0 - np.array([4.0, 0.0, 0.0])
+    funcs = [(center0, [get_spline()]), (center1, [get_spline()])]
+    cache = {}
+    weights = ugrid.compute_weight_corrections(funcs, cache=cache)
+    assert sorted(key[0] for key in cache) == ['corrections', 'corrections', 'tapered']
+
+    # the corrections of the second center must match a direct computation
+    weights1 = ugrid.compute_weight_corrections(funcs[1:], rcut_max=1.8)
+    mask = weights1 != 1.0
+    assert abs(weights[mask] - weights1[mask]).max() < 1e-10
+
+
 def get_simple_test_uig():
     origin = np.array([0.1, -2.0, 3.1])
     rvecs = np.array([
@@ -471,6 +527,8 @@ def check_integrate_cartesian_moments(window, center, big):
     assert abs(ints[5] - window.integrate(big, x, y)) < 1e-10
     assert abs(ints[9] - window.integrate(big, z, z)) < 1e-10
     assert abs(ints).min() != 0
+    ints = window.integrate_batch([x, y, z], big)
+    assert abs(ints - [window.integrate(big, x), window.integrate(big, y), window.integrate(big, z)]).max() < 1e-10
 
 
 def check_integrate_pure_moments(window, center, big):
@@ -496,6 +554,12 @@ def check_integrate_radial_moments(window, center, big):
     assert abs(ints[2] - window.integrate(big, r, r)) < 1e-10
     assert abs(ints).min() != 0
 
+    # all types of moments in one pass
+    all_ints = window.integrate(big, center=center, lmax=2, mtype=[1, 2, 3])
+    assert len(all_ints) == 3
+    for mtype, mints in zip([1, 2, 3], all_ints):
+        assert abs(mints - window.integrate(big, center=center, lmax=2, mtype=mtype)).max() < 1e-10
+
 
 def get_random_spline(radius):
     # construct a random spline
@@ -726,6 +790,90 @@ def test_window0():
     check_window_wrap(window, center, radius)
 
 
+def check_sparse_window(ugrid, center, radius):
+    window = ugrid.get_window(center, radius)
+    sparse = ugrid.get_sparse_window(center, radius)
+    assert sparse.size < window.size
+    assert sparse.shape == (sparse.size,)
+
+    # all points within the radius must be included, and no others
+    x, y, z, r = helper_xyzr_window(window, center)
+    points = sparse.get_points()
+    assert points.shape == (sparse.size, 3)
+    assert (np.sqrt(((points - center)**2).sum(axis=1)) <= radius + 1e-10).all()
+    assert sparse.size == (r <= radius).sum()
+    assert abs(sparse.from_window(r) - np.sqrt(((points - center)**2).sum(axis=1))).max() < 1e-10
+
+    # test for extend
+    small = np.random.uniform(0, 1, ugrid.shape)
+    big = window.zeros()
+    window.extend(small, big)
+    compact = sparse.zeros()
+    sparse.extend(small, compact)
+    assert (compact == sparse.from_window(big)).all()
+
+    # test for eval_spline
+    spline = get_random_spline(radius)
+    local = window.zeros()
+    window.eval_spline(spline, center, local)
+    output = sparse.zeros()
+    sparse.eval_spline(spline, center, output)
+    assert abs(output).max() > 0
+    assert abs(output - sparse.from_window(local)).max() < 1e-10
+
+    # test for integrate, the spline is zero outside the sphere
+    assert abs(sparse.integrate(output, compact) - window.integrate(local, big)) < 1e-10
+    for mtype in 1, 2, 3:
+        moments1 = sparse.integrate(output, center=center, lmax=2, mtype=mtype)
+        moments2 = window.integrate(local, center=center, lmax=2, mtype=mtype)
+        assert abs(moments1 - moments2).max() < 1e-10
+    ints = sparse.integrate_batch([output, compact], output)
+    assert abs(ints[0] - window.integrate(local, local)) < 1e-10
+    assert abs(ints[1] - window.integrate(local, big)) < 1e-10
+
+    # test for wrap
+    cell1 = ugrid.zeros()
+    window.wrap(local, cell1)
+    cell2 = ugrid.zeros()
+    sparse.wrap(output, cell2)
+    assert abs(cell1).max() > 1e-10
+    assert abs(cell1 - cell2).max() < 1e-10
+
+
+def test_sparse_window3():
+    grid_rvecs = np.identity(3, float)*0.1
+    ugrid = UniformGrid(np.zeros(3), grid_rvecs, np.array([5, 10, 15]), np.array([1, 1, 1]))
+    check_sparse_window(ugrid, np.array([0.25, -0.0001, -0.8001]), 1.3)
+
+
+def test_sparse_window2():
+    grid_rvecs = np.identity(3, float)*0.1
+    ugrid = UniformGrid(np.array([-0.3, 0.22, 0.0]), grid_rvecs, np.array([5, 10, 15]), np.array([1, 1, 0]))
+    check_sparse_window(ugrid, np.array([0.25, 0.0, -0.8]), 1.4)
+
+
+def test_sparse_window_triclinic():
+    grid_rvecs = np.array([[0.1, 0.0, 0.0], [0.03, 0.12, 0.0], [-0.02, 0.04, 0.09]])
+    ugrid = UniformGrid(np.array([0.1, -0.2, 0.3]), grid_rvecs, np.array([12, 8, 10]), np.array([1, 0, 1]))
+    check_sparse_window(ugrid, np.array([0.5, 0.3, 0.2]), 1.1)
+
+
+def test_sparse_window_weight_corrections():
+    grid_rvecs = np.identity(3, float)*0.2
+    ugrid = UniformGrid(np.zeros(3), grid_rvecs, np.array([10, 10, 10]), np.array([1, 1, 1]))
+    center = np.array([0.9, 1.1, 1.0])
+    radius = 2.5
+    rtf = ExpRTransform(1e-3, radius, 100)
+    spline = CubicSpline(np.exp(-rtf.get_radii()), rtransform=rtf)
+    funcs = [(center, [spline])]
+    window = ugrid.get_window(center, radius)
+    sparse = ugrid.get_sparse_window(center, radius)
+    wcor1 = window.compute_weight_corrections(funcs)
+    wcor2 = sparse.compute_weight_corrections(funcs)
+    assert abs(wcor1 - 1).max() > 1e-3
+    assert (wcor2 == sparse.from_window(wcor1)).all()
+
+
 def test_block3iterator():
     b3i = Block3Iterator(np.array([0, 0, 0]), np.array([4, 6, 9]), np.array([4, 6, 9]))
     assert (b3i.block_begin == [0, 0, 0]).all()
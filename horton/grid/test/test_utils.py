@@ -24,6 +24,7 @@
 from __future__ import print_function
 from __future__ import division
 from __future__ import absolute_import
+import math
 from nose.tools import assert_raises
 import numpy as np
 from horton import *
@@ -41,3 +42,124 @@ def test_dot_multi():
 
     with assert_raises(AssertionError):
         dot_multi(np.arange(5.0), np.arange(10.0))
+
+
+def test_dot_multi_segments():
+    # segments of different sizes, also larger than the chunks of the kernel
+    segments = np.array([3, 0, 10000, 5, 20000])
+    a = np.random.uniform(0, 1, segments.sum())
+    b = np.random.uniform(0, 1, segments.sum())
+    result = dot_multi(a, b, segments=segments)
+    begin = 0
+    for i, size in enumerate(segments):
+        end = begin + size
+        assert abs(result[i] - np.dot(a[begin:end], b[begin:end])) < 1e-10
+        begin = end
+    with assert_raises(AssertionError):
+        dot_multi(a, b, segments=np.array([3, 5]))
+
+
+def test_dot_multi_compensated():
+    # Without compensation, all small terms are lost when they are added to
+    # the first term, giving an error of about 1e-11.
+    npoint = 100000
+    a = np.zeros(npoint) + 1e-16
+    a[0] = 1.0
+    b = np.ones(npoint)
+    expected = math.fsum(a)
+    assert abs(dot_multi(a, b) - expected) < 1e-15
+    assert abs(dot_multi_batch([a], [b]) - expected).max() < 1e-15
+
+
+def test_dot_multi_batch():
+    segments = np.array([3, 0, 10000, 5, 20000])
+    npoint = segments.sum()
+    a = np.random.uniform(0, 1, npoint)
+    b = np.random.uniform(0, 1, npoint)
+    batch = [np.random.uniform(0, 1, npoint) for i in xrange(4)]
+    result = dot_multi_batch([a, b], batch)
+    assert result.shape == (4,)
+    for i in xrange(4):
+        assert abs(result[i] - dot_multi(a, b, batch[i])) < 1e-10
+    result = dot_multi_batch([a, b], batch, segments=segments)
+    assert result.shape == (5, 4)
+    for i in xrange(4):
+        assert abs(result[:,i] - dot_multi(a, b, batch[i], segments=segments)).max() < 1e-10
+    with assert_raises(AssertionError):
+        dot_multi_batch([a, b], [np.ones(10)])
+
+
+def test_num_threads():
+    nthread = get_num_threads()
+    assert nthread >= 1
+    with assert_raises(ValueError):
+        set_num_threads(0)
+
+    npoint = 50000
+    a = np.random.uniform(-1, 1, npoint)
+    b = np.random.uniform(-1, 1, npoint)
+    points = np.random.normal(0, 3, (npoint, 3))
+    center = np.array([0.1, 0.2, 0.3])
+    segments = np.array([10000, 25000, 15000])
+    rtf = ExpRTransform(1e-3, 1e1, 100)
+    spline = CubicSpline(np.exp(-rtf.get_radii()), rtransform=rtf)
+    ugrid = UniformGrid(np.zeros(3), np.identity(3)*0.5, np.array([30, 40, 50]), np.zeros(3, int))
+    cube = np.random.uniform(-1, 1, ugrid.size)
+    try:
+        results = []
+        for n in 1, 2, 3:
+            set_num_threads(n)
+            assert get_num_threads() == n
+            output1 = np.zeros(npoint)
+            eval_spline_grid(spline, center, output1, points, Cell(None))
+            output2 = np.zeros(ugrid.shape)
+            eval_spline_cube(spline, center, output2, ugrid)
+            results.append([
+                dot_multi(a, b),
+                dot_multi(a, b, segments=segments),
+                dot_multi_batch([a], [b, a], segments=segments),
+                dot_multi_moments([a, b], points, center, 2, 1, segments),
+                dot_multi_moments_cube([cube], ugrid, center, 2, 2),
+                output1, output2,
+            ])
+        # The results must be exactly the same for any number of threads
+        for result in results[1:]:
+            for value0, value1 in zip(results[0], result):
+                assert (np.asarray(value0) == value1).all()
+    finally:
+        set_num_threads(nthread)
+
+
+def test_dot_multi_moments_multi():
+    npoint = 5000
+    a = np.random.uniform(-1, 1, npoint)
+    b = np.random.uniform(-1, 1, npoint)
+    points = np.random.normal(0, 3, (npoint, 3))
+    centers = np.random.normal(0, 1, (4, 3))
+    segments = np.array([1000, 2500, 1500])
+    for segs in None, segments:
+        results = dot_multi_moments([a, b], points, centers, 3, [1, 2, 3], segs)
+        assert len(results) == 3
+        for mtype, result in zip([1, 2, 3], results):
+            # single mtype, all centers
+            single = dot_multi_moments([a, b], points, centers, 3, mtype, segs)
+            assert abs(result - single).max() < 1e-10
+            for i in xrange(len(centers)):
+                # one mtype and one center at a time
+                expected = dot_multi_moments([a, b], points, centers[i], 3, mtype, segs)
+                assert abs(result[...,i,:] - expected).max() < 1e-10
+    with assert_raises(ValueError):
+        dot_multi_moments([a, b], points, centers, 3, [1, 4], None)
+
+
+def test_dot_multi_moments_cube_multi():
+    ugrid = UniformGrid(np.zeros(3), np.identity(3)*0.5, np.array([10, 12, 14]), np.zeros(3, int))
+    cube = np.random.uniform(-1, 1, ugrid.size)
+    centers = np.random.normal(2, 1, (3, 3))
+    results = dot_multi_moments_cube([cube], ugrid, centers, 2, [3, 1])
+    assert len(results) == 2
+    for mtype, result in zip([3, 1], results):
+        assert result.shape[0] == len(centers)
+        for i in xrange(len(centers)):
+            expected = dot_multi_moments_cube([cube], ugrid, centers[i], 2, mtype)
+            assert abs(result[i] - expected).max() < 1e-10
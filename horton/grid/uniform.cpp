@@ -27,6 +27,7 @@
 #include <stdexcept>
 #include <cmath>
 #include <cstdlib>
+#include <vector>
 #include "uniform.h"
 
 
@@ -125,8 +126,9 @@ UniformGridWindow::UniformGridWindow(UniformGrid* ugrid, long* _begin, long* _en
 
 void UniformGridWindow::extend(double* cell, double* local) {
     Range3Iterator r3i = Range3Iterator(begin, end, ugrid->shape);
-    long j[3], jwrap[3];
+    #pragma omp parallel for
     for (long ipoint=r3i.get_npoint()-1; ipoint >= 0; ipoint--) {
+        long j[3], jwrap[3];
         r3i.set_point(ipoint, j, jwrap);
 #ifdef DEBUG
         printf("ipoint=%li  j={%li, %li, %li}  jwrap={%li, %li, %li}\n", ipoint, j[0], j[1], j[2], jwrap[0], jwrap[1], jwrap[2]);
@@ -147,8 +149,9 @@ void UniformGridWindow::wrap(double* local, double* cell) {
         long cube_end[3];
         b3i.set_cube_ranges(b, cube_begin, cube_end);
 
-        // Run triple loop within one block
+        // Run triple loop within one block (parallel)
         Cube3Iterator c3i = Cube3Iterator(cube_begin, cube_end);
+        #pragma omp parallel for
         for (long ipoint=c3i.get_npoint()-1; ipoint>=0; ipoint--) {
             long j[3];
             long jwrap[3];
@@ -164,6 +167,52 @@ double* UniformGridWindow::get_pointer(double* array, long* i) {
 }
 
 
+void get_span_offsets(long nspan, long* spans, std::vector<long> &offsets) {
+    // The points of all spans are stored consecutively. offsets gets the
+    // position of the first point of each span and the total number of points.
+    offsets.resize(nspan+1);
+    offsets[0] = 0;
+    for (long ispan=0; ispan < nspan; ispan++) {
+        offsets[ispan+1] = offsets[ispan] + spans[4*ispan+3] - spans[4*ispan+2];
+    }
+}
+
+void extend_spans(UniformGrid* ugrid, long nspan, long* spans, double* cell, double* local) {
+    std::vector<long> offsets;
+    get_span_offsets(nspan, spans, offsets);
+    #pragma omp parallel for
+    for (long ispan=0; ispan < nspan; ispan++) {
+        long* span = spans + 4*ispan;
+        long jwrap[3];
+        jwrap[0] = index_wrap(span[0], ugrid->shape[0]);
+        jwrap[1] = index_wrap(span[1], ugrid->shape[1]);
+        double* output = local + offsets[ispan];
+        for (long k=span[2]; k < span[3]; k++) {
+            jwrap[2] = index_wrap(k, ugrid->shape[2]);
+            *output = *(ugrid->get_pointer(cell, jwrap));
+            output++;
+        }
+    }
+}
+
+void wrap_spans(UniformGrid* ugrid, long nspan, long* spans, double* local, double* cell) {
+    // Different spans may end up in the same row of the periodic array, so
+    // this loop is not parallel.
+    double* input = local;
+    for (long ispan=0; ispan < nspan; ispan++) {
+        long* span = spans + 4*ispan;
+        long jwrap[3];
+        jwrap[0] = index_wrap(span[0], ugrid->shape[0]);
+        jwrap[1] = index_wrap(span[1], ugrid->shape[1]);
+        for (long k=span[2]; k < span[3]; k++) {
+            jwrap[2] = index_wrap(k, ugrid->shape[2]);
+            *(ugrid->get_pointer(cell, jwrap)) += *input;
+            input++;
+        }
+    }
+}
+
+
 long index_wrap(long i, long high) {
     // Get around compiler weirdness
     long result = i%high;
@@ -22,6 +22,7 @@
 #ifndef HORTON_GRID_UNIFORM_H
 #define HORTON_GRID_UNIFORM_H
 
+#include <vector>
 #include "cell.h"
 #include "cubic_spline.h"
 
@@ -61,6 +62,14 @@ class UniformGridWindow {
 };
 
 
+// A span is a row of consecutive grid points, represented by four integers:
+// i0, i1, k_begin, k_end. These are indexes of the (unwrapped) grid, which
+// may fall outside the periodic cell. The points of a list of spans are
+// stored consecutively in a compact array.
+void get_span_offsets(long nspan, long* spans, std::vector<long> &offsets);
+void extend_spans(UniformGrid* ugrid, long nspan, long* spans, double* cell, double* local);
+void wrap_spans(UniformGrid* ugrid, long nspan, long* spans, double* local, double* cell);
+
 long index_wrap(long i, long high);
 
 
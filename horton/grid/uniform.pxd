@@ -22,7 +22,7 @@
 
 cimport cell
 
-cdef extern from "uniform.h":
+cdef extern from "uniform.h" nogil:
     cdef cppclass UniformGrid:
         double origin[3]
         double grid_rvecs[9]
@@ -47,6 +47,9 @@ cdef extern from "uniform.h":
         void extend(double* cell, double* local)
         void wrap(double* local, double* cell)
 
+    void extend_spans(UniformGrid* ugrid, long nspan, long* spans, double* cell, double* local)
+    void wrap_spans(UniformGrid* ugrid, long nspan, long* spans, double* local, double* cell)
+
     long index_wrap(long i, long high)
 
     cdef cppclass Block3Iterator:
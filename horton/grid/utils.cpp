@@ -25,17 +25,41 @@
 #include <cstdio>
 #endif
 
+#include <algorithm>
 #include <cmath>
 #include <stdexcept>
+#include <vector>
 #include "utils.h"
 #include "moments.h"
 
 
+// The number of points in the chunks of the parallel reductions.
+#define DOT_CHUNK 4096
+
+
 /*
     Internal functions
 */
 
 
+class KahanSum {
+    // Compensated summation. The rounding error of each addition is kept and
+    // added to the next term, such that the error of a long sum does not grow
+    // with the number of terms.
+    private:
+        double sum, compensation;
+    public:
+        KahanSum() : sum(0.0), compensation(0.0) {}
+        void add(double value) {
+            double y = value - compensation;
+            double t = sum + y;
+            compensation = (t - sum) - y;
+            sum = t;
+        }
+        double get() const {return sum;}
+};
+
+
 double data_product(long ipoint, long nvector, double** data) {
     double result = data[nvector-1][ipoint];
     for (long ivector=nvector-2; ivector>=0; ivector--)
@@ -44,11 +68,22 @@ double data_product(long ipoint, long nvector, double** data) {
 }
 
 
-void shift_segment(long ipoint, long* &segments, long &segment_end, double* &output, long increment) {
-    if (ipoint == segment_end) {
-        segments++;
-        segment_end += *segments;
-        output += increment;
+void make_chunks(long npoint, long* segments, std::vector<long> &chunks,
+                 std::vector<long> &chunk_segments) {
+    // Divide the points in chunks of at most DOT_CHUNK points that do not
+    // cross segment boundaries. chunks gets the begin of each chunk and the
+    // end of the last chunk. chunk_segments gets the segment of each chunk.
+    long begin = 0;
+    long isegment = 0;
+    chunks.push_back(0);
+    while (begin < npoint) {
+        long segment_end = begin + segments[isegment];
+        for (long chunk_begin=begin; chunk_begin < segment_end; chunk_begin += DOT_CHUNK) {
+            chunks.push_back(std::min(chunk_begin + DOT_CHUNK, segment_end));
+            chunk_segments.push_back(isegment);
+        }
+        begin = segment_end;
+        isegment++;
     }
 }
 
@@ -71,103 +106,220 @@ void fill_polynomials_wrapper(double* work, double* delta, long lmax, long mtype
 }
 
 
-/*
-    Public stuff
-*/
-
-
-void dot_multi(long npoint, long nvector, double** data, long* segments, double* output) {
-    long segment_end = *segments;
-    for (long ipoint=0; ipoint < npoint; ipoint++) {
-        // shift the output array if needed
-        shift_segment(ipoint, segments, segment_end, output, 1);
-
-        // add product to output
-        *output += data_product(ipoint, nvector, data);
-#ifdef DEBUG
-        printf("*output=%f; ipoint=%i; segment_end=%i\n", *output, ipoint, segment_end);
-#endif
+long get_nmoment(long lmax, long mtype) {
+    if (mtype==1) {
+        return ((lmax+1)*(lmax+2)*(lmax+3))/6;
+    } else if (mtype==2) {
+        return (lmax+1)*(lmax+1);
+    } else {
+        return lmax+1;
     }
 }
 
 
-void dot_multi_moments_cube(long nvector, double** data, UniformGrid* ugrid, double* center, long lmax, long mtype, double* output, long nmoment) {
-    if (ugrid->get_cell()->get_nvec() != 0) {
-        throw std::domain_error("dot_multi_moments_cube only works for non-periodic grids.");
-    }
+void check_moments_args(long lmax, long nmtype, long* mtypes) {
     if (lmax<0) {
         throw std::domain_error("lmax can not be negative.");
     }
-    if ((mtype < 1) || (mtype > 3)) {
-        throw std::domain_error("mtype should be 1, 2 or 3.");
+    for (long imtype=0; imtype < nmtype; imtype++) {
+        if ((mtypes[imtype] < 1) || (mtypes[imtype] > 3)) {
+            throw std::domain_error("mtype should be 1, 2 or 3.");
+        }
     }
+}
 
-    // reset the output to zero
 
-    Cube3Iterator c3i = Cube3Iterator(NULL, ugrid->shape);
-    for (long ipoint=c3i.get_npoint()-1; ipoint >= 0; ipoint--) {
-        // do the usual product of integranda
-        double term = data_product(ipoint, nvector, data);
+void add_moments(double term, double* delta, long lmax, long nmtype,
+                 long* mtypes, double* work, double* output) {
+    // Add the product of term and the polynomials of all mtypes to output. The
+    // same work array is used for all mtypes.
+    for (long imtype=0; imtype < nmtype; imtype++) {
         output[0] += term;
-
+        long nmoment = get_nmoment(lmax, mtypes[imtype]);
         if (lmax > 0) {
-            // construct relative vector
-            long j[3];
-            c3i.set_point(ipoint, j);
-            double delta[3];
-            delta[0] = center[0];
-            delta[1] = center[1];
-            delta[2] = center[2];
-            ugrid->delta_grid_point(delta, j);
-
-            // evaluate polynomials in work array
-            double work[nmoment-1];
-            fill_polynomials_wrapper(work, delta, lmax, mtype);
-
-            // add product of polynomial and integrand to output
+            fill_polynomials_wrapper(work, delta, lmax, mtypes[imtype]);
             for (long imoment=1; imoment < nmoment; imoment++) {
                 output[imoment] += term*work[imoment-1];
             }
         }
+        output += nmoment;
     }
 }
 
-void dot_multi_moments(long npoint, long nvector, double** data, double* points,
-    double* center, long lmax, long mtype, long* segments, double* output,
-    long nmoment) {
 
-    if (lmax<0) {
-        throw std::domain_error("lmax can not be negative.");
+/*
+    Public stuff
+*/
+
+
+void add_partial_sums(long nchunk, long nresult, std::vector<long> &chunk_segments,
+                      std::vector<double> &partial, double* output) {
+    // Add the partial sums of the chunks, in a fixed order and with
+    // compensated summation, to output. The consecutive chunks of a segment
+    // are added up before the result is added to output.
+    long ichunk = 0;
+    while (ichunk < nchunk) {
+        long isegment = chunk_segments[ichunk];
+        long ichunk_end = ichunk;
+        while ((ichunk_end < nchunk) && (chunk_segments[ichunk_end] == isegment)) {
+            ichunk_end++;
+        }
+        for (long iresult=0; iresult < nresult; iresult++) {
+            KahanSum sum;
+            for (long jchunk=ichunk; jchunk < ichunk_end; jchunk++) {
+                sum.add(partial[jchunk*nresult + iresult]);
+            }
+            output[isegment*nresult + iresult] += sum.get();
+        }
+        ichunk = ichunk_end;
     }
-    if ((mtype < 1) || (mtype > 3)) {
-        throw std::domain_error("mtype should be 1, 2 or 3.");
+}
+
+
+void dot_multi(long npoint, long nvector, double** data, long* segments, double* output) {
+    // The points are divided in chunks that do not cross segment boundaries.
+    // The partial sums of the chunks are computed in parallel and then added
+    // in a fixed order, such that the result does not depend on the number of
+    // threads. All sums are compensated.
+    std::vector<long> chunks;
+    std::vector<long> chunk_segments;
+    make_chunks(npoint, segments, chunks, chunk_segments);
+    long nchunk = chunk_segments.size();
+    std::vector<double> partial(nchunk);
+
+    #pragma omp parallel for schedule(static)
+    for (long ichunk=0; ichunk < nchunk; ichunk++) {
+        KahanSum sum;
+        for (long ipoint=chunks[ichunk]; ipoint < chunks[ichunk+1]; ipoint++) {
+            sum.add(data_product(ipoint, nvector, data));
+        }
+        partial[ichunk] = sum.get();
     }
 
-    long segment_end = *segments;
-    for (long ipoint=0; ipoint < npoint; ipoint++) {
-        // shift the output array if needed
-        shift_segment(ipoint, segments, segment_end, output, nmoment);
+    add_partial_sums(nchunk, 1, chunk_segments, partial, output);
+}
 
-        // do the usual product of integranda
-        double term = data_product(ipoint, nvector, data);
 
-        output[0] += term;
+void dot_multi_batch(long npoint, long nvector, double** data, long nbatch,
+                     double** batch, long* segments, double* output) {
+    // Same as dot_multi, but for each vector in batch, the sum of the product
+    // of data and that vector is computed. The product of data is computed
+    // only once for each point.
+    std::vector<long> chunks;
+    std::vector<long> chunk_segments;
+    make_chunks(npoint, segments, chunks, chunk_segments);
+    long nchunk = chunk_segments.size();
+    std::vector<double> partial(nchunk*nbatch);
+
+    #pragma omp parallel for schedule(static)
+    for (long ichunk=0; ichunk < nchunk; ichunk++) {
+        long begin = chunks[ichunk];
+        long end = chunks[ichunk+1];
+        std::vector<double> terms(end - begin);
+        for (long ipoint=begin; ipoint < end; ipoint++) {
+            terms[ipoint-begin] = data_product(ipoint, nvector, data);
+        }
+        for (long ibatch=0; ibatch < nbatch; ibatch++) {
+            double* vector = batch[ibatch];
+            KahanSum sum;
+            for (long ipoint=begin; ipoint < end; ipoint++) {
+                sum.add(terms[ipoint-begin]*vector[ipoint]);
+            }
+            partial[ichunk*nbatch + ibatch] = sum.get();
+        }
+    }
 
-        if (lmax > 0) {
-            // construct relative vector
-            double delta[3];
-            delta[0] = points[ipoint*3  ] - center[0];
-            delta[1] = points[ipoint*3+1] - center[1];
-            delta[2] = points[ipoint*3+2] - center[2];
+    add_partial_sums(nchunk, nbatch, chunk_segments, partial, output);
+}
 
-            // evaluate polynomials in work array
-            double work[nmoment-1];
-            fill_polynomials_wrapper(work, delta, lmax, mtype);
 
-            // add product of polynomial and integrand to output
-            for (long imoment=1; imoment < nmoment; imoment++) {
-                output[imoment] += term*work[imoment-1];
+void dot_multi_moments_cube(long nvector, double** data, UniformGrid* ugrid,
+    long ncenter, double* centers, long lmax, long nmtype, long* mtypes,
+    double* output, long nmoment) {
+    if (ugrid->get_cell()->get_nvec() != 0) {
+        throw std::domain_error("dot_multi_moments_cube only works for non-periodic grids.");
+    }
+    check_moments_args(lmax, nmtype, mtypes);
+
+    // Partial sums of chunks of points are computed in parallel, see dot_multi.
+    Cube3Iterator c3i = Cube3Iterator(NULL, ugrid->shape);
+    long npoint = c3i.get_npoint();
+    long nchunk = (npoint + DOT_CHUNK - 1)/DOT_CHUNK;
+    long nresult = ncenter*nmoment;
+    std::vector<double> partial(nchunk*nresult, 0.0);
+
+    #pragma omp parallel for schedule(static)
+    for (long ichunk=0; ichunk < nchunk; ichunk++) {
+        double* chunk_output = &partial[ichunk*nresult];
+        double work[nmoment];
+        long ipoint_end = std::min((ichunk+1)*DOT_CHUNK, npoint);
+        for (long ipoint=ichunk*DOT_CHUNK; ipoint < ipoint_end; ipoint++) {
+            // do the usual product of integranda
+            double term = data_product(ipoint, nvector, data);
+
+            long j[3];
+            c3i.set_point(ipoint, j);
+            for (long icenter=0; icenter < ncenter; icenter++) {
+                // construct relative vector
+                double delta[3];
+                delta[0] = centers[3*icenter];
+                delta[1] = centers[3*icenter+1];
+                delta[2] = centers[3*icenter+2];
+                ugrid->delta_grid_point(delta, j);
+
+                // add product of polynomials and integrand to output
+                add_moments(term, delta, lmax, nmtype, mtypes, work,
+                            chunk_output + icenter*nmoment);
+            }
+        }
+    }
+
+    for (long ichunk=0; ichunk < nchunk; ichunk++) {
+        for (long iresult=0; iresult < nresult; iresult++) {
+            output[iresult] += partial[ichunk*nresult + iresult];
+        }
+    }
+}
+
+void dot_multi_moments(long npoint, long nvector, double** data, double* points,
+    long ncenter, double* centers, long lmax, long nmtype, long* mtypes,
+    long* segments, double* output, long nmoment) {
+    check_moments_args(lmax, nmtype, mtypes);
+
+    // Partial sums of chunks of points are computed in parallel, see dot_multi.
+    std::vector<long> chunks;
+    std::vector<long> chunk_segments;
+    make_chunks(npoint, segments, chunks, chunk_segments);
+    long nchunk = chunk_segments.size();
+    long nresult = ncenter*nmoment;
+    std::vector<double> partial(nchunk*nresult, 0.0);
+
+    #pragma omp parallel for schedule(static)
+    for (long ichunk=0; ichunk < nchunk; ichunk++) {
+        double* chunk_output = &partial[ichunk*nresult];
+        double work[nmoment];
+        for (long ipoint=chunks[ichunk]; ipoint < chunks[ichunk+1]; ipoint++) {
+            // do the usual product of integranda
+            double term = data_product(ipoint, nvector, data);
+
+            for (long icenter=0; icenter < ncenter; icenter++) {
+                // construct relative vector
+                double delta[3];
+                delta[0] = points[ipoint*3  ] - centers[3*icenter];
+                delta[1] = points[ipoint*3+1] - centers[3*icenter+1];
+                delta[2] = points[ipoint*3+2] - centers[3*icenter+2];
+
+                // add product of polynomials and integrand to output
+                add_moments(term, delta, lmax, nmtype, mtypes, work,
+                            chunk_output + icenter*nmoment);
             }
         }
     }
+
+    for (long ichunk=0; ichunk < nchunk; ichunk++) {
+        double* segment_output = output + chunk_segments[ichunk]*nresult;
+        for (long iresult=0; iresult < nresult; iresult++) {
+            segment_output[iresult] += partial[ichunk*nresult + iresult];
+        }
+    }
 }
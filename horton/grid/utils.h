@@ -25,10 +25,13 @@
 
 void dot_multi(long npoint, long nvector, double** data, long* segments,
     double* output);
+void dot_multi_batch(long npoint, long nvector, double** data, long nbatch,
+    double** batch, long* segments, double* output);
 void dot_multi_moments_cube(long nvector, double** data, UniformGrid* ugrid,
-    double* center, long lmax, long mtype, double* output, long nmoment);
+    long ncenter, double* centers, long lmax, long nmtype, long* mtypes,
+    double* output, long nmoment);
 void dot_multi_moments(long npoint, long nvector, double** data, double* points,
-    double* center, long lmax, long mtype, long* segments, double* output,
-    long nmoment);
+    long ncenter, double* centers, long lmax, long nmtype, long* mtypes,
+    long* segments, double* output, long nmoment);
 
 #endif
@@ -21,11 +21,14 @@
 
 cimport uniform
 
-cdef extern from "utils.h":
+cdef extern from "utils.h" nogil:
     void dot_multi(long npoint, long nvector, double** data, long* segments,
         double* output)
+    void dot_multi_batch(long npoint, long nvector, double** data, long nbatch,
+        double** batch, long* segments, double* output)
     void dot_multi_moments_cube(long nvector, double** data, uniform.UniformGrid* ugrid,
-        double* center, long lmax, long mtype, double* output, long nmoment) except +
+        long ncenter, double* centers, long lmax, long nmtype, long* mtypes,
+        double* output, long nmoment) except +
     void dot_multi_moments(long npoint, long nvector, double** data, double* points,
-        double* center, long lmax, long mtype, long* segments, double* output,
-        long nmoment) except +
+        long ncenter, double* centers, long lmax, long nmtype, long* mtypes,
+        long* segments, double* output, long nmoment) except +
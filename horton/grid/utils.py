@@ -24,7 +24,10 @@ from __future__ import division
 from __future__ import absolute_import
 
 
-__all__ = ['parse_args_integrate']
+import numpy as np
+
+
+__all__ = ['parse_args_integrate', 'get_morton_order']
 
 
 def parse_args_integrate(*args, **kwargs):
@@ -41,7 +44,11 @@ def parse_args_integrate(*args, **kwargs):
 
        center=None
             When given, multipole moments are computed with respect to
-            this center instead of a plain integral.
+            this center instead of a plain integral. An array with shape
+            (ncenter, 3) computes the moments with respect to all centers
+            in one pass over the grid. An additional index for the
+            centers is then added to the result, just before the index of
+            the moments.
 
        lmax=0
             The maximum angular momentum to consider when computing multipole
@@ -49,7 +56,9 @@ def parse_args_integrate(*args, **kwargs):
 
        mtype=1
             The type of multipole moments: 1=``cartesian``, 2=``pure``,
-            3=``radial``.
+            3=``radial``. When a list of types is given, all of them are
+            computed in one pass over the grid and a list of results is
+            returned, one for each type.
 
        segments=None
             This argument can be used to divide the grid in segments. When
@@ -90,3 +99,36 @@ def parse_args_integrate(*args, **kwargs):
         if len(kwargs) > 0:
             raise TypeError('Unexpected keyword argument: %s' % kwargs.popitem()[0])
         return args, (center, lmax, mtype), segments
+
+
+def _spread_bits(x):
+    '''Insert two zero bits before each of the 21 lowest bits of x'''
+    x = (x | (x << np.uint64(32))) & np.uint64(0x1f00000000ffff)
+    x = (x | (x << np.uint64(16))) & np.uint64(0x1f0000ff0000ff)
+    x = (x | (x << np.uint64(8))) & np.uint64(0x100f00f00f00f00f)
+    x = (x | (x << np.uint64(4))) & np.uint64(0x10c30c30c30c30c3)
+    x = (x | (x << np.uint64(2))) & np.uint64(0x1249249249249249)
+    return x
+
+
+def get_morton_order(points):
+    '''Return the permutation that sorts points along a Morton (Z-order) curve
+
+       **Arguments:**
+
+       points
+            An array with shape (npoint, 3).
+
+       The coordinates are discretized with 21 bits in the bounding box of all
+       points. Points that are close in space are usually close on the curve.
+    '''
+    if len(points) == 0:
+        return np.zeros(0, int)
+    low = points.min(axis=0)
+    span = (points.max(axis=0) - low).max()
+    if span == 0:
+        return np.arange(len(points))
+    q = ((points - low)*((2**21 - 1)/span)).astype(np.uint64)
+    keys = _spread_bits(q[:,0]) | (_spread_bits(q[:,1]) << np.uint64(1)) | \
+           (_spread_bits(q[:,2]) << np.uint64(2))
+    return keys.argsort(kind='mergesort')
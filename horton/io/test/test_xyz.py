@@ -60,3 +60,21 @@ def test_load_dump_consistency():
     assert sys0.natom == sys1.natom
     assert (sys0.numbers == sys1.numbers).all()
     assert abs(sys0.coordinates - sys1.coordinates).max() < 1e-5
+
+
+def test_iter_geoms_xyz():
+    fn = context.get_fn('test/water_element.xyz')
+    with open(fn) as f:
+        lines = f.readlines()
+    with tmpdir('horton.io.test.test_xyz.test_iter_geoms_xyz') as dn:
+        fn_traj = '%s/traj.xyz' % dn
+        with open(fn_traj, 'w') as f:
+            for i in xrange(3):
+                f.write(''.join(lines))
+            f.write('\n')
+        geoms = list(iter_geoms_xyz(fn_traj))
+    ref = load_geom_xyz(fn)
+    assert len(geoms) == 3
+    for geom in geoms:
+        assert (geom['numbers'] == ref['numbers']).all()
+        assert (geom['coordinates'] == ref['coordinates']).all()
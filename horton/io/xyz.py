@@ -30,7 +30,7 @@ from horton.units import angstrom
 from horton.periodic import periodic
 
 
-__all__ = ['load_geom_xyz']
+__all__ = ['load_geom_xyz', 'iter_geoms_xyz']
 
 
 def load_geom_xyz(filename):
@@ -44,8 +44,34 @@ def load_geom_xyz(filename):
        **Returns:** two arrays, coordinates and numbers that can be used as the
        two first arguments of the System constructor.
     '''
-    f = file(filename)
-    size = int(next(f))
+    with open(filename) as f:
+        return _load_frame_xyz(f)
+
+
+def iter_geoms_xyz(filename):
+    '''Iterate over all geometries in a (multi-frame) .xyz file.
+
+       **Argument:**
+
+       filename
+            The file to load the geometries from
+
+       **Yields:** a dictionary with coordinates and numbers for every frame,
+       just like ``load_geom_xyz``. The file is read one frame at a time.
+    '''
+    with open(filename) as f:
+        while True:
+            line = next(f, '').strip()
+            if len(line) == 0:
+                # End of file or trailing blank line
+                return
+            yield _load_frame_xyz(f, int(line))
+
+
+def _load_frame_xyz(f, size=None):
+    '''Load one frame from an open .xyz file'''
+    if size is None:
+        size = int(next(f))
     next(f)
     coordinates = np.empty((size, 3), float)
     numbers = np.empty(size, int)
@@ -55,7 +81,6 @@ def load_geom_xyz(filename):
         coordinates[i,0] = float(words[1])*angstrom
         coordinates[i,1] = float(words[2])*angstrom
         coordinates[i,2] = float(words[3])*angstrom
-    f.close()
     return {
         'coordinates': coordinates,
         'numbers': numbers
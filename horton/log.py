@@ -227,7 +227,7 @@ class ProgressBar(object):
     def __call__(self, inc=1):
         self.count += inc
         if not self.silent:
-            new_nchar = (self.count*self.width)/self.niter
+            new_nchar = (self.count*self.width)//self.niter
             if new_nchar > self.nchar:
                 self.f.write('>'*(new_nchar - self.nchar))
                 self.f.flush()
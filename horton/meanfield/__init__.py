@@ -24,16 +24,20 @@ from __future__ import division
 from __future__ import absolute_import
 
 
+from horton.meanfield.batch import *
 from horton.meanfield.builtin import *
 from horton.meanfield.convergence import *
 from horton.meanfield.core import *
 from horton.meanfield.cext import *
 from horton.meanfield.guess import *
 from horton.meanfield.hamiltonian import *
+from horton.meanfield.ladder import *
 from horton.meanfield.libxc import *
 from horton.meanfield.linear import *
 from horton.meanfield.observable import *
 from horton.meanfield.project import *
+from horton.meanfield.recorder import *
+from horton.meanfield.scan import *
 from horton.meanfield.scf import *
 from horton.meanfield.scf_oda import *
 from horton.meanfield.scf_cdiis import *
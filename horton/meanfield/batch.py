@@ -0,0 +1,231 @@
+# -*- coding: utf-8 -*-
+# Horton is a development platform for electronic structure methods.
+# Copyright (C) 2011-2013 Toon Verstraelen <Toon.Verstraelen@UGent.be>
+#
+# This file is part of Horton.
+#
+# Horton is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 3
+# of the License, or (at your option) any later version.
+#
+# Horton is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, see <http://www.gnu.org/licenses/>
+#
+#--
+'''SCF computations on many molecules with a pool of worker processes'''
+from __future__ import print_function
+from __future__ import division
+from __future__ import absolute_import
+
+
+import os, time, multiprocessing
+
+from horton.exceptions import NoSCFConvergence
+from horton.grid.cext import set_num_threads
+from horton.grid.molgrid import BeckeMolGrid
+from horton.io.lockedh5 import LockedH5File
+from horton.log import log
+from horton.meanfield.builtin import HartreeFockExchange, DiracExchange
+from horton.meanfield.guess import guess_hamiltonian_core
+from horton.meanfield.hamiltonian import Hamiltonian
+from horton.meanfield.libxc import LibXCLDA, LibXCGGA
+from horton.meanfield.scf_wrapper import SCFWrapper
+from horton.meanfield.wfn import setup_mean_field_wfn
+from horton.system import System
+
+
+__all__ = ['batch_functionals', 'get_batch_terms', 'run_scf_batch']
+
+
+# The functionals that can be selected by name in a batch computation.
+batch_functionals = {
+    'hf': lambda: [HartreeFockExchange()],
+    'hfs': lambda: [DiracExchange()],
+    'lda': lambda: [LibXCLDA('x'), LibXCLDA('c_vwn')],
+    'pbe': lambda: [LibXCGGA('x_pbe'), LibXCGGA('c_pbe')],
+}
+
+
+def get_batch_terms(functional):
+    '''Return a new list of Hamiltonian terms for the given functional name
+
+       **Arguments:**
+
+       functional
+            One of the keys of the ``batch_functionals`` dictionary.
+    '''
+    factory = batch_functionals.get(functional.lower())
+    if factory is None:
+        raise ValueError('Unknown functional: %s' % functional)
+    return factory()
+
+
+def run_scf_batch(filenames, fn_h5, functional='hf', obasis='3-21G',
+                  agspec='fine', scf_method='cdiis', scf_kwargs=None, charge=0,
+                  mult=None, nproc=None, nthread=1, overwrite=False):
+    '''Run SCF computations on many molecules with a pool of processes
+
+       **Arguments:**
+
+       filenames
+            A list of geometry files that can be loaded with
+            ``System.from_file``.
+
+       fn_h5
+            The HDF5 file in which the results are stored. Every molecule gets
+            a group named after its file, without directory and extension.
+
+       **Optional arguments:**
+
+       functional
+            The name of the functional, see ``batch_functionals``.
+
+       obasis
+            The orbital basis set, a string or a GOBasisDesc instance.
+
+       agspec
+            The atomic grid specification for functionals that need a grid.
+
+       scf_method, scf_kwargs
+            The method and the optional arguments for the SCFWrapper.
+
+       charge, mult
+            The charge and multiplicity for all molecules.
+
+       nproc
+            The number of worker processes. By default, the number of CPUs is
+            used.
+
+       nthread
+            The number of OpenMP threads of the grid routines in each worker
+            process, see ``set_num_threads``. The default avoids that nproc
+            workers each start a thread for every core.
+
+       overwrite
+            When False, molecules that already have a group in the output file
+            are skipped.
+
+       The worker processes stay alive for the entire batch. Hence, the basis
+       set files and atomic grid specifications are parsed only once per worker.
+       The results are written to the output file by the calling process as
+       soon as a molecule is done. Every group contains the energy, its
+       contributions, the orbital energies and occupations, the number of
+       iterations and the timings (attributes ``wall_time`` and ``cpu_time``).
+       Molecules that fail get an ``error`` attribute instead of results.
+
+       **Returns:** the number of molecules that failed.
+    '''
+    names = [os.path.splitext(os.path.basename(filename))[0] for filename in filenames]
+    if len(set(names)) != len(names):
+        raise ValueError('The names of the geometry files (without directory and extension) must be unique.')
+    get_batch_terms(functional) # early check of the functional name
+    if scf_kwargs is None:
+        scf_kwargs = {}
+    SCFWrapper(scf_method, **scf_kwargs) # early check of the SCF method
+    if nthread < 1:
+        raise ValueError('The number of threads must be at least one.')
+
+    with LockedH5File(fn_h5, 'a') as f:
+        tasks = []
+        for name, filename in zip(names, filenames):
+            if name in f:
+                if overwrite:
+                    del f[name]
+                else:
+                    continue
+            tasks.append((name, filename, functional, obasis, agspec,
+                          scf_method, scf_kwargs, charge, mult))
+
+        if log.do_medium:
+            log('Running %i SCF computations with %s processes.' % (len(tasks), 'all' if nproc is None else nproc))
+            log.hline()
+            log('Molecule                        Iterations        Energy   Wall time')
+            log.hline()
+
+        nfail = 0
+        pool = multiprocessing.Pool(nproc, _init_worker, (nthread,))
+        try:
+            for name, filename, result, error, wall, cpu in pool.imap_unordered(_compute_molecule, tasks):
+                grp = f.create_group(name)
+                grp.attrs['filename'] = filename
+                grp.attrs['wall_time'] = wall
+                grp.attrs['cpu_time'] = cpu
+                if error is None:
+                    for key, value in result.iteritems():
+                        grp[key] = value
+                    if log.do_medium:
+                        log('%-30s %11i %13.6f %11.2f' % (name, result['niter'], result['energy'], wall))
+                else:
+                    nfail += 1
+                    grp.attrs['error'] = error
+                    if log.do_medium:
+                        log('%-30s %s' % (name, error))
+                f.flush()
+            pool.close()
+        except:
+            pool.terminate()
+            raise
+        finally:
+            pool.join()
+
+        if log.do_medium:
+            log.hline()
+            log('%i out of %i computations failed.' % (nfail, len(tasks)))
+            log.blank()
+    return nfail
+
+
+def _init_worker(nthread):
+    '''Initialization of a worker process'''
+    log.set_level(log.silent)
+    set_num_threads(nthread)
+
+
+def _compute_molecule(task):
+    '''Run the SCF for one molecule, called in a worker process'''
+    name, filename, functional, obasis, agspec, scf_method, scf_kwargs, charge, mult = task
+    time0 = time.time()
+    clock0 = time.clock()
+    try:
+        result = _run_scf(filename, functional, obasis, agspec, scf_method, scf_kwargs, charge, mult)
+        error = None
+    except NoSCFConvergence:
+        result = None
+        error = 'No SCF convergence'
+    except Exception as e:
+        result = None
+        error = '%s: %s' % (e.__class__.__name__, e)
+    return name, filename, result, error, time.time() - time0, time.clock() - clock0
+
+
+def _run_scf(filename, functional, obasis, agspec, scf_method, scf_kwargs, charge, mult):
+    '''Load a molecule, converge the SCF and return the results in a dictionary'''
+    sys = System.from_file(filename, obasis=obasis)
+    setup_mean_field_wfn(sys, charge, mult)
+    guess_hamiltonian_core(sys)
+    terms = get_batch_terms(functional)
+    if any(term.require_grid for term in terms):
+        # Parsed grid specifications are cached by horton.grid.atgrid.
+        grid = BeckeMolGrid(sys, agspec, random_rotate=False)
+    else:
+        grid = None
+    ham = Hamiltonian(sys, terms, grid)
+    niter = SCFWrapper(scf_method, **scf_kwargs)(ham)
+    ham.compute()
+
+    result = {'niter': niter}
+    for key, value in sys.extra.iteritems():
+        if key.startswith('energy'):
+            result[key] = value
+    for spin in 'alpha', 'beta':
+        if hasattr(sys.wfn, 'exp_%s' % spin):
+            exp = getattr(sys.wfn, 'exp_%s' % spin)
+            result['orb_energies_%s' % spin] = exp.energies.copy()
+            result['occupations_%s' % spin] = exp.occupations.copy()
+    return result
@@ -130,7 +130,7 @@ class DiracExchange(Observable):
         def helper(select):
             # update grid stuff
             rho = self.update_rho(select)
-            pot, new = self.cache.load('pot_exchange_dirac_%s' % select, alloc=self.grid.size)
+            pot, new = self.cache.load('pot_exchange_dirac_%s' % select, alloc=self.grid.size, tags='g')
             if new:
                 pot[:] = self.derived_coeff*rho**(1.0/3.0)
 
@@ -24,11 +24,16 @@ from __future__ import division
 from __future__ import absolute_import
 
 
+import numpy as np
+
+from horton.gbasis.cext import GOBasis, get_shell_nbasis
+from horton.grid.atgrid import AtomicGrid
 from horton.log import log, timer
+from horton.matrix import DenseLinalgFactory
 from horton.meanfield.wfn import RestrictedWFN, UnrestrictedWFN
 
 
-__all__ = ['guess_hamiltonian_core']
+__all__ = ['guess_hamiltonian_core', 'guess_density_sad']
 
 
 @timer.with_section('Initial Guess')
@@ -62,3 +67,160 @@ def guess_hamiltonian_core_os(system):
     system.wfn.clear()
     system.wfn.update_exp(hamcore, hamcore, overlap)
     system.update_chk('wfn')
+
+
+@timer.with_section('Initial Guess')
+def guess_density_sad(system, proatomdb, agspec='medium'):
+    '''Superposition of atomic densities (SAD) guess
+
+       **Arguments:**
+
+       system
+            The System instance for which the initial guess is made.
+
+       proatomdb
+            A ProAtomDB instance with neutral pro-atoms for all elements in
+            the system.
+
+       **Optional arguments:**
+
+       agspec
+            A specifications of the atomic grids used to project the pro-atom
+            densities on the orbital basis. This can either be an instance of
+            the AtomicGridSpec object, or the first argument of its
+            constructor.
+
+       For each atom, the spherical pro-atom density is projected on the
+       basis functions centered on that atom by a least-squares fit on an
+       atomic grid. The projections are only computed once for each
+       combination of element and atomic basis set. The resulting
+       block-diagonal density matrix is not idempotent and is stored as such
+       in the wavefunction, split over the alpha and beta spin according to
+       the occupation model and rescaled to the number of electrons of each
+       spin. The natural orbitals, sorted from high to low occupation, are
+       only used as the orbital guess. (Their orbital energies are set to
+       minus the natural occupation numbers.)
+    '''
+    if log.do_medium:
+        log('Performing a superposition of atomic densities (SAD) guess.')
+        log.blank()
+    dm_full = system.lf.create_one_body()
+    obasis = system.obasis
+    blocks = {}
+    for iatom in xrange(system.natom):
+        ishells = (obasis.shell_map == iatom).nonzero()[0]
+        if len(ishells) == 0:
+            continue
+        number = system.numbers[iatom]
+        pseudo_number = system.pseudo_numbers[iatom]
+        obasis_atom = _get_atom_obasis(obasis, ishells)
+        key = (
+            number, pseudo_number, obasis_atom.shell_types.tostring(),
+            obasis_atom.nprims.tostring(), obasis_atom.alphas.tostring(),
+            obasis_atom.con_coeffs.tostring()
+        )
+        block = blocks.get(key)
+        if block is None:
+            block = _project_proatom(obasis_atom, number, pseudo_number, proatomdb, agspec)
+            blocks[key] = block
+        ibasis = _get_atom_ibasis(obasis, ishells)
+        for i0 in xrange(len(ibasis)):
+            for i1 in xrange(i0+1):
+                dm_full.set_element(ibasis[i0], ibasis[i1], block[i0, i1])
+
+    overlap = system.get_overlap()
+    population = dm_full.expectation_value(overlap)
+    system.wfn.clear()
+    if isinstance(system.wfn, RestrictedWFN):
+        _assign_naturals(system.lf, system.wfn.init_exp('alpha'), dm_full, overlap)
+        system.wfn.occ_model.assign(system.wfn.exp_alpha)
+        exps = [system.wfn.exp_alpha]
+        spins = ['alpha']
+    elif isinstance(system.wfn, UnrestrictedWFN):
+        _assign_naturals(system.lf, system.wfn.init_exp('alpha'), dm_full, overlap)
+        system.wfn.init_exp('beta').assign(system.wfn.exp_alpha)
+        system.wfn.occ_model.assign(system.wfn.exp_alpha, system.wfn.exp_beta)
+        exps = [system.wfn.exp_alpha, system.wfn.exp_beta]
+        spins = ['alpha', 'beta']
+    else:
+        raise NotImplementedError
+    # The SAD density itself is used, not the density of the natural orbitals.
+    for exp, spin in zip(exps, spins):
+        dm = dm_full.copy()
+        dm.iscale(exp.occupations.sum()/population)
+        system.wfn.update_dm(spin, dm)
+    system.update_chk('wfn')
+
+
+def _get_atom_obasis(obasis, ishells):
+    '''Construct an orbital basis, centered at the origin, with a subset of the shells'''
+    prim_offsets = np.concatenate([[0], np.cumsum(obasis.nprims)])
+    iprims = np.concatenate([
+        np.arange(prim_offsets[ishell], prim_offsets[ishell+1])
+        for ishell in ishells
+    ])
+    return GOBasis(
+        np.zeros((1, 3), float), np.zeros(len(ishells), int),
+        obasis.nprims[ishells].copy(), obasis.shell_types[ishells].copy(),
+        obasis.alphas[iprims].copy(), obasis.con_coeffs[iprims].copy()
+    )
+
+
+def _get_atom_ibasis(obasis, ishells):
+    '''Return the indexes of the basis functions in a subset of the shells'''
+    nbasis = np.array([get_shell_nbasis(shell_type) for shell_type in obasis.shell_types])
+    basis_offsets = np.concatenate([[0], np.cumsum(nbasis)])
+    return np.concatenate([
+        np.arange(basis_offsets[ishell], basis_offsets[ishell+1])
+        for ishell in ishells
+    ])
+
+
+def _project_proatom(obasis_atom, number, pseudo_number, proatomdb, agspec):
+    '''Project a neutral pro-atom density on an atomic basis
+
+       **Returns:** a density matrix (numpy array) in the atomic basis,
+       normalized to the pseudo-population of the pro-atom.
+    '''
+    record = proatomdb.get_record(number, 0)
+    center = np.zeros(3, float)
+    atgrid = AtomicGrid(number, pseudo_number, center, agspec, random_rotate=False)
+    rho = np.zeros(atgrid.size)
+    atgrid.eval_spline(proatomdb.get_spline(number), center, rho)
+
+    # Evaluate the basis functions on the atomic grid
+    nbasis = obasis_atom.nbasis
+    lf = DenseLinalgFactory(nbasis)
+    exp = lf.create_expansion()
+    exp.coeffs[:] = np.identity(nbasis)
+    basis = np.zeros((atgrid.size, nbasis))
+    obasis_atom.compute_grid_orbitals_exp(exp, atgrid.points, np.arange(nbasis), basis)
+
+    # Least-squares fit of the products of basis functions to the density.
+    # Off-diagonal elements of the density matrix contribute twice.
+    iu0, iu1 = np.triu_indices(nbasis)
+    sqrt_weights = np.sqrt(atgrid.weights)
+    design = basis[:,iu0]*basis[:,iu1]*sqrt_weights.reshape(-1, 1)
+    design[:,iu0 != iu1] *= 2
+    coeffs = np.linalg.lstsq(design, rho*sqrt_weights, rcond=1e-10)[0]
+    dm = np.zeros((nbasis, nbasis))
+    dm[iu0, iu1] = coeffs
+    dm[iu1, iu0] = coeffs
+
+    # Fix the normalization
+    olp = lf.create_one_body()
+    obasis_atom.compute_overlap(olp)
+    dm *= record.pseudo_population/(dm*olp._array).sum()
+    return dm
+
+
+def _assign_naturals(lf, exp, dm, overlap):
+    '''Store the natural orbitals of dm, sorted by decreasing occupation, in exp'''
+    occ = overlap.copy()
+    occ.idot(dm)
+    occ.idot(overlap)
+    evals, evecs = lf.diagonalize(occ, overlap)
+    order = evals.argsort()[::-1][:exp.nfn]
+    exp.coeffs[:] = evecs[:,order]
+    exp.energies[:] = -evals[order]
+    exp.occupations[:] = 0.0
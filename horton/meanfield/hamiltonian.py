@@ -28,6 +28,7 @@ from horton.log import log
 from horton.cache import Cache
 from horton.meanfield.core import KineticEnergy, ExternalPotential
 from horton.meanfield.builtin import Hartree
+from horton.meanfield.recorder import record_section
 from horton.meanfield.wfn import UnrestrictedWFN
 
 
@@ -90,6 +91,10 @@ class Hamiltonian(object):
         # need to be updated at each SCF cycle.
         self.cache = Cache()
 
+        # An optional SCFRecorder instance that collects the timings of all
+        # terms in each SCF iteration.
+        self.recorder = None
+
         # bind the terms to this hamiltonian such that certain shared
         # intermediated results can be reused for the sake of efficiency.
         for term in self.terms:
@@ -100,6 +105,25 @@ class Hamiltonian(object):
         self.terms.append(term)
         term.set_hamiltonian(self)
 
+    def update_grid(self, grid):
+        '''Switch to a new integration grid
+
+           **Arguments:**
+
+           grid
+                The new integration grid. It is also assigned to the system
+                with System.update_grid.
+
+           All arrays in the cache that are defined on the grid (tag 'g') are
+           deallocated. All other cached results are marked as outdated.
+        '''
+        if grid is None and any(term.require_grid for term in self.terms):
+            raise TypeError('Some terms require a grid, but no grid is given.')
+        self.grid = grid
+        self.cache.clear(tags='g', dealloc=True)
+        self.cache.clear()
+        self.system.update_grid(grid)
+
     def clear(self):
         '''Mark the properties derived from the wfn as outdated.
 
@@ -117,7 +141,8 @@ class Hamiltonian(object):
         '''
         total = 0.0
         for term in self.terms:
-            energy = term.compute()
+            with record_section(self.recorder, 'energy_%s' % term.label):
+                energy = term.compute()
             self.system.extra['energy_%s' % term.label] = energy
             total += energy
         energy = self.system.compute_nucnuc()
@@ -160,10 +185,15 @@ class Hamiltonian(object):
         # terms will actually only evaluate potentials on grids and add these
         # results to the total potential on a grid.
         for term in self.terms:
-            term.add_fock_matrix(fock_alpha, fock_beta, postpone_grid=True)
+            with record_section(self.recorder, 'fock_%s' % term.label):
+                term.add_fock_matrix(fock_alpha, fock_beta, postpone_grid=True)
         # Collect all the total potentials and turn them into contributions
         # for the fock matrix/matrices.
+        with record_section(self.recorder, 'fock_grid'):
+            self._compute_grid_fock(fock_alpha, fock_beta)
 
+    def _compute_grid_fock(self, fock_alpha, fock_beta):
+        '''Add the contributions of the total potentials on the grid'''
         # Collect potentials for alpha electrons
         # d = density
         if 'dpot_total_alpha' in self.cache:
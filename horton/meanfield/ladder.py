@@ -0,0 +1,153 @@
+# -*- coding: utf-8 -*-
+# Horton is a development platform for electronic structure methods.
+# Copyright (C) 2011-2013 Toon Verstraelen <Toon.Verstraelen@UGent.be>
+#
+# This file is part of Horton.
+#
+# Horton is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 3
+# of the License, or (at your option) any later version.
+#
+# Horton is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, see <http://www.gnu.org/licenses/>
+#
+#--
+'''SCF in a sequence of basis sets, from cheap to expensive'''
+from __future__ import print_function
+from __future__ import division
+from __future__ import absolute_import
+
+
+import time
+
+from horton.grid.molgrid import BeckeMolGrid
+from horton.log import log
+from horton.meanfield.guess import guess_hamiltonian_core
+from horton.meanfield.hamiltonian import Hamiltonian
+from horton.meanfield.project import project_orbitals_mgs
+
+
+__all__ = ['converge_scf_ladder']
+
+
+def converge_scf_ladder(system, get_terms, scf_wrapper, obasis_small='3-21G',
+                        agspec_small='coarse', agspec='fine', obasis=None,
+                        guess=guess_hamiltonian_core):
+    '''Converge the SCF in a small basis and finish in the target basis
+
+       **Arguments:**
+
+       system
+            A System instance with a wavefunction object. The occupation
+            model of the wavefunction is used in both stages. The current
+            orbital basis of the system is the target basis, unless the
+            ``obasis`` argument is given.
+
+       get_terms
+            A function without arguments that returns a new list of terms for
+            the Hamiltonian. (Terms can not be shared between Hamiltonians.)
+
+       scf_wrapper
+            An SCFWrapper instance that is used to converge the wavefunction
+            in both basis sets.
+
+       **Optional arguments:**
+
+       obasis_small
+            The small basis set used in the first stage. This may be a string
+            or a GOBasisDesc instance.
+
+       agspec_small
+            The atomic grid specification used in the first stage, only
+            relevant when one of the terms requires a grid.
+
+       agspec
+            The atomic grid specification used in the second stage, only
+            relevant when one of the terms requires a grid.
+
+       obasis
+            The target basis set. This may be a string or a GOBasisDesc
+            instance. When not given, the orbital basis description of the
+            system is used.
+
+       guess
+            A function that takes the system as argument and makes an
+            initial guess for the wavefunction in the small basis.
+
+       In the first stage, the basis set and the integration grid are replaced
+       by their cheap counterparts and the SCF is converged. In the second
+       stage, the orbitals are projected on the target basis with
+       ``project_orbitals_mgs`` and the SCF is converged with the target
+       basis and grid.
+
+       **Returns:** the Hamiltonian of the last stage.
+    '''
+    if obasis is None:
+        obasis = system.obasis_desc
+        if obasis is None:
+            raise TypeError('No orbital basis description (obasis_desc) available to restore the target basis.')
+    occ_model = system.wfn.occ_model
+    WFNClass = system.wfn.__class__
+
+    if log.do_medium:
+        log('Starting SCF with a basis set ladder.')
+        log.blank()
+
+    timings = []
+
+    # Stage 1: small basis and coarse grid
+    time0 = time.time()
+    clock0 = time.clock()
+    system.update_obasis(obasis_small)
+    system._wfn = WFNClass(system.lf, system.obasis.nbasis, occ_model)
+    guess(system)
+    ham = _get_hamiltonian(system, get_terms(), agspec_small)
+    niter = scf_wrapper(ham)
+    timings.append(('small basis', niter, time.time() - time0, time.clock() - clock0))
+    _log_stage(*timings[-1])
+
+    # Stage 2: projection on the target basis and final convergence
+    time0 = time.time()
+    clock0 = time.clock()
+    old_wfn = system.wfn
+    old_obasis = system.obasis
+    system.update_obasis(obasis)
+    system._wfn = WFNClass(system.lf, system.obasis.nbasis, occ_model)
+    project_orbitals_mgs(system, old_wfn, old_obasis)
+    ham = _get_hamiltonian(system, get_terms(), agspec)
+    niter = scf_wrapper(ham)
+    timings.append(('target basis', niter, time.time() - time0, time.clock() - clock0))
+    _log_stage(*timings[-1])
+
+    if log.do_medium:
+        log('Overview of the basis set ladder.')
+        log.hline()
+        log('Stage              Iterations       Wall time        CPU time')
+        log.hline()
+        for label, niter, wall, cpu in timings:
+            log('%-18s %10s %15.2f %15.2f' % (label, niter, wall, cpu))
+        log.hline()
+        log.blank()
+    return ham
+
+
+def _get_hamiltonian(system, terms, agspec):
+    '''Construct a Hamiltonian, with a new grid if any of the terms needs one'''
+    if any(term.require_grid for term in terms):
+        grid = BeckeMolGrid(system, agspec)
+    else:
+        grid = None
+    return Hamiltonian(system, terms, grid)
+
+
+def _log_stage(label, niter, wall, cpu):
+    if log.do_medium:
+        log('Ladder stage \'%s\' converged in %s iterations. Wall time: %.2f s. CPU time: %.2f s.' % (
+            label, niter, wall, cpu))
+        log.blank()
@@ -75,7 +75,7 @@ class LibXCLDA(LibXCEnergy):
         if isinstance(self.system.wfn, RestrictedWFN):
             # In the closed-shell case, libxc expects the total density as input
             # and returns the potential for the alpha electrons.
-            pot, new = self.cache.load('pot_libxc_%s_alpha' % self._name, alloc=self.grid.size)
+            pot, new = self.cache.load('pot_libxc_%s_alpha' % self._name, alloc=self.grid.size, tags='g')
             if new:
                 rho = self.update_rho('full')
                 self._libxc_wrapper.compute_lda_vxc_unpol(rho, pot)
@@ -84,7 +84,7 @@ class LibXCLDA(LibXCEnergy):
         else:
             # In case of spin-polarized computations, alpha and beta densities
             # go in and the alpha and beta potentials come out of  it.
-            pot_both, new = self.cache.load('pot_libxc_%s_both' % self._name, alloc=(self.grid.size, 2))
+            pot_both, new = self.cache.load('pot_libxc_%s_both' % self._name, alloc=(self.grid.size, 2), tags='g')
             if new:
                 rho_both = self.update_rho('both')
                 self._libxc_wrapper.compute_lda_vxc_pol(rho_both, pot_both)
@@ -98,14 +98,14 @@ class LibXCLDA(LibXCEnergy):
             # In the unpolarized case, libxc expects the total density as input
             # and returns the energy density per particle.
             rho = self.update_rho('full')
-            edens, new = self.cache.load('edens_libxc_%s_full' % self._name, alloc=self.grid.size)
+            edens, new = self.cache.load('edens_libxc_%s_full' % self._name, alloc=self.grid.size, tags='g')
             if new:
                 self._libxc_wrapper.compute_lda_exc_unpol(rho, edens)
             return self.grid.integrate(edens, rho)
         else:
             # In case of spin-polarized computations, alpha and beta densities
             # go in and the 'total' energy density comes out.
-            edens, new = self.cache.load('edens_libxc_%s_full' % self._name, alloc=self.grid.size)
+            edens, new = self.cache.load('edens_libxc_%s_full' % self._name, alloc=self.grid.size, tags='g')
             if new:
                 rho_both = self.update_rho('both')
                 self._libxc_wrapper.compute_lda_exc_pol(rho_both, edens)
@@ -129,14 +129,14 @@ class LibXCGGA(LibXCEnergy):
     @timer.with_section('GGA pot')
     def _update_operator(self, postpone_grid=False):
         if isinstance(self.system.wfn, RestrictedWFN):
-            dpot, newd = self.cache.load('dpot_libxc_%s_alpha' % self._name, alloc=self.grid.size)
-            spot, news = self.cache.load('spot_libxc_%s_alpha' % self._name, alloc=self.grid.size)
+            dpot, newd = self.cache.load('dpot_libxc_%s_alpha' % self._name, alloc=self.grid.size, tags='g')
+            spot, news = self.cache.load('spot_libxc_%s_alpha' % self._name, alloc=self.grid.size, tags='g')
             if newd or news:
                 rho = self.update_rho('full')
                 sigma = self.update_sigma('full')
                 self._libxc_wrapper.compute_gga_vxc_unpol(rho, sigma, dpot, spot)
 
-            gpot, new = self.cache.load('gpot_libxc_%s_alpha' % self._name, alloc=(self.grid.size,3))
+            gpot, new = self.cache.load('gpot_libxc_%s_alpha' % self._name, alloc=(self.grid.size,3), tags='g')
             if new:
                 grad_rho = self.update_grad_rho('full')
                 np.multiply(grad_rho, spot.reshape(-1,1), out=gpot)
@@ -145,20 +145,20 @@ class LibXCGGA(LibXCEnergy):
             self._handle_dpot(dpot, postpone_grid, 'op_libxc_%s_alpha' % self._name, 'alpha')
             self._handle_gpot(gpot, postpone_grid, 'op_libxc_%s_alpha' % self._name, 'alpha')
         else:
-            dpot_both, newd = self.cache.load('dpot_libxc_%s_both' % self._name, alloc=(self.grid.size, 2))
-            spot_all, newt = self.cache.load('spot_libxc_%s_all' % self._name, alloc=(self.grid.size, 3))
+            dpot_both, newd = self.cache.load('dpot_libxc_%s_both' % self._name, alloc=(self.grid.size, 2), tags='g')
+            spot_all, newt = self.cache.load('spot_libxc_%s_all' % self._name, alloc=(self.grid.size, 3), tags='g')
             if newd or newt:
                 rho_both = self.update_rho('both')
                 sigma_all = self.update_sigma('all')
                 self._libxc_wrapper.compute_gga_vxc_pol(rho_both, sigma_all, dpot_both, spot_all)
 
-            gpot_alpha, new = self.cache.load('gpot_libxc_%s_alpha' % self._name, alloc=(self.grid.size,3))
+            gpot_alpha, new = self.cache.load('gpot_libxc_%s_alpha' % self._name, alloc=(self.grid.size,3), tags='g')
             if new:
                 # TODO: make more efficient
                 gpot_alpha[:] = (2*spot_all[:,0].reshape(-1,1))*self.update_grad_rho('alpha')
                 gpot_alpha[:] += (spot_all[:,1].reshape(-1,1))*self.update_grad_rho('beta')
 
-            gpot_beta, new = self.cache.load('gpot_libxc_%s_beta' % self._name, alloc=(self.grid.size,3))
+            gpot_beta, new = self.cache.load('gpot_libxc_%s_beta' % self._name, alloc=(self.grid.size,3), tags='g')
             if new:
                 # TODO: make more efficient
                 gpot_beta[:] = (2*spot_all[:,2].reshape(-1,1))*self.update_grad_rho('beta')
@@ -174,14 +174,14 @@ class LibXCGGA(LibXCEnergy):
         if isinstance(self.system.wfn, RestrictedWFN):
             rho = self.update_rho('full')
             sigma = self.update_sigma('full')
-            edens, new = self.cache.load('edens_libxc_%s_full' % self._name, alloc=self.grid.size)
+            edens, new = self.cache.load('edens_libxc_%s_full' % self._name, alloc=self.grid.size, tags='g')
             if new:
                 self._libxc_wrapper.compute_gga_exc_unpol(rho, sigma, edens)
             return self.grid.integrate(edens, rho)
         else:
             rho_both = self.update_rho('both')
             sigma_all = self.update_sigma('all')
-            edens, new = self.cache.load('edens_libxc_%s_full' % self._name, alloc=self.grid.size)
+            edens, new = self.cache.load('edens_libxc_%s_full' % self._name, alloc=self.grid.size, tags='g')
             if new:
                 self._libxc_wrapper.compute_gga_exc_pol(rho_both, sigma_all, edens)
             rho = self.update_rho('full')
@@ -66,32 +66,32 @@ class Observable(object):
     def update_rho(self, select):
         if select == 'both':
             # This is needed for libxc
-            rho, new = self.cache.load('rho_both', alloc=(self.grid.size, 2))
+            rho, new = self.cache.load('rho_both', alloc=(self.grid.size, 2), tags='g')
             if new:
                 rho_alpha = self.update_rho('alpha')
                 rho_beta = self.update_rho('beta')
                 rho[:,0] = rho_alpha
                 rho[:,1] = rho_beta
         else:
-            rho, new = self.cache.load('rho_%s' % select, alloc=self.grid.size)
+            rho, new = self.cache.load('rho_%s' % select, alloc=self.grid.size, tags='g')
             if new:
                 self.system.compute_grid_density(self.grid.points, rhos=rho, select=select)
         return rho
 
     def update_grad_rho(self, select):
-        grad_rho, new = self.cache.load('grad_rho_%s' % select, alloc=(self.grid.size, 3))
+        grad_rho, new = self.cache.load('grad_rho_%s' % select, alloc=(self.grid.size, 3), tags='g')
         if new:
             self.system.compute_grid_gradient(self.grid.points, gradrhos=grad_rho, select=select)
         return grad_rho
 
     def update_sigma(self, select):
         if select == 'all':
-            sigma, new = self.cache.load('sigma_all', alloc=(self.grid.size, 3))
+            sigma, new = self.cache.load('sigma_all', alloc=(self.grid.size, 3), tags='g')
             sigma[:,0] = self.update_sigma('alpha')
             sigma[:,1] = self.update_sigma('cross')
             sigma[:,2] = self.update_sigma('beta')
         else:
-            sigma, new = self.cache.load('sigma_%s' % select, alloc=self.grid.size)
+            sigma, new = self.cache.load('sigma_%s' % select, alloc=self.grid.size, tags='g')
             if new:
                 if select == 'cross':
                     grad_rho_alpha = self.update_grad_rho('alpha')
@@ -160,12 +160,12 @@ class Observable(object):
             tag = '%s_postponed_dpot' % op_name
             if tag not in self.cache:
                 if spin == 'both':
-                    dpot_total_alpha = self.cache.load('dpot_total_alpha', alloc=self.grid.size)[0]
+                    dpot_total_alpha = self.cache.load('dpot_total_alpha', alloc=self.grid.size, tags='g')[0]
                     dpot_total_alpha += dpot
-                    dpot_total_beta = self.cache.load('dpot_total_beta', alloc=self.grid.size)[0]
+                    dpot_total_beta = self.cache.load('dpot_total_beta', alloc=self.grid.size, tags='g')[0]
                     dpot_total_beta += dpot
                 elif spin == 'alpha' or spin == 'beta':
-                    dpot_total = self.cache.load('dpot_total_%s' % spin, alloc=self.grid.size)[0]
+                    dpot_total = self.cache.load('dpot_total_%s' % spin, alloc=self.grid.size, tags='g')[0]
                     dpot_total += dpot
                 else:
                     raise NotImplementedError
@@ -203,12 +203,12 @@ class Observable(object):
             tag = '%s_postponed_gpot' % op_name
             if tag not in self.cache:
                 if spin == 'both':
-                    gpot_total_alpha = self.cache.load('gpot_total_alpha', alloc=(self.grid.size,3))[0]
+                    gpot_total_alpha = self.cache.load('gpot_total_alpha', alloc=(self.grid.size,3), tags='g')[0]
                     gpot_total_alpha += gpot
-                    gpot_total_beta = self.cache.load('gpot_total_beta', alloc=(self.grid.size,3))[0]
+                    gpot_total_beta = self.cache.load('gpot_total_beta', alloc=(self.grid.size,3), tags='g')[0]
                     gpot_total_beta += gpot
                 elif spin == 'alpha' or spin == 'beta':
-                    gpot_total = self.cache.load('gpot_total_%s' % spin, alloc=(self.grid.size,3))[0]
+                    gpot_total = self.cache.load('gpot_total_%s' % spin, alloc=(self.grid.size,3), tags='g')[0]
                     gpot_total += gpot
                 else:
                     raise NotImplementedError
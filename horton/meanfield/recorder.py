@@ -0,0 +1,142 @@
+# -*- coding: utf-8 -*-
+# Horton is a development platform for electronic structure methods.
+# Copyright (C) 2011-2013 Toon Verstraelen <Toon.Verstraelen@UGent.be>
+#
+# This file is part of Horton.
+#
+# Horton is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 3
+# of the License, or (at your option) any later version.
+#
+# Horton is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, see <http://www.gnu.org/licenses/>
+#
+#--
+'''Per-iteration timings and convergence data of SCF algorithms'''
+from __future__ import print_function
+from __future__ import division
+from __future__ import absolute_import
+
+
+import time, json
+from contextlib import contextmanager
+
+
+__all__ = ['SCFRecorder', 'record_section']
+
+
+class SCFRecorder(object):
+    '''Collects a record (a dictionary) for every SCF iteration
+
+       Assign an instance to the ``recorder`` attribute of a Hamiltonian. The
+       converge_scf_* functions then call ``record`` at the end of every
+       iteration and the Hamiltonian times the contributions of all its terms.
+       Every record contains the following items:
+
+       * ``method``: the SCF algorithm
+       * ``iter``: the iteration counter. The DIIS algorithms record the
+         initial Fock build separately, with counter -1.
+       * ``error``: the convergence error
+       * ``energy``: the energy, None if it was not computed
+       * ``wall``, ``cpu``: the wall and CPU time of the iteration
+
+       And for every timed section (e.g. ``fock_hartree``, ``energy_kin``,
+       ``diagonalize``, ``diis_solve``, ...) two items with suffixes ``_wall``
+       and ``_cpu``. Nested sections are all included in the time of the
+       enclosing section.
+    '''
+    def __init__(self, filename=None):
+        '''
+           **Optional arguments:**
+
+           filename
+                When given, every record is also appended as a line of JSON to
+                this file.
+        '''
+        self.filename = filename
+        self.records = []
+        self.start('unknown')
+
+    def start(self, method):
+        '''Start recording a new SCF run
+
+           **Arguments:**
+
+           method
+                The name of the SCF algorithm.
+        '''
+        self._method = method
+        self._reset()
+
+    def _reset(self):
+        self._sections = {}
+        self._wall0 = time.time()
+        self._cpu0 = time.clock()
+
+    @contextmanager
+    def section(self, label):
+        '''Time a part of an SCF iteration
+
+           **Arguments:**
+
+           label
+                A label for the timed section. Multiple sections with the
+                same label in one iteration are added.
+        '''
+        wall0 = time.time()
+        cpu0 = time.clock()
+        try:
+            yield
+        finally:
+            timing = self._sections.setdefault(label, [0.0, 0.0])
+            timing[0] += time.time() - wall0
+            timing[1] += time.clock() - cpu0
+
+    def record(self, counter, error, energy=None):
+        '''Finish the record of an SCF iteration
+
+           **Arguments:**
+
+           counter
+                The iteration counter.
+
+           error
+                The convergence error.
+
+           **Optional arguments:**
+
+           energy
+                The energy, if it was computed in this iteration.
+        '''
+        record = {
+            'method': self._method,
+            'iter': counter,
+            'error': float(error),
+            'energy': None if energy is None else float(energy),
+            'wall': time.time() - self._wall0,
+            'cpu': time.clock() - self._cpu0,
+        }
+        for label, (wall, cpu) in self._sections.iteritems():
+            record['%s_wall' % label] = wall
+            record['%s_cpu' % label] = cpu
+        self.records.append(record)
+        if self.filename is not None:
+            with open(self.filename, 'a') as f:
+                print(json.dumps(record, sort_keys=True), file=f)
+        self._reset()
+
+
+@contextmanager
+def record_section(recorder, label):
+    '''Time a section with the given recorder, if it is not None'''
+    if recorder is None:
+        yield
+    else:
+        with recorder.section(label):
+            yield
@@ -0,0 +1,161 @@
+# -*- coding: utf-8 -*-
+# Horton is a development platform for electronic structure methods.
+# Copyright (C) 2011-2013 Toon Verstraelen <Toon.Verstraelen@UGent.be>
+#
+# This file is part of Horton.
+#
+# Horton is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 3
+# of the License, or (at your option) any later version.
+#
+# Horton is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, see <http://www.gnu.org/licenses/>
+#
+#--
+'''SCF for a sequence of geometries, e.g. a scan or a trajectory'''
+from __future__ import print_function
+from __future__ import division
+from __future__ import absolute_import
+
+
+import time, numpy as np
+
+from horton.log import log, timer
+from horton.meanfield.wfn import RestrictedWFN
+
+
+__all__ = ['converge_scf_frames']
+
+
+# Coefficients to extrapolate the density matrix from the previous frames,
+# oldest frame first.
+extrapolation_coeffs = [
+    np.array([1.0]),
+    np.array([-1.0, 2.0]),
+    np.array([1.0, -3.0, 3.0]),
+]
+
+
+def converge_scf_frames(ham, frames, scf_wrapper, order=0, callback=None):
+    '''Converge the SCF for a sequence of geometries
+
+       **Arguments:**
+
+       ham
+            A Hamiltonian instance. Its system must have a wavefunction with
+            an initial guess for the first frame. When the Hamiltonian has a
+            grid, it must be a BeckeMolGrid with mode='keep', such that the
+            grid can follow the nuclei.
+
+       frames
+            An iterable over the geometries. Every item is an array with
+            atomic coordinates, or a dictionary with 'coordinates' and
+            'numbers', e.g. as generated by ``iter_geoms_xyz``.
+
+       scf_wrapper
+            An SCFWrapper instance.
+
+       **Optional arguments:**
+
+       order
+            The order of the extrapolation of the initial density matrix from
+            the previous frames: 0 (previous frame), 1 (linear) or 2
+            (quadratic).
+
+       callback
+            A function that is called after each frame with two arguments: the
+            index of the frame and the Hamiltonian, e.g. to store properties.
+
+       For every frame, only the geometry-dependent parts of the system are
+       updated with ``System.update_coordinates``. The integration grid and
+       the memory in the caches are reused. The SCF is started from the
+       (extrapolated) density of the previous frame(s).
+
+       **Returns:** three arrays with the energies, the number of iterations
+       and the timings (wall and CPU time) of all frames.
+    '''
+    if order < 0 or order >= len(extrapolation_coeffs):
+        raise ValueError('The extrapolation order must be 0, 1 or 2.')
+    system = ham.system
+    if isinstance(system.wfn, RestrictedWFN):
+        spins = ['alpha']
+    else:
+        spins = ['alpha', 'beta']
+
+    if log.do_medium:
+        log('Starting SCF for a sequence of geometries.')
+        log.hline()
+        log('Frame  Iterations               Energy       Wall time        CPU time')
+        log.hline()
+
+    energies = []
+    niters = []
+    timings = []
+    history = []
+    for iframe, frame in enumerate(frames):
+        time0 = time.time()
+        clock0 = time.clock()
+        if isinstance(frame, dict):
+            numbers = frame['numbers']
+            if len(numbers) != system.natom or (numbers != system.numbers).any():
+                raise ValueError('The elements in frame %i do not match the system.' % iframe)
+            frame = frame['coordinates']
+        _update_geometry(ham, frame)
+        if len(history) > 1:
+            _extrapolate_dms(system.wfn, spins, history)
+        niter = scf_wrapper(ham)
+        energy = ham.compute()
+
+        # Keep the converged density matrices for the next frames
+        if order > 0:
+            if len(history) > order:
+                dms = history.pop(0)
+                for dm, spin in zip(dms, spins):
+                    dm.assign(system.wfn.get_dm(spin))
+            else:
+                dms = [system.wfn.get_dm(spin).copy() for spin in spins]
+            history.append(dms)
+
+        if callback is not None:
+            callback(iframe, ham)
+        energies.append(energy)
+        niters.append(niter)
+        timings.append((time.time() - time0, time.clock() - clock0))
+        if log.do_medium:
+            log('%5i %11i %20.10f %15.2f %15.2f' % ((iframe, niter, energy) + timings[-1]))
+
+    if log.do_medium:
+        log.hline()
+        log.blank()
+    return np.array(energies), np.array(niters), np.array(timings)
+
+
+@timer.with_section('New geometry')
+def _update_geometry(ham, coordinates):
+    '''Move the nuclei and clear all results that depend on the geometry'''
+    system = ham.system
+    system.update_coordinates(coordinates)
+    if ham.grid is not None and ham.grid is not system.grid:
+        ham.grid.update_centers(system)
+    ham.clear()
+
+
+def _extrapolate_dms(wfn, spins, history):
+    '''Replace the wavefunction by an extrapolated density matrix'''
+    coeffs = extrapolation_coeffs[len(history)-1]
+    dms = []
+    for ispin in xrange(len(spins)):
+        dm = history[-1][ispin].copy()
+        dm.clear()
+        for coeff, old_dms in zip(coeffs, history):
+            dm.iadd(old_dms[ispin], factor=coeff)
+        dms.append(dm)
+    wfn.clear()
+    for spin, dm in zip(spins, dms):
+        wfn.update_dm(spin, dm)
@@ -26,6 +26,7 @@ from __future__ import absolute_import
 
 from horton.log import log, timer
 from horton.exceptions import NoSCFConvergence
+from horton.meanfield.recorder import record_section
 from horton.meanfield.wfn import RestrictedWFN, UnrestrictedWFN
 
 
@@ -110,6 +111,8 @@ def converge_scf_cs(ham, maxiter=128, threshold=1e-8, skip_energy=False):
     wfn = ham.system.wfn
     overlap = ham.system.get_overlap()
     fock = lf.create_one_body()
+    if ham.recorder is not None:
+        ham.recorder.start('plain')
     converged = False
     counter = 0
     while maxiter is None or counter < maxiter:
@@ -121,13 +124,16 @@ def converge_scf_cs(ham, maxiter=128, threshold=1e-8, skip_energy=False):
 
         if log.do_medium:
             log('%4i  %12.5e' % (counter, error))
+        if ham.recorder is not None:
+            ham.recorder.record(counter, error)
 
         if error < threshold:
             converged = True
             break
         # Diagonalize the fock operator
         wfn.clear() # discard previous wfn state
-        wfn.update_exp(fock, overlap)
+        with record_section(ham.recorder, 'diagonalize'):
+            wfn.update_exp(fock, overlap)
         # Let the hamiltonian know that the wavefunction has changed.
         ham.clear()
         # Write intermediate results to checkpoint
@@ -189,6 +195,8 @@ def converge_scf_os(ham, maxiter=128, threshold=1e-8, skip_energy=False):
     overlap = ham.system.get_overlap()
     fock_alpha = lf.create_one_body()
     fock_beta = lf.create_one_body()
+    if ham.recorder is not None:
+        ham.recorder.start('plain')
     converged = False
     counter = 0
     while maxiter is None or counter < maxiter:
@@ -202,13 +210,16 @@ def converge_scf_os(ham, maxiter=128, threshold=1e-8, skip_energy=False):
 
         if log.do_medium:
             log('%4i  %12.5e  %12.5e' % (counter, error_alpha, error_beta))
+        if ham.recorder is not None:
+            ham.recorder.record(counter, max(error_alpha, error_beta))
 
         if error_alpha < threshold and error_beta < threshold:
             converged = True
             break
         # Diagonalize the fock operators
         wfn.clear()
-        wfn.update_exp(fock_alpha, fock_beta, overlap)
+        with record_section(ham.recorder, 'diagonalize'):
+            wfn.update_exp(fock_alpha, fock_beta, overlap)
         # Let the hamiltonian know that the wavefunction has changed.
         ham.clear()
         # Write intermediate results to checkpoint
@@ -36,7 +36,7 @@ __all__ = ['converge_scf_cdiis']
 
 
 @timer.with_section('SCF')
-def converge_scf_cdiis(ham, maxiter=128, threshold=1e-6, nvector=6, prune_old_states=False, skip_energy=False, scf_step='regular'):
+def converge_scf_cdiis(ham, maxiter=128, threshold=1e-6, nvector=6, prune_old_states=False, skip_energy=False, scf_step='regular', restart=False, chk_interval=5):
     '''Minimize the energy of the wavefunction with the CDIIS algorithm
 
        **Arguments:**
@@ -67,6 +67,14 @@ def converge_scf_cdiis(ham, maxiter=128, threshold=1e-6, nvector=6, prune_old_st
             create from the DIIS history. This can be 'regular', 'oda2' or
             'oda3'.
 
+       restart
+            When set to True, the SCF is resumed from the state in the
+            checkpoint file of the system, if present. See
+            ``converge_scf_diis_cs`` for more details.
+
+       chk_interval
+            The number of iterations between two checkpoints of the SCF loop.
+
        **Raises:**
 
        NoSCFConvergence
@@ -77,12 +85,12 @@ def converge_scf_cdiis(ham, maxiter=128, threshold=1e-6, nvector=6, prune_old_st
     '''
     log.cite('pulay1980', 'using the commutator DIIS SCF algorithm')
     if isinstance(ham.system.wfn, RestrictedWFN):
-        return converge_scf_cdiis_cs(ham, maxiter, threshold, nvector, prune_old_states, skip_energy, scf_step)
+        return converge_scf_cdiis_cs(ham, maxiter, threshold, nvector, prune_old_states, skip_energy, scf_step, restart, chk_interval)
     else:
         raise NotImplementedError
 
 
-def converge_scf_cdiis_cs(ham, maxiter=128, threshold=1e-6, nvector=6, prune_old_states=False, skip_energy=False, scf_step='regular'):
+def converge_scf_cdiis_cs(ham, maxiter=128, threshold=1e-6, nvector=6, prune_old_states=False, skip_energy=False, scf_step='regular', restart=False, chk_interval=5):
     '''Minimize the energy of the closed-shell wavefunction with CDIIS
 
        **Arguments:**
@@ -113,6 +121,14 @@ def converge_scf_cdiis_cs(ham, maxiter=128, threshold=1e-6, nvector=6, prune_old
             create from the DIIS history. This can be 'regular', 'oda2' or
             'oda3'.
 
+       restart
+            When set to True, the SCF is resumed from the state in the
+            checkpoint file of the system, if present. See
+            ``converge_scf_diis_cs`` for more details.
+
+       chk_interval
+            The number of iterations between two checkpoints of the SCF loop.
+
        **Raises:**
 
        NoSCFConvergence
@@ -122,7 +138,7 @@ def converge_scf_cdiis_cs(ham, maxiter=128, threshold=1e-6, nvector=6, prune_old
        **Returns:** the number of iterations
     '''
     log.cite('pulay1980', 'the use of the commutator DIIS method')
-    return converge_scf_diis_cs(ham, PulayDIISHistory, maxiter, threshold, nvector, prune_old_states, skip_energy, scf_step)
+    return converge_scf_diis_cs(ham, PulayDIISHistory, maxiter, threshold, nvector, prune_old_states, skip_energy, scf_step, restart=restart, chk_interval=chk_interval)
 
 
 class PulayDIISHistory(DIISHistory):
@@ -150,23 +166,27 @@ class PulayDIISHistory(DIISHistory):
         self.cdots.fill(np.nan)
         DIISHistory.__init__(self, lf, nvector, overlap, [self.cdots])
 
-    def _complete_cdots_matrix(self):
-        '''Complete the matrix of dot products between commutators
+    def _update_dots(self, i0):
+        '''Compute the dot products of a new commutator with all previous ones
+
+           **Arguments:**
+
+           i0
+                The index of the new state in the stack.
+        '''
+        self._update_cdots(i0)
+
+    def _update_cdots(self, i0):
+        '''Fill in row and column i0 of self.cdots
 
-           Even after multiple additions, this routine will fill up all the
-           missing dot products in self.cdots.
+           The commutators are stored in the orthonormal basis as the strict
+           upper triangle of an anti-symmetric matrix. Hence the factor two.
         '''
-        for i0 in xrange(self.nused-1, -1, -1):
-            state0 = self.stack[i0]
-            self.cdots[i0,i0] = state0.norm
-            # Compute off-diagonal coefficients
-            for i1 in xrange(i0):
-                if np.isfinite(self.cdots[i0,i1]):
-                    return
-                state1 = self.stack[i1]
-                cdot = state0.commutator.expectation_value(state1.commutator)
-                self.cdots[i0,i1] = cdot
-                self.cdots[i1,i0] = cdot
+        ocommutator0 = self.stack[i0].ocommutator
+        for i1 in xrange(i0+1):
+            cdot = 2*np.dot(ocommutator0, self.stack[i1].ocommutator)
+            self.cdots[i0,i1] = cdot
+            self.cdots[i1,i0] = cdot
 
     def solve(self, dm_output, fock_output):
         '''Extrapolate a new density and/or fock matrix that should have the smallest commutator norm.
@@ -183,8 +203,7 @@ class PulayDIISHistory(DIISHistory):
         '''
         # extrapolation only makes sense if there are two points
         assert self.nused >= 2
-        # Fill in the missing commutators
-        self._complete_cdots_matrix()
+        assert not np.isnan(self.cdots[:self.nused,:self.nused]).any()
         coeffs = solve_cdiis(self.cdots[:self.nused,:self.nused])
         # get a condition number
         absevals = abs(np.linalg.eigvalsh(self.cdots[:self.nused,:self.nused]))
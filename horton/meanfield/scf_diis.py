@@ -26,9 +26,11 @@ from __future__ import absolute_import
 
 import numpy as np
 
-from horton.log import log
+from horton.checkpoint import dump_hdf5_low
+from horton.log import log, timer
 from horton.exceptions import NoSCFConvergence
 from horton.meanfield.convergence import compute_commutator
+from horton.meanfield.recorder import record_section
 from horton.meanfield.scf_oda import find_min_cubic, find_min_quadratic, check_cubic_cs
 
 
@@ -58,7 +60,8 @@ class CSSCFStep(object):
 
         # Construct the new DM (regular SCF step)
         wfn.clear()
-        wfn.update_exp(fock, overlap)
+        with record_section(self.ham.recorder, 'diagonalize'):
+            wfn.update_exp(fock, overlap)
         self.ham.clear()
 
         # Construct the Fock operator for the new DM
@@ -89,7 +92,8 @@ class CSCubicODAStep(CSSCFStep):
             energy0 = self.ham.compute()
 
         wfn.clear()
-        wfn.update_exp(fock0, overlap)
+        with record_section(self.ham.recorder, 'diagonalize'):
+            wfn.update_exp(fock0, overlap)
         # Let the hamiltonian know that the wavefunction has changed.
         self.ham.clear()
 
@@ -134,7 +138,8 @@ class CSCubicODAStep(CSSCFStep):
 
         fock.clear()
         self.ham.compute_fock(fock, None)
-        wfn.update_exp(fock, overlap, dm1)
+        with record_section(self.ham.recorder, 'diagonalize'):
+            wfn.update_exp(fock, overlap, dm1)
 
         # the mixing coefficient
         return mixing
@@ -157,7 +162,8 @@ class CSQuadraticODAStep(CSSCFStep):
             self.ham.compute_fock(fock0, None)
 
         wfn.clear()
-        wfn.update_exp(fock0, overlap)
+        with record_section(self.ham.recorder, 'diagonalize'):
+            wfn.update_exp(fock0, overlap)
         # Let the hamiltonian know that the wavefunction has changed.
         self.ham.clear()
 
@@ -197,13 +203,14 @@ class CSQuadraticODAStep(CSSCFStep):
 
         fock.clear()
         self.ham.compute_fock(fock, None)
-        wfn.update_exp(fock, overlap, dm1)
+        with record_section(self.ham.recorder, 'diagonalize'):
+            wfn.update_exp(fock, overlap, dm1)
 
         # the mixing coefficient
         return mixing
 
 
-def converge_scf_diis_cs(ham, DIISHistoryClass, maxiter=128, threshold=1e-6, nvector=6, prune_old_states=False, skip_energy=False, scf_step='regular'):
+def converge_scf_diis_cs(ham, DIISHistoryClass, maxiter=128, threshold=1e-6, nvector=6, prune_old_states=False, skip_energy=False, scf_step='regular', restart=False, chk_interval=5):
     '''Minimize the energy of the closed-shell wavefunction with EDIIS
 
        **Arguments:**
@@ -239,6 +246,24 @@ def converge_scf_diis_cs(ham, DIISHistoryClass, maxiter=128, threshold=1e-6, nve
             create from the DIIS history. This can be 'regular', 'oda2' or
             'oda3'.
 
+       restart
+            When set to True, the DIIS history, the current (interpolated)
+            density and Fock matrices and the iteration counter are restored
+            from the checkpoint file of the system, if present. The density
+            matrix in the wavefunction is replaced by the one in the
+            checkpoint, such that the loop resumes from exactly that state.
+
+       chk_interval
+            The number of iterations between two checkpoints of the SCF loop.
+
+       When the system has a checkpoint file, the state of the SCF loop is
+       written to the group ``scf_diis`` every ``chk_interval`` iterations and
+       when the loop stops without convergence. Each checkpoint rewrites the
+       entire DIIS history, i.e. a few matrices of nbasis x nbasis for each
+       of the nvector states, which becomes a considerable amount of I/O for
+       large basis sets. A restart repeats at most ``chk_interval-1``
+       iterations. The group is removed again after convergence.
+
        **Raises:**
 
        NoSCFConvergence
@@ -247,6 +272,9 @@ def converge_scf_diis_cs(ham, DIISHistoryClass, maxiter=128, threshold=1e-6, nve
 
        **Returns:** the number of iterations
     '''
+    if chk_interval < 1:
+        raise ValueError('The checkpoint interval must be at least one iteration.')
+
     # allocated and define some one body operators
     lf = ham.system.lf
     wfn = ham.system.wfn
@@ -268,14 +296,25 @@ def converge_scf_diis_cs(ham, DIISHistoryClass, maxiter=128, threshold=1e-6, nve
     # Get rid of outdated stuff
     ham.clear()
 
+    chk = ham.system.chk
+    counter = 0
+    if restart and chk is not None and 'scf_diis' in chk:
+        counter = load_diis_chk(chk['scf_diis'], history, fock, dm)
+        wfn.clear()
+        wfn.update_dm('alpha', dm)
+
     if log.do_medium:
-        log('Starting restricted closed-shell %s-SCF' % history.name)
+        if counter > 0:
+            log('Restarting restricted closed-shell %s-SCF at iteration %i' % (history.name, counter))
+        else:
+            log('Starting restricted closed-shell %s-SCF' % history.name)
         log.hline()
         log('Iter  Error(alpha) CN(alpha)  Last(alpha) nv Method          Energy       Change')
         log.hline()
 
+    if ham.recorder is not None:
+        ham.recorder.start(history.name.lower())
     converged = False
-    counter = 0
     while maxiter is None or counter < maxiter:
         # Construct the Fock operator from scratch:
         if history.nused == 0:
@@ -285,9 +324,13 @@ def converge_scf_diis_cs(ham, DIISHistoryClass, maxiter=128, threshold=1e-6, nve
             # Put this state also in the history
             energy = ham.compute() if history.need_energy else None
             # Add the current fock+dm pair to the history
-            error = history.add(energy, wfn.dm_alpha, fock)
+            with record_section(ham.recorder, 'diis_add'):
+                error = history.add(energy, wfn.dm_alpha, fock)
             if log.do_high:
                 log('          DIIS add')
+            # The initial Fock build is recorded separately, as iteration -1.
+            if ham.recorder is not None:
+                ham.recorder.record(-1, error, energy)
             if error < threshold:
                 converged = True
                 break
@@ -321,10 +364,13 @@ def converge_scf_diis_cs(ham, DIISHistoryClass, maxiter=128, threshold=1e-6, nve
         # Add the current (dm, fock) pair to the history
         if log.do_high:
             log('          DIIS add')
-        error = history.add(energy, wfn.dm_alpha, fock)
+        with record_section(ham.recorder, 'diis_add'):
+            error = history.add(energy, wfn.dm_alpha, fock)
 
         # break when converged
         if error < threshold:
+            if ham.recorder is not None:
+                ham.recorder.record(counter, error, energy)
             converged = True
             break
 
@@ -340,7 +386,8 @@ def converge_scf_diis_cs(ham, DIISHistoryClass, maxiter=128, threshold=1e-6, nve
 
         # get extra/intra-polated Fock matrix
         while True:
-            energy_approx, coeffs, cn, method = history.solve(dm, fock)
+            with timer.section('DIIS solve'), record_section(ham.recorder, 'diis_solve'):
+                energy_approx, coeffs, cn, method = history.solve(dm, fock)
             #if coeffs[coeffs<0].sum() < -1:
             #    if log.do_high:
             #        log('          DIIS (coeffs too negative) -> drop %i and retry' % history.stack[0].identity)
@@ -410,14 +457,30 @@ def converge_scf_diis_cs(ham, DIISHistoryClass, maxiter=128, threshold=1e-6, nve
                 else:
                     break
 
+        # The record of this iteration includes the DIIS solve.
+        if ham.recorder is not None:
+            ham.recorder.record(counter, error, energy)
+
         # counter
         counter += 1
 
+        # Write the state of the SCF loop to the checkpoint
+        if chk is not None and counter % chk_interval == 0:
+            dump_diis_chk(chk, history, fock, wfn.dm_alpha, counter)
+
     if log.do_medium:
         if converged:
             log('%4i %12.5e (converged)' % (counter, error))
         log.blank()
 
+    if chk is not None:
+        if converged:
+            if 'scf_diis' in chk:
+                del chk['scf_diis']
+        elif 'scf_diis' not in chk or chk['scf_diis'].attrs['counter'] != counter:
+            # Always keep the last state when no convergence is reached.
+            dump_diis_chk(chk, history, fock, wfn.dm_alpha, counter)
+
     if not skip_energy or history.need_energy:
         if not history.need_energy:
             ham.compute()
@@ -430,9 +493,66 @@ def converge_scf_diis_cs(ham, DIISHistoryClass, maxiter=128, threshold=1e-6, nve
     return counter
 
 
+def dump_diis_chk(chk, history, fock, dm, counter):
+    '''Write the state of a DIIS SCF loop to a checkpoint file
+
+       **Arguments:**
+
+       chk
+            An HDF5 group of a checkpoint file. The state is written to the
+            subgroup ``scf_diis``.
+
+       history
+            A DIISHistory instance.
+
+       fock
+            The current (interpolated) Fock matrix.
+
+       dm
+            The current (interpolated) density matrix.
+
+       counter
+            The iteration counter.
+
+       The wavefunction in the checkpoint file is written at a different
+       point in the SCF loop, so the density matrix is stored here as well.
+    '''
+    dump_hdf5_low(chk, 'scf_diis', history)
+    grp = chk['scf_diis']
+    fock.to_hdf5(grp.create_group('fock'))
+    dm.to_hdf5(grp.create_group('dm'))
+    grp.attrs['counter'] = counter
+
+
+def load_diis_chk(grp, history, fock, dm):
+    '''Restore the state of a DIIS SCF loop from a checkpoint file
+
+       **Arguments:**
+
+       grp
+            The HDF5 group written by ``dump_diis_chk``.
+
+       history
+            An empty DIISHistory instance, of the same type as the one that was
+            written, to be filled in.
+
+       fock
+            The output for the current (interpolated) Fock matrix.
+
+       dm
+            The output for the current (interpolated) density matrix.
+
+       **Returns:** the iteration counter.
+    '''
+    history.read_from_hdf5(grp)
+    fock.read_from_hdf5(grp['fock'])
+    dm.read_from_hdf5(grp['dm'])
+    return int(grp.attrs['counter'])
+
+
 class DIISState(object):
     '''A single record (vector) in a DIIS history object.'''
-    def __init__(self, lf, work, overlap):
+    def __init__(self, lf, work, commutator, overlap, orthogonalizer):
         '''
            **Arguments:**
 
@@ -443,17 +563,31 @@ class DIISState(object):
                 A one body operator to be used as a temporary variable. This
                 object is allocated by the history object.
 
+           commutator
+                A one body operator in which the commutator is computed. This
+                object is allocated by the history object and shared by all
+                states.
+
            overlap
                 The overlap matrix.
+
+           orthogonalizer
+                The (symmetric) matrix that transforms an operator to the
+                orthonormal (Löwdin) basis, i.e. S^{-1/2}.
         '''
         # Not all of these need to be used.
         self.work = work
+        self.commutator = commutator
         self.overlap = overlap
+        self.orthogonalizer = orthogonalizer
         self.energy = np.nan
         self.norm = np.nan
         self.dm = lf.create_one_body()
         self.fock = lf.create_one_body()
-        self.commutator = lf.create_one_body()
+        # The commutator is anti-symmetric in the orthonormal basis, so only
+        # the strict upper triangle is stored as a flat vector.
+        nbasis = len(orthogonalizer)
+        self.ocommutator = np.zeros((nbasis*(nbasis-1))//2)
         self.identity = None # every state has a different id.
 
     def clear(self):
@@ -462,7 +596,7 @@ class DIISState(object):
         self.norm = np.nan
         self.dm.clear()
         self.fock.clear()
-        self.commutator.clear()
+        self.ocommutator[:] = 0.0
 
     def assign(self, identity, energy, dm, fock):
         '''Assign a new state.
@@ -486,7 +620,30 @@ class DIISState(object):
         self.dm.assign(dm)
         self.fock.assign(fock)
         compute_commutator(dm, fock, self.overlap, self.work, self.commutator)
+        # The norm (used as convergence criterion) is computed in the original
+        # basis to be consistent with convergence_error_commutator.
         self.norm = self.commutator.expectation_value(self.commutator)
+        # Store the commutator in the orthonormal basis for the DIIS equations.
+        ortho = self.orthogonalizer
+        ocommutator = np.dot(ortho, np.dot(self.commutator._array, ortho))
+        self.ocommutator[:] = ocommutator[np.triu_indices(len(ortho), 1)]
+
+    def to_hdf5(self, grp):
+        grp.attrs['identity'] = self.identity
+        if self.energy is not None:
+            grp.attrs['energy'] = self.energy
+        self.dm.to_hdf5(grp.create_group('dm'))
+        self.fock.to_hdf5(grp.create_group('fock'))
+
+    def read_from_hdf5(self, grp):
+        '''Restore a state written with ``to_hdf5``.
+
+           The commutator and its norm are recomputed.
+        '''
+        self.dm.read_from_hdf5(grp['dm'])
+        self.fock.read_from_hdf5(grp['fock'])
+        energy = grp.attrs.get('energy')
+        self.assign(int(grp.attrs['identity']), energy, self.dm, self.fock)
 
 
 class DIISHistory(object):
@@ -508,7 +665,9 @@ class DIISHistory(object):
                 The overlap matrix of the system.
 
            dots_matrices
-                Matrices in which dot products will be stored
+                Matrices in which dot products will be stored. These are kept
+                up to date in a rolling fashion: each call to ``add`` only
+                computes the dot products that involve the new state.
 
            **Useful attributes:**
 
@@ -516,12 +675,16 @@ class DIISHistory(object):
                 The actual number of vectors in the history.
         '''
         self.work = lf.create_one_body()
-        self.stack = [DIISState(lf, self.work, overlap) for i in xrange(nvector)]
+        self.commutator = lf.create_one_body()
+        self.orthogonalizer = compute_orthogonalizer(overlap)
+        self.stack = [
+            DIISState(lf, self.work, self.commutator, overlap, self.orthogonalizer)
+            for i in xrange(nvector)
+        ]
         self.overlap = overlap
         self.dots_matrices = dots_matrices
         self.nused = 0
         self.idcounter = 0
-        self.commutator = lf.create_one_body()
 
     def _get_nvector(self):
         '''The maximum size of the history'''
@@ -555,6 +718,7 @@ class DIISHistory(object):
             dots[-1] = np.nan
             dots[:,-1] = np.nan
 
+    @timer.with_section('DIIS add')
     def add(self, energy, dm, fock):
         '''Add new state to the history.
 
@@ -578,10 +742,56 @@ class DIISHistory(object):
         state.assign(self.idcounter, energy, dm, fock)
         self.idcounter += 1
 
+        # compute the new row in the matrices with dot products
+        self._update_dots(self.nused)
+
         # prepare for next iteration
         self.nused += 1
         return np.sqrt(state.norm)
 
+    def to_hdf5(self, grp):
+        grp.attrs['nused'] = self.nused
+        grp.attrs['idcounter'] = self.idcounter
+        for i in xrange(self.nused):
+            self.stack[i].to_hdf5(grp.create_group('state%i' % i))
+        for i, dots in enumerate(self.dots_matrices):
+            grp['dots%i' % i] = dots
+
+    def read_from_hdf5(self, grp):
+        '''Restore a history written with ``to_hdf5``.
+
+           **Arguments:**
+
+           grp
+                An HDF5 group.
+        '''
+        if grp.attrs['class'] != self.__class__.__name__:
+            raise TypeError('The class of the DIIS history in the HDF5 file does not match.')
+        nused = int(grp.attrs['nused'])
+        if nused > self.nvector or grp['dots0'].shape != self.dots_matrices[0].shape:
+            raise TypeError('The size of the DIIS history in the HDF5 file does not match.')
+        for state in self.stack:
+            state.clear()
+        for i in xrange(nused):
+            self.stack[i].read_from_hdf5(grp['state%i' % i])
+        for i, dots in enumerate(self.dots_matrices):
+            grp['dots%i' % i].read_direct(dots)
+        self.nused = nused
+        self.idcounter = int(grp.attrs['idcounter'])
+
+    def _update_dots(self, i0):
+        '''Compute the dot products of a new state with all previous states
+
+           **Arguments:**
+
+           i0
+                The index of the new state in the stack.
+
+           This method is overridden in subclasses to fill in the relevant
+           row (and column) of the dots matrices.
+        '''
+        pass
+
     def _build_combinations(self, coeffs, dm_output, fock_output):
         '''Construct a linear combination of density/fock matrices'''
         if dm_output is not None:
@@ -594,3 +804,17 @@ class DIISHistory(object):
         output.clear()
         for i in xrange(self.nused):
             output.iadd(ops[i], factor=coeffs[i])
+
+
+def compute_orthogonalizer(overlap):
+    '''Compute the Löwdin orthogonalization matrix, S^{-1/2}
+
+       **Arguments:**
+
+       overlap
+            The overlap matrix, a OneBody object.
+
+       **Returns:** a symmetric numpy array.
+    '''
+    evals, evecs = np.linalg.eigh(overlap._array)
+    return np.dot(evecs*evals**-0.5, evecs.T)
@@ -36,7 +36,7 @@ __all__ = ['converge_scf_ediis']
 
 
 @timer.with_section('SCF')
-def converge_scf_ediis(ham, maxiter=128, threshold=1e-6, nvector=6, prune_old_states=False, scf_step='regular'):
+def converge_scf_ediis(ham, maxiter=128, threshold=1e-6, nvector=6, prune_old_states=False, scf_step='regular', restart=False, chk_interval=5):
     '''Minimize the energy of the wavefunction with the EDIIS algorithm
 
        **Arguments:**
@@ -64,6 +64,14 @@ def converge_scf_ediis(ham, maxiter=128, threshold=1e-6, nvector=6, prune_old_st
             create from the DIIS history. This can be 'regular', 'oda2' or
             'oda3'.
 
+       restart
+            When set to True, the SCF is resumed from the state in the
+            checkpoint file of the system, if present. See
+            ``converge_scf_diis_cs`` for more details.
+
+       chk_interval
+            The number of iterations between two checkpoints of the SCF loop.
+
        **Raises:**
 
        NoSCFConvergence
@@ -74,12 +82,12 @@ def converge_scf_ediis(ham, maxiter=128, threshold=1e-6, nvector=6, prune_old_st
     '''
     log.cite('kudin2002', 'using the energy DIIS SCF algorithm')
     if isinstance(ham.system.wfn, RestrictedWFN):
-        return converge_scf_ediis_cs(ham, maxiter, threshold, nvector, prune_old_states, scf_step)
+        return converge_scf_ediis_cs(ham, maxiter, threshold, nvector, prune_old_states, scf_step, restart, chk_interval)
     else:
         raise NotImplementedError
 
 
-def converge_scf_ediis_cs(ham, maxiter=128, threshold=1e-6, nvector=6, prune_old_states=False, scf_step='regular'):
+def converge_scf_ediis_cs(ham, maxiter=128, threshold=1e-6, nvector=6, prune_old_states=False, scf_step='regular', restart=False, chk_interval=5):
     '''Minimize the energy of the closed-shell wavefunction with EDIIS
 
        **Arguments:**
@@ -107,6 +115,14 @@ def converge_scf_ediis_cs(ham, maxiter=128, threshold=1e-6, nvector=6, prune_old
             create from the DIIS history. This can be 'regular', 'oda2' or
             'oda3'.
 
+       restart
+            When set to True, the SCF is resumed from the state in the
+            checkpoint file of the system, if present. See
+            ``converge_scf_diis_cs`` for more details.
+
+       chk_interval
+            The number of iterations between two checkpoints of the SCF loop.
+
        **Raises:**
 
        NoSCFConvergence
@@ -116,7 +132,7 @@ def converge_scf_ediis_cs(ham, maxiter=128, threshold=1e-6, nvector=6, prune_old
        **Returns:** the number of iterations
     '''
     log.cite('kudin2002', 'the use of the EDIIS method.')
-    return converge_scf_diis_cs(ham, EnergyDIISHistory, maxiter, threshold, nvector, prune_old_states, scf_step)
+    return converge_scf_diis_cs(ham, EnergyDIISHistory, maxiter, threshold, nvector, prune_old_states, scf_step, restart=restart, chk_interval=chk_interval)
 
 
 class EnergyDIISHistory(DIISHistory):
@@ -143,24 +159,25 @@ class EnergyDIISHistory(DIISHistory):
         self.edots.fill(np.nan)
         DIISHistory.__init__(self, lf, nvector, overlap, [self.edots])
 
-    def _complete_edots_matrix(self):
-        '''Complete the matrix of dot products between density and fock matrices
+    def _update_dots(self, i0):
+        '''Compute the dot products of a new state with all previous states
 
-           Even after multiple additions, this routine will fill up all the
-           missing dot products in self.edots.
+           **Arguments:**
+
+           i0
+                The index of the new state in the stack.
         '''
-        # This routine  even works after multiple additions.
-        for i0 in xrange(self.nused-1, -1, -1):
-            if np.isfinite(self.edots[i0,i0]):
-                return
-            # Compute off-diagonal coefficients
-            state0 = self.stack[i0]
-            for i1 in xrange(i0+1):
-                state1 = self.stack[i1]
-                self.edots[i0,i1] = state0.fock.expectation_value(state1.dm)
-                if i0 != i1:
-                    # Note that this matrix is not symmetric!
-                    self.edots[i1,i0] = state0.dm.expectation_value(state1.fock)
+        self._update_edots(i0)
+
+    def _update_edots(self, i0):
+        '''Fill in row and column i0 of self.edots'''
+        state0 = self.stack[i0]
+        for i1 in xrange(i0+1):
+            state1 = self.stack[i1]
+            self.edots[i0,i1] = state0.fock.expectation_value(state1.dm)
+            if i0 != i1:
+                # Note that this matrix is not symmetric!
+                self.edots[i1,i0] = state0.dm.expectation_value(state1.fock)
 
     def _setup_equations(self):
         b = np.zeros((self.nused, self.nused), float)
@@ -188,8 +205,6 @@ class EnergyDIISHistory(DIISHistory):
         '''
         # interpolation only makes sense if there are two points
         assert self.nused >= 2
-        # Fill in the missing commutators
-        self._complete_edots_matrix()
         assert not np.isnan(self.edots[:self.nused,:self.nused]).any()
         # Setup the equations
         b, e = self._setup_equations()
@@ -38,7 +38,7 @@ __all__ = ['converge_scf_ediis2']
 
 
 @timer.with_section('SCF')
-def converge_scf_ediis2(ham, maxiter=128, threshold=1e-6, nvector=6, prune_old_states=False, scf_step='regular'):
+def converge_scf_ediis2(ham, maxiter=128, threshold=1e-6, nvector=6, prune_old_states=False, scf_step='regular', restart=False, chk_interval=5):
     '''Minimize the energy of the wavefunction with the EDIIS+DIIS algorithm
 
        **Arguments:**
@@ -66,6 +66,14 @@ def converge_scf_ediis2(ham, maxiter=128, threshold=1e-6, nvector=6, prune_old_s
             create from the DIIS history. This can be 'regular', 'oda2' or
             'oda3'.
 
+       restart
+            When set to True, the SCF is resumed from the state in the
+            checkpoint file of the system, if present. See
+            ``converge_scf_diis_cs`` for more details.
+
+       chk_interval
+            The number of iterations between two checkpoints of the SCF loop.
+
        **Raises:**
 
        NoSCFConvergence
@@ -76,12 +84,12 @@ def converge_scf_ediis2(ham, maxiter=128, threshold=1e-6, nvector=6, prune_old_s
     '''
     log.cite('kudin2002', 'using the EDIIS+DIIS SCF algorithm')
     if isinstance(ham.system.wfn, RestrictedWFN):
-        return converge_scf_ediis2_cs(ham, maxiter, threshold, nvector, prune_old_states, scf_step)
+        return converge_scf_ediis2_cs(ham, maxiter, threshold, nvector, prune_old_states, scf_step, restart, chk_interval)
     else:
         raise NotImplementedError
 
 
-def converge_scf_ediis2_cs(ham, maxiter=128, threshold=1e-6, nvector=6, prune_old_states=False, scf_step='regular'):
+def converge_scf_ediis2_cs(ham, maxiter=128, threshold=1e-6, nvector=6, prune_old_states=False, scf_step='regular', restart=False, chk_interval=5):
     '''Minimize the energy of the closed-shell wavefunction with EDIIS+DIIS
 
        **Arguments:**
@@ -109,6 +117,14 @@ def converge_scf_ediis2_cs(ham, maxiter=128, threshold=1e-6, nvector=6, prune_ol
             create from the DIIS history. This can be 'regular', 'oda2' or
             'oda3'.
 
+       restart
+            When set to True, the SCF is resumed from the state in the
+            checkpoint file of the system, if present. See
+            ``converge_scf_diis_cs`` for more details.
+
+       chk_interval
+            The number of iterations between two checkpoints of the SCF loop.
+
        **Raises:**
 
        NoSCFConvergence
@@ -118,7 +134,7 @@ def converge_scf_ediis2_cs(ham, maxiter=128, threshold=1e-6, nvector=6, prune_ol
        **Returns:** the number of iterations
     '''
     log.cite('kudin2002', 'For the use of the EDIIS+DIIS method.')
-    return converge_scf_diis_cs(ham, EnergyDIIS2History, maxiter, threshold, nvector, prune_old_states, scf_step)
+    return converge_scf_diis_cs(ham, EnergyDIIS2History, maxiter, threshold, nvector, prune_old_states, scf_step, restart=restart, chk_interval=chk_interval)
 
 
 class EnergyDIIS2History(EnergyDIISHistory, PulayDIISHistory):
@@ -151,6 +167,17 @@ class EnergyDIIS2History(EnergyDIISHistory, PulayDIISHistory):
         self.cdots.fill(np.nan)
         DIISHistory.__init__(self, lf, nvector, overlap, [self.edots, self.cdots])
 
+    def _update_dots(self, i0):
+        '''Compute the dot products of a new state with all previous states
+
+           **Arguments:**
+
+           i0
+                The index of the new state in the stack.
+        '''
+        self._update_edots(i0)
+        self._update_cdots(i0)
+
     def solve(self, dm_output, fock_output):
         '''Extrapolate a new density and/or fock matrix that should have the smallest commutator norm.
 
@@ -28,6 +28,7 @@ import numpy as np
 
 from horton.log import log, timer
 from horton.exceptions import NoSCFConvergence
+from horton.meanfield.recorder import record_section
 from horton.meanfield.wfn import RestrictedWFN, UnrestrictedWFN, check_dm
 
 
@@ -250,6 +251,8 @@ def converge_scf_oda_cs(ham, maxiter=128, threshold=1e-6, debug=False):
     if 'dm_alpha' in wfn._cache:
         check_dm(wfn.dm_alpha, overlap, lf, 'alpha')
 
+    if ham.recorder is not None:
+        ham.recorder.start('oda')
     counter = 0
     while maxiter is None or counter < maxiter:
         # A) Construct Fock operator, compute energy and keep dm at current/initial point
@@ -266,7 +269,8 @@ def converge_scf_oda_cs(ham, maxiter=128, threshold=1e-6, debug=False):
 
         # B) Diagonalize fock operator and go to the next point
         wfn.clear()
-        wfn.update_exp(fock0, overlap)
+        with record_section(ham.recorder, 'diagonalize'):
+            wfn.update_exp(fock0, overlap)
         # Let the hamiltonian know that the wavefunction has changed.
         ham.clear()
 
@@ -308,6 +312,8 @@ def converge_scf_oda_cs(ham, maxiter=128, threshold=1e-6, debug=False):
         ham.clear()
 
         error = dm2.distance(dm0)
+        if ham.recorder is not None:
+            ham.recorder.record(counter, error, energy0)
         if error < threshold:
             #if abs(energy0_deriv) > threshold:
             #    raise RuntimeError('The ODA algorithm stopped a point with non-zero gradient.')
@@ -462,6 +468,8 @@ def converge_scf_oda_os(ham, maxiter=128, threshold=1e-6, debug=False):
     if 'dm_beta' in wfn._cache:
         check_dm(wfn.dm_beta, overlap, lf, 'beta')
 
+    if ham.recorder is not None:
+        ham.recorder.start('oda')
     counter = 0
     while maxiter is None or counter < maxiter:
         # A) Construct Fock operator, compute energy and keep dm at current/initial point
@@ -480,7 +488,8 @@ def converge_scf_oda_os(ham, maxiter=128, threshold=1e-6, debug=False):
 
         # B) Diagonalize fock operator and go to state 1
         wfn.clear()
-        wfn.update_exp(fock0a, fock0b, overlap)
+        with record_section(ham.recorder, 'diagonalize'):
+            wfn.update_exp(fock0a, fock0b, overlap)
         # Let the hamiltonian know that the wavefunction has changed.
         ham.clear()
 
@@ -531,6 +540,8 @@ def converge_scf_oda_os(ham, maxiter=128, threshold=1e-6, debug=False):
 
         errora = dm2a.distance(dm0a)
         errorb = dm2b.distance(dm0b)
+        if ham.recorder is not None:
+            ham.recorder.record(counter, max(errora, errorb), energy0)
         if errora < threshold and errorb < threshold:
             if abs(energy0_deriv) > threshold:
                 raise RuntimeError('The ODA algorithm stopped a point with non-zero gradient.')
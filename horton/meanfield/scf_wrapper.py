@@ -27,6 +27,8 @@ from __future__ import absolute_import
 __all__ = ['SCFWrapper']
 
 
+from horton.grid.molgrid import BeckeMolGrid
+from horton.log import log
 from horton.meanfield.scf import converge_scf
 from horton.meanfield.scf_oda import converge_scf_oda
 from horton.meanfield.scf_cdiis import converge_scf_cdiis
@@ -63,12 +65,24 @@ class SCFWrapper(object):
            method
                 The SCF method. Select from: %s
 
-           **Optional arguments:** depends on the SCF method. Check the
+           **Optional arguments:**
+
+           grid_schedule
+                A list of (agspec, threshold) pairs. When given, the SCF starts
+                on a BeckeMolGrid with the first atomic grid specification
+                until the convergence error drops below the corresponding
+                threshold. Then it continues with the next pair. Finally, the
+                SCF is converged on the original grid of the Hamiltonian. This
+                is only used for Hamiltonians with a BeckeMolGrid. Example:
+                ``[('coarse', 1e-3)]``.
+
+           All other optional arguments depend on the SCF method. Check the
            documentation of the selected method for available options.
         ''' % (', '.join(self.available_methods))
         if method not in self.available_methods:
             raise ValueError('Unknown SCF method: %s' % method)
         self.method = method
+        self.grid_schedule = kwargs.pop('grid_schedule', None)
         self.kwargs = kwargs
 
     def __call__(self, ham):
@@ -79,7 +93,34 @@ class SCFWrapper(object):
 
            **Returns:** the number of iterations
         '''
-        return self.available_methods[self.method](ham, **self.kwargs)
+        fn = self.available_methods[self.method]
+        if self.grid_schedule is None or ham.grid is None:
+            return fn(ham, **self.kwargs)
+
+        final_grid = ham.grid
+        if not isinstance(final_grid, BeckeMolGrid):
+            raise TypeError('A grid schedule can only be used with a BeckeMolGrid.')
+        niter = 0
+        try:
+            for agspec, threshold in self.grid_schedule:
+                grid = BeckeMolGrid(ham.system, agspec, final_grid.k, final_grid.random_rotate,
+                                    scheme=final_grid.scheme, seed=final_grid.seed,
+                                    prune=final_grid.prune)
+                self._switch_grid(ham, grid)
+                kwargs = self.kwargs.copy()
+                kwargs['threshold'] = threshold
+                niter += fn(ham, **kwargs)
+        finally:
+            # Always restore the original grid, also when the SCF fails.
+            self._switch_grid(ham, final_grid)
+        niter += fn(ham, **self.kwargs)
+        return niter
+
+    def _switch_grid(self, ham, grid):
+        ham.update_grid(grid)
+        if log.do_medium:
+            log('SCF continues on the %s grid with %i points.' % (grid.agspec.name, grid.size))
+            log.blank()
 
     def convergence_error(self, ham):
         return self.error_measures[self.method](ham)
@@ -0,0 +1,71 @@
+# -*- coding: utf-8 -*-
+# Horton is a development platform for electronic structure methods.
+# Copyright (C) 2011-2013 Toon Verstraelen <Toon.Verstraelen@UGent.be>
+#
+# This file is part of Horton.
+#
+# Horton is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 3
+# of the License, or (at your option) any later version.
+#
+# Horton is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, see <http://www.gnu.org/licenses/>
+#
+#--
+#pylint: skip-file
+
+
+from __future__ import print_function
+from __future__ import division
+from __future__ import absolute_import
+import os, shutil, h5py as h5
+from nose.tools import assert_raises
+from horton import *
+from horton.test.common import tmpdir
+
+
+def test_batch_hf_water():
+    fn_xyz = context.get_fn('test/water.xyz')
+
+    # Reference computation
+    sys = System.from_file(fn_xyz, obasis='sto-3g')
+    setup_mean_field_wfn(sys, charge=0)
+    guess_hamiltonian_core(sys)
+    ham = Hamiltonian(sys, [HartreeFockExchange()])
+    converge_scf_cdiis(ham, threshold=1e-8)
+    energy_ref = ham.compute()
+
+    with tmpdir('horton.meanfield.test.test_batch.test_batch_hf_water') as dn:
+        fns_xyz = []
+        for name in 'foo', 'bar':
+            fns_xyz.append(os.path.join(dn, '%s.xyz' % name))
+            shutil.copy(fn_xyz, fns_xyz[-1])
+        fns_xyz.append(os.path.join(dn, 'missing.xyz'))
+        fn_h5 = os.path.join(dn, 'out.h5')
+        nfail = run_scf_batch(fns_xyz, fn_h5, 'hf', 'sto-3g', scf_kwargs={'threshold': 1e-8}, nproc=2)
+        assert nfail == 1
+        with h5.File(fn_h5, 'r') as f:
+            for name in 'foo', 'bar':
+                grp = f[name]
+                assert abs(grp['energy'][()] - energy_ref) < 1e-6
+                assert grp['niter'][()] > 0
+                assert grp['orb_energies_alpha'].shape == (sys.obasis.nbasis,)
+                assert grp.attrs['wall_time'] > 0
+                assert 'error' not in grp.attrs
+            assert 'error' in f['missing'].attrs
+
+        # Existing results are not recomputed
+        assert run_scf_batch(fns_xyz[:2], fn_h5, 'hf', 'sto-3g', nproc=1) == 0
+
+        with assert_raises(ValueError):
+            run_scf_batch([fn_xyz, fn_xyz], fn_h5)
+        with assert_raises(ValueError):
+            run_scf_batch(fns_xyz, fn_h5, 'foo')
+        with assert_raises(ValueError):
+            run_scf_batch(fns_xyz, fn_h5, nthread=0)
@@ -26,6 +26,7 @@ from __future__ import division
 from __future__ import absolute_import
 import numpy as np
 from horton import *
+from horton.part.test.common import get_proatomdb_hf_sto3g
 
 
 def test_guess_hamcore_cs():
@@ -47,3 +48,42 @@ def test_guess_hamcore_os():
     assert (sys.wfn.exp_alpha.energies.argsort() == np.arange(sys.obasis.nbasis)).all()
     assert abs(sys.wfn.exp_alpha.energies - sys.wfn.exp_beta.energies).max() < 1e-10
     assert abs(sys.wfn.exp_alpha.coeffs - sys.wfn.exp_beta.coeffs).max() < 1e-10
+
+
+def check_guess_sad(restricted):
+    fn_xyz = context.get_fn('test/water.xyz')
+    sys = System.from_file(fn_xyz, obasis='sto-3g')
+    setup_mean_field_wfn(sys, restricted=restricted)
+    ham = Hamiltonian(sys, [HartreeFockExchange()])
+    olp = sys.get_overlap()
+
+    # Energy of the core guess
+    guess_hamiltonian_core(sys)
+    ham.clear()
+    energy_core = ham.compute()
+
+    # Energy of the SAD guess
+    proatomdb = get_proatomdb_hf_sto3g()
+    guess_density_sad(sys, proatomdb)
+    assert abs(sys.wfn.dm_full.expectation_value(olp) - 10) < 1e-8
+    sys.wfn.check_normalization(olp)
+    # The SAD density matrix is not idempotent
+    dm_alpha = sys.wfn.dm_alpha
+    dm_test = dm_alpha.copy()
+    dm_test.idot(olp)
+    dm_test.idot(dm_alpha)
+    assert dm_test.distance(dm_alpha) > 1e-3
+    ham.clear()
+    energy_sad = ham.compute()
+    assert energy_sad < energy_core
+
+    # The SAD guess must be a valid starting point for the SCF
+    converge_scf_oda(ham)
+
+
+def test_guess_sad_cs():
+    check_guess_sad(True)
+
+
+def test_guess_sad_os():
+    check_guess_sad(False)
@@ -266,6 +266,25 @@ def test_add_term():
     assert term._hamiltonian is ham
 
 
+def test_update_grid():
+    fn_fchk = context.get_fn('test/water_hfs_321g.fchk')
+    sys = System.from_file(fn_fchk)
+    grid1 = BeckeMolGrid(sys, 'coarse', random_rotate=False)
+    ham = Hamiltonian(sys, [DiracExchange()], grid1)
+    energy1 = ham.compute()
+    assert ham.cache.load('rho_alpha').shape == (grid1.size,)
+    grid2 = BeckeMolGrid(sys, 'fine', random_rotate=False)
+    ham.update_grid(grid2)
+    assert ham.grid is grid2
+    assert sys.grid is grid2
+    assert 'rho_alpha' not in ham.cache
+    energy2 = ham.compute()
+    assert ham.cache.load('rho_alpha').shape == (grid2.size,)
+    assert abs(energy1 - energy2) < 1e-3
+    with assert_raises(TypeError):
+        ham.update_grid(None)
+
+
 def test_ghost_hf():
     fn_fchk = context.get_fn('test/water_dimer_ghost.fchk')
     sys = System.from_file(fn_fchk)
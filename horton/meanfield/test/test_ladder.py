@@ -0,0 +1,64 @@
+# -*- coding: utf-8 -*-
+# Horton is a development platform for electronic structure methods.
+# Copyright (C) 2011-2013 Toon Verstraelen <Toon.Verstraelen@UGent.be>
+#
+# This file is part of Horton.
+#
+# Horton is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 3
+# of the License, or (at your option) any later version.
+#
+# Horton is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, see <http://www.gnu.org/licenses/>
+#
+#--
+#pylint: skip-file
+
+
+from __future__ import print_function
+from __future__ import division
+from __future__ import absolute_import
+import numpy as np
+from horton import *
+
+
+def test_ladder_hf_water():
+    fn_xyz = context.get_fn('test/water.xyz')
+    scf_wrapper = SCFWrapper('cdiis', threshold=1e-8)
+
+    # Reference computation directly in the target basis
+    sys = System.from_file(fn_xyz, obasis='cc-pvdz')
+    setup_mean_field_wfn(sys, charge=0)
+    guess_hamiltonian_core(sys)
+    ham = Hamiltonian(sys, [HartreeFockExchange()])
+    scf_wrapper(ham)
+    energy_ref = ham.compute()
+
+    # Same computation with a basis set ladder
+    sys = System.from_file(fn_xyz, obasis='cc-pvdz')
+    setup_mean_field_wfn(sys, charge=0)
+    ham = converge_scf_ladder(sys, lambda: [HartreeFockExchange()], scf_wrapper, 'sto-3g')
+    assert ham.system is sys
+    assert sys.obasis.nbasis > 7
+    assert sys.wfn.nbasis == sys.obasis.nbasis
+    assert scf_wrapper.convergence_error(ham) < 1e-8
+    energy = ham.compute()
+    assert abs(energy - energy_ref) < 1e-6
+
+
+def test_ladder_hfs_water():
+    fn_xyz = context.get_fn('test/water.xyz')
+    sys = System.from_file(fn_xyz, obasis='cc-pvdz')
+    setup_mean_field_wfn(sys, charge=0)
+    scf_wrapper = SCFWrapper('cdiis', threshold=1e-6)
+    get_terms = lambda: [Hartree(), DiracExchange()]
+    ham = converge_scf_ladder(sys, get_terms, scf_wrapper, '3-21G', 'coarse', 'medium')
+    assert isinstance(ham.grid, BeckeMolGrid)
+    assert ham.grid.agspec.name == 'medium'
+    assert scf_wrapper.convergence_error(ham) < 1e-6
@@ -0,0 +1,96 @@
+# -*- coding: utf-8 -*-
+# Horton is a development platform for electronic structure methods.
+# Copyright (C) 2011-2013 Toon Verstraelen <Toon.Verstraelen@UGent.be>
+#
+# This file is part of Horton.
+#
+# Horton is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 3
+# of the License, or (at your option) any later version.
+#
+# Horton is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, see <http://www.gnu.org/licenses/>
+#
+#--
+#pylint: skip-file
+
+
+from __future__ import print_function
+from __future__ import division
+from __future__ import absolute_import
+import json
+from horton import *
+from horton.test.common import tmpdir
+
+
+def test_recorder_basics():
+    with tmpdir('horton.meanfield.test.test_recorder.test_recorder_basics') as dn:
+        fn_json = '%s/scf.json' % dn
+        recorder = SCFRecorder(fn_json)
+        recorder.start('foo')
+        with recorder.section('bar'):
+            pass
+        with record_section(recorder, 'bar'):
+            pass
+        with record_section(None, 'egg'):
+            pass
+        recorder.record(0, 1e-3, -1.5)
+        recorder.record(1, 1e-4)
+        assert len(recorder.records) == 2
+        record = recorder.records[0]
+        assert record['method'] == 'foo'
+        assert record['iter'] == 0
+        assert record['error'] == 1e-3
+        assert record['energy'] == -1.5
+        assert record['bar_wall'] >= 0
+        assert record['bar_cpu'] >= 0
+        assert 'egg_wall' not in record
+        assert recorder.records[1]['energy'] is None
+        assert 'bar_wall' not in recorder.records[1]
+        with open(fn_json) as f:
+            records = [json.loads(line) for line in f]
+        assert records == recorder.records
+
+
+def check_recorder_water(scf_wrapper):
+    fn_fchk = context.get_fn('test/water_hfs_321g.fchk')
+    sys = System.from_file(fn_fchk)
+    guess_hamiltonian_core(sys)
+    grid = BeckeMolGrid(sys, 'coarse', random_rotate=False)
+    ham = Hamiltonian(sys, [Hartree(), DiracExchange()], grid)
+    ham.recorder = SCFRecorder()
+    scf_wrapper(ham)
+    records = ham.recorder.records
+    assert len(records) > 1
+    assert records[-1]['error'] < scf_wrapper.kwargs['threshold']
+    for record in records:
+        assert record['method'] == scf_wrapper.method
+        assert 'fock_hartree_wall' in record
+        assert 'fock_exchange_dirac_cpu' in record
+        assert 'fock_grid_wall' in record
+    return records
+
+
+def test_recorder_oda():
+    records = check_recorder_water(SCFWrapper('oda', threshold=1e-6))
+    assert all(record['energy'] is not None for record in records)
+
+
+def test_recorder_cdiis():
+    records = check_recorder_water(SCFWrapper('cdiis', threshold=1e-6))
+    assert all('diis_add_cpu' in record for record in records)
+    # The initial Fock build has its own record. All other iterations have
+    # unique and increasing counters.
+    iters = [record['iter'] for record in records]
+    assert iters == range(-1, len(records)-1)
+    # The DIIS solve is part of every iteration, except for the initial Fock
+    # build and the last iteration, which stops after convergence.
+    assert 'diis_solve_wall' not in records[0]
+    assert all('diis_solve_wall' in record for record in records[1:-1])
+    assert 'diis_solve_cpu' not in records[-1]
@@ -0,0 +1,111 @@
+# -*- coding: utf-8 -*-
+# Horton is a development platform for electronic structure methods.
+# Copyright (C) 2011-2013 Toon Verstraelen <Toon.Verstraelen@UGent.be>
+#
+# This file is part of Horton.
+#
+# Horton is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 3
+# of the License, or (at your option) any later version.
+#
+# Horton is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, see <http://www.gnu.org/licenses/>
+#
+#--
+#pylint: skip-file
+
+
+from __future__ import print_function
+from __future__ import division
+from __future__ import absolute_import
+import numpy as np
+from nose.tools import assert_raises
+from horton import *
+
+
+def get_water_frames(sys):
+    frames = []
+    for scale in 0.95, 1.0, 1.05, 1.1:
+        coordinates = sys.coordinates.copy()
+        coordinates[0] = coordinates[1] + scale*(coordinates[0] - coordinates[1])
+        coordinates[2] = coordinates[1] + scale*(coordinates[2] - coordinates[1])
+        frames.append(coordinates)
+    return frames
+
+
+def get_reference_energies(frames, get_terms, agspec=None):
+    fn_xyz = context.get_fn('test/water.xyz')
+    energies = []
+    for coordinates in frames:
+        sys = System.from_file(fn_xyz, obasis='3-21g')
+        sys.update_coordinates(coordinates)
+        setup_mean_field_wfn(sys, charge=0)
+        guess_hamiltonian_core(sys)
+        if agspec is None:
+            grid = None
+        else:
+            grid = BeckeMolGrid(sys, agspec, random_rotate=False)
+        ham = Hamiltonian(sys, get_terms(), grid)
+        converge_scf_cdiis(ham, threshold=1e-8)
+        energies.append(ham.compute())
+    return np.array(energies)
+
+
+def check_frames_water(order, get_terms, agspec=None):
+    fn_xyz = context.get_fn('test/water.xyz')
+    sys = System.from_file(fn_xyz, obasis='3-21g')
+    setup_mean_field_wfn(sys, charge=0)
+    guess_hamiltonian_core(sys)
+    if agspec is None:
+        grid = None
+    else:
+        grid = BeckeMolGrid(sys, agspec, random_rotate=False, mode='keep')
+    ham = Hamiltonian(sys, get_terms(), grid)
+    frames = get_water_frames(sys)
+    indexes = []
+    energies, niters, timings = converge_scf_frames(
+        ham, frames, SCFWrapper('cdiis', threshold=1e-8), order,
+        lambda iframe, ham: indexes.append(iframe))
+    assert indexes == range(len(frames))
+    assert niters.shape == (len(frames),)
+    assert timings.shape == (len(frames), 2)
+    assert (timings >= 0).all()
+    assert abs(sys.coordinates - frames[-1]).max() < 1e-10
+    energies_ref = get_reference_energies(frames, get_terms, agspec)
+    assert abs(energies - energies_ref).max() < 1e-6
+    return niters
+
+
+def test_frames_water_hf():
+    check_frames_water(0, lambda: [HartreeFockExchange()])
+
+
+def test_frames_water_hf_extrapolation():
+    check_frames_water(2, lambda: [HartreeFockExchange()])
+
+
+def test_frames_water_hfs():
+    check_frames_water(1, lambda: [DiracExchange()], 'coarse')
+
+
+def test_frames_xyz_elements():
+    fn_xyz = context.get_fn('test/water.xyz')
+    sys = System.from_file(fn_xyz, obasis='3-21g')
+    setup_mean_field_wfn(sys, charge=0)
+    guess_hamiltonian_core(sys)
+    ham = Hamiltonian(sys, [HartreeFockExchange()])
+    scf_wrapper = SCFWrapper('cdiis', threshold=1e-8)
+    frames = [load_geom_xyz(fn_xyz)]
+    energies = converge_scf_frames(ham, frames, scf_wrapper)[0]
+    assert energies.shape == (1,)
+    frames[0]['numbers'] = np.ones(3, int)
+    with assert_raises(ValueError):
+        converge_scf_frames(ham, frames, scf_wrapper)
+    with assert_raises(ValueError):
+        converge_scf_frames(ham, [], scf_wrapper, order=3)
@@ -24,9 +24,12 @@
 from __future__ import print_function
 from __future__ import division
 from __future__ import absolute_import
-import numpy as np
+import numpy as np, h5py as h5
+from nose.tools import assert_raises
 from horton import *
 from horton.meanfield.test.common import check_scf_hf_cs_hf
+from horton.meanfield.scf_cdiis import PulayDIISHistory
+from horton.meanfield.scf_diis import compute_orthogonalizer, dump_diis_chk, load_diis_chk
 
 
 def test_scf_ediis2_cs_hf():
@@ -39,3 +42,142 @@ def test_scf_ediis2_cs_hf_oda2():
 
 def test_scf_ediis2_cs_hf_oda3():
     check_scf_hf_cs_hf(SCFWrapper('cdiis', threshold=1e-10, nvector=20, scf_step='oda3'))
+
+
+def test_pulay_history_cdots():
+    lf = DenseLinalgFactory(5)
+    olp = lf.create_one_body()
+    tmp = np.random.uniform(-0.1, 0.1, (5, 5))
+    olp._array[:] = np.identity(5) + tmp + tmp.T
+    history = PulayDIISHistory(lf, 3, olp)
+    ortho = compute_orthogonalizer(olp)
+    ocommutators = []
+    for i in xrange(5):
+        dm = lf.create_one_body()
+        fock = lf.create_one_body()
+        tmp = np.random.uniform(-1, 1, (5, 5))
+        dm._array[:] = tmp + tmp.T
+        tmp = np.random.uniform(-1, 1, (5, 5))
+        fock._array[:] = tmp + tmp.T
+        history.add(None, dm, fock)
+        # reference commutator in the orthonormal basis
+        commutator = np.dot(np.dot(olp._array, dm._array), fock._array)
+        commutator -= commutator.T
+        ocommutators.append(np.dot(ortho, np.dot(commutator, ortho)))
+        # compare with a brute-force Gram matrix of the last states
+        nused = min(i+1, 3)
+        assert history.nused == nused
+        expected = np.array([[(c0*c1).sum() for c1 in ocommutators[-nused:]] for c0 in ocommutators[-nused:]])
+        assert abs(history.cdots[:nused,:nused] - expected).max() < 1e-10
+        assert abs(history.stack[nused-1].norm - (commutator**2).sum()) < 1e-10
+
+
+def test_pulay_history_hdf5():
+    lf = DenseLinalgFactory(5)
+    olp = lf.create_one_body()
+    olp._array[:] = np.identity(5)
+    history1 = PulayDIISHistory(lf, 3, olp)
+    for i in xrange(4):
+        dm = lf.create_one_body()
+        fock = lf.create_one_body()
+        tmp = np.random.uniform(-1, 1, (5, 5))
+        dm._array[:] = tmp + tmp.T
+        tmp = np.random.uniform(-1, 1, (5, 5))
+        fock._array[:] = tmp + tmp.T
+        history1.add(None, dm, fock)
+    with h5.File('horton.meanfield.test.test_scf_cdiis.test_pulay_history_hdf5', driver='core', backing_store=False) as f:
+        dump_diis_chk(f, history1, fock, dm, 7)
+        history2 = PulayDIISHistory(lf, 3, olp)
+        fock2 = lf.create_one_body()
+        dm2 = lf.create_one_body()
+        assert load_diis_chk(f['scf_diis'], history2, fock2, dm2) == 7
+        assert (fock2._array == fock._array).all()
+        assert (dm2._array == dm._array).all()
+        assert history2.nused == history1.nused
+        assert history2.idcounter == history1.idcounter
+        assert abs(history2.cdots - history1.cdots).max() < 1e-10
+        for i in xrange(history1.nused):
+            state1 = history1.stack[i]
+            state2 = history2.stack[i]
+            assert state2.identity == state1.identity
+            assert state2.energy is None
+            assert (state2.dm._array == state1.dm._array).all()
+            assert abs(state2.norm - state1.norm) < 1e-10
+        with assert_raises(TypeError):
+            load_diis_chk(f['scf_diis'], PulayDIISHistory(lf, 2, olp), fock2, dm2)
+
+
+def test_scf_cdiis_restart():
+    fn_fchk = context.get_fn('test/water_hfs_321g.fchk')
+    # reference without interruption
+    sys = System.from_file(fn_fchk)
+    guess_hamiltonian_core(sys)
+    ham = Hamiltonian(sys, [HartreeFockExchange()])
+    niter = converge_scf_cdiis(ham, threshold=1e-8)
+    energy = ham.compute()
+
+    with h5.File('horton.meanfield.test.test_scf_cdiis.test_scf_cdiis_restart', driver='core', backing_store=False) as chk:
+        # interrupted run
+        sys = System.from_file(fn_fchk, chk=chk)
+        guess_hamiltonian_core(sys)
+        ham = Hamiltonian(sys, [HartreeFockExchange()])
+        with assert_raises(NoSCFConvergence):
+            converge_scf_cdiis(ham, threshold=1e-8, maxiter=3)
+        assert chk['scf_diis'].attrs['counter'] == 3
+        # restart from the checkpoint file
+        sys = System.from_file(chk)
+        ham = Hamiltonian(sys, [HartreeFockExchange()])
+        assert converge_scf_cdiis(ham, threshold=1e-8, restart=True) == niter
+        assert abs(ham.compute() - energy) < 1e-8
+        assert 'scf_diis' not in chk
+
+
+def test_scf_cdiis_restart_oda():
+    # The ODA step recomputes the Fock matrix from the interpolated density
+    # matrix, so the latter must also be restored.
+    fn_fchk = context.get_fn('test/water_hfs_321g.fchk')
+    # reference without interruption
+    sys = System.from_file(fn_fchk)
+    guess_hamiltonian_core(sys)
+    ham = Hamiltonian(sys, [HartreeFockExchange()])
+    niter = converge_scf_cdiis(ham, threshold=1e-8, scf_step='oda3')
+    energy = ham.compute()
+
+    with h5.File('horton.meanfield.test.test_scf_cdiis.test_scf_cdiis_restart_oda', driver='core', backing_store=False) as chk:
+        # interrupted run, in between two checkpoints
+        sys = System.from_file(fn_fchk, chk=chk)
+        guess_hamiltonian_core(sys)
+        ham = Hamiltonian(sys, [HartreeFockExchange()])
+        with assert_raises(NoSCFConvergence):
+            converge_scf_cdiis(ham, threshold=1e-8, maxiter=4, scf_step='oda3', chk_interval=3)
+        assert chk['scf_diis'].attrs['counter'] == 4
+        # restart from the checkpoint file
+        sys = System.from_file(chk)
+        ham = Hamiltonian(sys, [HartreeFockExchange()])
+        assert converge_scf_cdiis(ham, threshold=1e-8, scf_step='oda3', restart=True, chk_interval=3) == niter
+        assert abs(ham.compute() - energy) < 1e-8
+        assert 'scf_diis' not in chk
+
+
+def test_scf_cdiis_chk_interval():
+    fn_fchk = context.get_fn('test/water_hfs_321g.fchk')
+    sys = System.from_file(fn_fchk)
+    guess_hamiltonian_core(sys)
+    ham = Hamiltonian(sys, [HartreeFockExchange()])
+    niter = converge_scf_cdiis(ham, threshold=1e-8)
+    with assert_raises(ValueError):
+        converge_scf_cdiis(ham, threshold=1e-8, chk_interval=0)
+
+    with h5.File('horton.meanfield.test.test_scf_cdiis.test_scf_cdiis_chk_interval', driver='core', backing_store=False) as chk:
+        # interrupted run, in between two checkpoints
+        sys = System.from_file(fn_fchk, chk=chk)
+        guess_hamiltonian_core(sys)
+        ham = Hamiltonian(sys, [HartreeFockExchange()])
+        with assert_raises(NoSCFConvergence):
+            converge_scf_cdiis(ham, threshold=1e-8, maxiter=4, chk_interval=3)
+        # the last state is always written
+        assert chk['scf_diis'].attrs['counter'] == 4
+        sys = System.from_file(chk)
+        ham = Hamiltonian(sys, [HartreeFockExchange()])
+        assert converge_scf_cdiis(ham, threshold=1e-8, restart=True, chk_interval=3) == niter
+        assert 'scf_diis' not in chk
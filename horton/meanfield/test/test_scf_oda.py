@@ -38,6 +38,10 @@ def test_scf_oda_cs_hfs():
     check_scf_water_cs_hfs(SCFWrapper('oda', threshold=1e-6))
 
 
+def test_scf_oda_cs_hfs_grid_schedule():
+    check_scf_water_cs_hfs(SCFWrapper('oda', threshold=1e-6, grid_schedule=[('coarse', 1e-3)]))
+
+
 def test_scf_oda_water_hf_321g():
     fn_fchk = context.get_fn('test/water_hfs_321g.fchk')
     sys = System.from_file(fn_fchk)
@@ -28,8 +28,11 @@ import numpy as np
 
 from horton.cache import JustOnceClass, just_once, Cache
 from horton.log import log
-from horton.moments import get_ncart_cumul, get_npure_cumul
+from horton.moments import get_ncart_cumul, get_npure_cumul, \
+    rotate_cartesian_moments, cartesian_transforms
 from horton.meanfield.wfn import RestrictedWFN
+from horton.part.symmetry import get_cartesian_generators, \
+    get_cartesian_to_pure
 
 
 __all__ = ['Part', 'WPart', 'CPart']
@@ -39,7 +42,7 @@ class Part(JustOnceClass):
     name = None
     linear = False # whether the populations are linear in the density matrix.
 
-    def __init__(self, system, grid, local, slow, lmax, moldens=None):
+    def __init__(self, system, grid, local, slow, lmax, moldens=None, symmetry=None):
         '''
            **Arguments:**
 
@@ -63,6 +66,11 @@ class Part(JustOnceClass):
 
            moldens
                 The all-electron density grid data.
+
+           symmetry
+                A Symmetry instance. When given, the AIM properties are only
+                computed for the symmetry-unique atoms and transformed to the
+                equivalent atoms.
         '''
         JustOnceClass.__init__(self)
         self._system = system
@@ -81,9 +89,13 @@ class Part(JustOnceClass):
         if local:
             self._init_subgrids()
 
+        # Find the symmetry-unique atoms
+        self._init_symmetry(symmetry)
+
         # Some screen logging
         self._init_log_base()
         self._init_log_scheme()
+        self._init_log_symmetry()
         self._init_log_memory()
         if log.do_medium:
             log.blank()
@@ -121,6 +133,17 @@ class Part(JustOnceClass):
 
     cache = property(_get_cache)
 
+    def _get_symmetry(self):
+        return self._symmetry
+
+    symmetry = property(_get_symmetry)
+
+    def _get_unique_atoms(self):
+        '''The indexes of the atoms for which AIM properties are computed'''
+        return self._unique_atoms
+
+    unique_atoms = property(_get_unique_atoms)
+
     def __clear__(self):
         self.clear()
 
@@ -194,6 +217,44 @@ class Part(JustOnceClass):
     def _init_log_scheme(self):
         raise NotImplementedError
 
+    def _init_symmetry(self, symmetry):
+        '''Link each atom with a symmetry-unique atom
+
+           **Arguments:**
+
+           symmetry
+                A Symmetry instance or None.
+
+           The first atom in the system that corresponds to a given atom in
+           the primitive unit is the representative of all its equivalent
+           atoms. For every atom, the rotation matrix that maps the
+           representative on the atom is stored.
+        '''
+        self._symmetry = symmetry
+        natom = self.system.natom
+        self._representatives = np.arange(natom)
+        self._rotations = None
+        if symmetry is not None:
+            if get_ncart_cumul(self.lmax) > len(cartesian_transforms):
+                raise ValueError('The multipoles can not be rotated with lmax=%i. Symmetry is supported up to lmax=4.' % self.lmax)
+            links = symmetry.identify(self.system)
+            rmats = get_cartesian_generators(symmetry, self.system.cell)
+            self._rotations = np.zeros((natom, 3, 3))
+            firsts = {}
+            for index in xrange(natom):
+                iprim, igen = links[index]
+                rep = firsts.setdefault(iprim, index)
+                self._representatives[index] = rep
+                self._rotations[index] = np.dot(rmats[igen], rmats[links[rep,1]].T)
+        self._unique_atoms = (self._representatives == np.arange(natom)).nonzero()[0]
+
+    def _init_log_symmetry(self):
+        if log.do_medium and self._symmetry is not None:
+            log.deflist([
+                ('Symmetry', self._symmetry.name),
+                ('Symmetry-unique atoms', len(self._unique_atoms)),
+            ])
+
     def _init_log_memory(self):
         if log.do_medium:
             # precompute arrays sizes for certain grids
@@ -215,8 +276,10 @@ class Part(JustOnceClass):
             log.blank()
 
     def get_memory_estimates(self):
+        unique = np.zeros(self.system.natom)
+        unique[self._unique_atoms] = 1
         return [
-            ('Atomic weights', np.ones(self.system.natom), 0),
+            ('Atomic weights', unique, 0),
             ('Promolecule', np.zeros(self.system.natom), 1),
             ('Working arrays', np.zeros(self.system.natom), 2),
         ]
@@ -224,6 +287,18 @@ class Part(JustOnceClass):
     def to_atomic_grid(self, index, data):
         raise NotImplementedError
 
+    def copy_to_equivalents(self, data):
+        '''Copy the results of the symmetry-unique atoms to equivalent atoms
+
+           **Arguments:**
+
+           data
+                An array whose first index runs over all atoms. It is modified
+                in place. Only the rows of the symmetry-unique atoms are used.
+        '''
+        if self._symmetry is not None:
+            data[:] = data[self._representatives]
+
     def compute_pseudo_population(self, index):
         grid = self.get_grid(index)
         dens = self.get_moldens(index)
@@ -257,8 +332,9 @@ class Part(JustOnceClass):
             pseudo_populations = self.cache.load('pseudo_populations', alloc=self.system.natom, tags='o')[0]
             if log.do_medium:
                 log('Computing atomic populations.')
-            for i in xrange(self.system.natom):
+            for i in self._unique_atoms:
                 pseudo_populations[i] = self.compute_pseudo_population(i)
+            self.copy_to_equivalents(pseudo_populations)
             populations[:] = pseudo_populations
             populations += self.system.numbers - self.system.pseudo_numbers
 
@@ -287,12 +363,13 @@ class Part(JustOnceClass):
                 self.do_partitioning()
                 if log.do_medium:
                     log('Computing atomic spin charges.')
-                for index in xrange(self.system.natom):
+                for index in self._unique_atoms:
                     grid = self.get_grid(index)
                     spindens = self.get_spindens(index)
                     at_weights = self.cache.load('at_weights', index)
                     wcor = self.get_wcor(index)
                     spin_charges[index] = grid.integrate(at_weights, spindens, wcor)
+                self.copy_to_equivalents(spin_charges)
 
     @just_once
     def do_moments(self):
@@ -310,7 +387,7 @@ class Part(JustOnceClass):
 
         if new1 or new2:
             self.do_partitioning()
-            for i in xrange(self._system.natom):
+            for i in self._unique_atoms:
                 # 1) Define a 'window' of the integration grid for this atom
                 center = self._system.coordinates[i]
                 grid = self.get_grid(i)
@@ -321,22 +398,31 @@ class Part(JustOnceClass):
                 # 3) Compute weight corrections (TODO: needs to be assessed!)
                 wcor = self.get_wcor(i)
 
-                # 4) Compute Cartesian multipole moments
-                # The minus sign is present to account for the negative electron
-                # charge.
-                cartesian_multipoles[i] = -grid.integrate(aim, wcor, center=center, lmax=self.lmax, mtype=1)
-                cartesian_multipoles[i, 0] += self.system.pseudo_numbers[i]
+                # 4) Compute all moments in one pass over the grid
+                cartesian, pure, radial = grid.integrate(aim, wcor, center=center, lmax=self.lmax, mtype=[1, 2, 3])
 
-                # 5) Compute Pure multipole moments
+                # 5) Cartesian and pure multipole moments
                 # The minus sign is present to account for the negative electron
                 # charge.
-                pure_multipoles[i] = -grid.integrate(aim, wcor, center=center, lmax=self.lmax, mtype=2)
+                cartesian_multipoles[i] = -cartesian
+                cartesian_multipoles[i, 0] += self.system.pseudo_numbers[i]
+                pure_multipoles[i] = -pure
                 pure_multipoles[i, 0] += self.system.pseudo_numbers[i]
 
-                # 6) Compute Radial moments
+                # 6) Radial moments
                 # For the radial moments, it is not common to put a minus sign
                 # for the negative electron charge.
-                radial_moments[i] = grid.integrate(aim, wcor, center=center, lmax=self.lmax, mtype=3)
+                radial_moments[i] = radial
+
+            # 7) Transform the results to the equivalent atoms
+            if self._symmetry is not None:
+                cart_to_pure = get_cartesian_to_pure(self.lmax)
+                for i in xrange(self._system.natom):
+                    rep = self._representatives[i]
+                    if rep != i:
+                        cartesian_multipoles[i] = rotate_cartesian_moments(cartesian_multipoles[rep], self._rotations[i])
+                        pure_multipoles[i] = np.dot(cart_to_pure, cartesian_multipoles[i])
+                self.copy_to_equivalents(radial_moments)
 
     def do_all(self):
         '''Computes all properties and return a list of their names.'''
@@ -354,7 +440,7 @@ class WPart(Part):
     # user-provided grids.
 
     '''Base class for density partitioning schemes'''
-    def __init__(self, system, grid, local=True, slow=False, lmax=3, epsilon=0):
+    def __init__(self, system, grid, local=True, slow=False, lmax=3, epsilon=0, symmetry=None):
         '''
            **Arguments:**
 
@@ -377,11 +463,17 @@ class WPart(Part):
            epsilon
                 Allow errors on the computed electron density of this magnitude
                 for the sake of efficiency.
+
+           symmetry
+                A Symmetry instance. When given, the AIM properties are only
+                computed for the symmetry-unique atoms.
         '''
         if local and grid.subgrids is None:
             raise ValueError('Atomic grids are discarded from molecular grid object, but are needed for local integrations.')
+        if local and getattr(grid, 'prune', None) is not None:
+            raise ValueError('Local integrations are not possible with a pruned molecular grid.')
         self._epsilon = epsilon
-        Part.__init__(self, system, grid, local, slow, lmax)
+        Part.__init__(self, system, grid, local, slow, lmax, None, symmetry)
 
     def _get_epsilon(self):
         return self._epsilon
@@ -445,7 +537,7 @@ class WPart(Part):
 
 class CPart(Part):
     '''Base class for density partitioning schemes of cube files'''
-    def __init__(self, system, grid, local, moldens, wcor_numbers=None, wcor_rcut_max=2.0, wcor_rcond=0.1, lmax=3):
+    def __init__(self, system, grid, local, moldens, wcor_numbers=None, wcor_rcut_max=2.0, wcor_rcond=0.1, lmax=3, symmetry=None):
         '''
            **Arguments:**
 
@@ -456,7 +548,10 @@ class CPart(Part):
                 The uniform integration grid based on the cube file.
 
            local
-                Whether or not to use local (non-periodic) grids.
+                Whether or not to use local (non-periodic) grids. The local
+                grids only contain the points within the cutoff radius of each
+                atom and all atomic functions on these grids are stored as
+                compact 1D arrays.
 
            moldens
                 The all-electron density grid data.
@@ -475,6 +570,10 @@ class CPart(Part):
 
            lmax
                 The maximum angular momentum in multipole expansions.
+
+           symmetry
+                A Symmetry instance. When given, the AIM properties are only
+                computed for the symmetry-unique atoms.
         '''
         if wcor_numbers is None:
             self._wcor_numbers = range(1, 119)
@@ -482,7 +581,9 @@ class CPart(Part):
             self._wcor_numbers = wcor_numbers
         self._wcor_rcut_max = wcor_rcut_max
         self._wcor_rcond = wcor_rcond
-        Part.__init__(self, system, grid, local, True, lmax, moldens)
+        # Intermediate results of the weight corrections, shared by all atoms
+        self._wcor_cache = {}
+        Part.__init__(self, system, grid, local, True, lmax, moldens, symmetry)
 
     def _get_wcor_numbers(self):
         return self._wcor_numbers
@@ -490,12 +591,13 @@ class CPart(Part):
     wcor_numbers = property(_get_wcor_numbers)
 
     def _init_subgrids(self):
-        # grids for non-periodic integrations
+        # grids for non-periodic integrations. Only the points inside the
+        # cutoff sphere are kept, as the weight function is zero elsewhere.
         self._subgrids = []
         for index in xrange(self.system.natom):
             center = self.system.coordinates[index]
             radius = self.get_cutoff_radius(index)
-            self._subgrids.append(self.grid.get_window(center, radius))
+            self._subgrids.append(self.grid.get_sparse_window(center, radius))
 
     def _init_log_base(self):
         if log.do_medium:
@@ -513,7 +615,10 @@ class CPart(Part):
 
     def get_memory_estimates(self):
         if self.local:
-            row = [('Weight corrections', np.array([n in self._wcor_numbers for n in self.system.numbers]), 0)]
+            # Weight corrections are only computed for symmetry-unique atoms.
+            unique = np.zeros(self.system.natom, bool)
+            unique[self._unique_atoms] = True
+            row = [('Weight corrections', np.array([n in self._wcor_numbers for n in self.system.numbers]) & unique, 0)]
         else:
             row = [('Weight corrections', np.zeros(self.system.natom), 1)]
         return Part.get_memory_estimates(self) + row
@@ -537,7 +642,7 @@ class CPart(Part):
             index = None
         wcor, new = self.cache.load(label, index, alloc=grid.shape)
         if new:
-            grid.compute_weight_corrections(funcs, output=wcor)
+            grid.compute_weight_corrections(funcs, output=wcor, cache=self._wcor_cache)
         return wcor
 
     def get_wcor(self, index=None):
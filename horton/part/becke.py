@@ -42,7 +42,7 @@ class BeckeWPart(WPart):
     linear = True
 
     '''Class for Becke partitioning'''
-    def __init__(self, system, grid, local=True, slow=False, lmax=3, epsilon=0, k=3):
+    def __init__(self, system, grid, local=True, slow=False, lmax=3, epsilon=0, k=3, symmetry=None):
         '''
            **Arguments:**
 
@@ -68,9 +68,13 @@ class BeckeWPart(WPart):
 
            k
                 The order of the polynomials used in the Becke partitioning.
+
+           symmetry
+                A Symmetry instance. When given, the AIM properties are only
+                computed for the symmetry-unique atoms.
         '''
         self._k = k
-        WPart.__init__(self, system, grid, local, slow, lmax, epsilon)
+        WPart.__init__(self, system, grid, local, slow, lmax, epsilon, symmetry)
 
     def _init_log_scheme(self):
         if log.do_medium:
@@ -99,9 +103,9 @@ class BeckeWPart(WPart):
             radii.append(radius)
         radii = np.array(radii)
 
-        # Actual work
-        pb = log.progress(self.system.natom)
-        for index in xrange(self.system.natom):
+        # Actual work, only for the symmetry-unique atoms
+        pb = log.progress(len(self._unique_atoms))
+        for index in self._unique_atoms:
             grid = self.get_grid(index)
             at_weights = self.cache.load('at_weights', index, alloc=grid.shape)[0]
             at_weights[:] = 1
@@ -121,20 +121,20 @@ class HirshfeldMixin(object):
 class HirshfeldWPart(HirshfeldMixin, StockholderWPart):
     options = HirshfeldMixin.options + ['epsilon']
 
-    def __init__(self, system, grid, proatomdb, local=True, slow=False, lmax=3, epsilon=0):
+    def __init__(self, system, grid, proatomdb, local=True, slow=False, lmax=3, epsilon=0, symmetry=None):
         check_proatomdb(system, proatomdb)
         HirshfeldMixin. __init__(self, proatomdb)
-        StockholderWPart.__init__(self, system, grid, local, slow, lmax, epsilon)
+        StockholderWPart.__init__(self, system, grid, local, slow, lmax, epsilon, symmetry)
 
 
 class HirshfeldCPart(HirshfeldMixin, StockholderCPart):
-    def __init__(self, system, grid, local, moldens, proatomdb, wcor_numbers=None, wcor_rcut_max=2.0, wcor_rcond=0.1, lmax=3):
+    def __init__(self, system, grid, local, moldens, proatomdb, wcor_numbers=None, wcor_rcut_max=2.0, wcor_rcond=0.1, lmax=3, symmetry=None):
         '''
            See CPart base class for the description of the arguments.
         '''
         check_proatomdb(system, proatomdb)
         HirshfeldMixin. __init__(self, proatomdb)
-        StockholderCPart.__init__(self, system, grid, local, moldens, wcor_numbers, wcor_rcut_max, wcor_rcond, lmax)
+        StockholderCPart.__init__(self, system, grid, local, moldens, wcor_numbers, wcor_rcut_max, wcor_rcond, lmax, symmetry)
 
     def get_cutoff_radius(self, index):
         '''The radius at which the weight function goes to zero'''
@@ -222,19 +222,34 @@ class HirshfeldEMixin(object):
         label = self.hebasis.get_basis_label(index, j)
         return self.get_somefn(index, spline, ('basis', j), 'basis %s' % label, grid)
 
+    def get_constant_and_bases(self, index, js, grid=None):
+        # The constant function and the selected basis functions share the
+        # same rtransform and are evaluated at once.
+        splines = [self.hebasis.get_constant_spline(index)]
+        keys = [('constant',)]
+        for j in js:
+            splines.append(self.hebasis.get_basis_spline(index, j))
+            keys.append(('basis', j))
+        return self.get_somefns(index, splines, keys, 'constant and basis', grid)
+
     def eval_proatom(self, index, output, grid=None):
         # Greedy version of eval_proatom
-        output[:] = self.get_constant(index, grid)
-
-        #
         propars = self._cache.load('propars')
         begin = self.hebasis.get_atom_begin(index)
         nbasis =  self.hebasis.get_atom_nbasis(index)
+        js = [j for j in xrange(nbasis) if propars[j+begin] != 0.0]
 
-        for j in xrange(nbasis):
-            coeff = propars[j+begin]
-            if coeff != 0.0:
-                output += coeff*self.get_basis(index, j, grid)
+        if self._greedy:
+            # All functions are cached anyway, so evaluate them at once.
+            fns = self.get_constant_and_bases(index, js, grid)
+            output[:] = fns[0]
+            for j, fn in zip(js, fns[1:]):
+                output += propars[j+begin]*fn
+        else:
+            # Keep only one basis function in memory at a time.
+            output[:] = self.get_constant(index, grid)
+            for j in js:
+                output += propars[j+begin]*self.get_basis(index, j, grid)
 
         # correct if the proatom is negative in some parts
         if output.min() < 0:
@@ -267,14 +282,29 @@ class HirshfeldEMixin(object):
         self._cache.dump('propars', propars, tags='o')
         return propars
 
+    def _get_atom_propars_range(self, index):
+        begin = self.hebasis.get_atom_begin(index)
+        return begin, begin + self.hebasis.get_atom_nbasis(index)
+
     def _update_propars_atom(self, index):
         # Prepare some things
         charges = self._cache.load('charges', alloc=self.system.natom, tags='o')[0]
         begin = self.hebasis.get_atom_begin(index)
         nbasis = self.hebasis.get_atom_nbasis(index)
 
+        # Evaluate the constant and all basis functions at once, only if they
+        # are cached anyway. Otherwise, the basis functions are evaluated one
+        # by one when needed.
+        if self._greedy:
+            fns = self.get_constant_and_bases(index, range(nbasis))
+            constant, basis = fns[0], fns[1:]
+        else:
+            constant = self.get_constant(index)
+            basis = None
+
         # Compute charge and delta aim density
-        charge, delta_aim = self._get_charge_and_delta_aim(index)
+        charge, delta_aim = self._get_charge_and_delta_aim(index, constant)
+        del constant
         charges[index] = charge
 
         # Preliminary check
@@ -282,7 +312,7 @@ class HirshfeldEMixin(object):
             raise RuntimeError('The charge on atom %i becomes too positive: %f > %i. (infeasible)' % (index, charges[index], nbasis))
 
         # Define the least-squares system
-        A, B, C = self._get_he_system(index, delta_aim)
+        A, B, C = self._get_he_system(index, delta_aim, basis)
 
         # preconditioning
         scales = np.sqrt(np.diag(A))
@@ -324,11 +354,8 @@ class HirshfeldEMixin(object):
 
         self.cache.load('propars')[begin:begin+nbasis] = atom_propars
 
-    def _get_charge_and_delta_aim(self, index):
-        # evaluate the constant function, to subtract it from the AIM
-        constant = self.get_constant(index)
-
-        # compute delta_aim
+    def _get_charge_and_delta_aim(self, index, constant):
+        # compute delta_aim, i.e. the AIM minus the constant function
         delta_aim = self.get_moldens(index)*self.cache.load('at_weights', index) - constant
 
         # Integrate out
@@ -337,7 +364,7 @@ class HirshfeldEMixin(object):
         charge = -grid.integrate(delta_aim, wcor)
         return charge, delta_aim
 
-    def _get_he_system(self, index, delta_aim):
+    def _get_he_system(self, index, delta_aim, basis):
         number = self.system.numbers[index]
         nbasis = self.hebasis.get_atom_nbasis(index)
         grid = self.get_grid(index)
@@ -362,19 +389,18 @@ class HirshfeldEMixin(object):
             else:
                 # In the case of a global grid, the radial integration is not
                 # suitable as it does not account for periodic boundary
-                # conditions
-                basis0 = grid.zeros()
-                basis1 = grid.zeros()
+                # conditions. All basis functions are evaluated at once. (This
+                # happens only once per element.)
+                if basis is None:
+                    splines = [self.hebasis.get_basis_spline(index, j) for j in xrange(nbasis)]
+                    all_basis = np.zeros((nbasis,) + tuple(grid.shape))
+                    self.eval_splines(index, splines, all_basis, label='basis')
+                else:
+                    all_basis = basis
                 for j0 in xrange(nbasis):
-                    basis0[:] = 0.0
-                    spline0 = self.hebasis.get_basis_spline(index, j0)
-                    self.eval_spline(index, spline0, basis0, label='basis %i' % j0)
-                    for j1 in xrange(j0+1):
-                        basis1[:] = 0.0
-                        spline1 = self.hebasis.get_basis_spline(index, j1)
-                        self.eval_spline(index, spline1, basis1, label='basis %i' % j1)
-                        A[j0, j1] = grid.integrate(basis0, basis1, wcor_fit)
-                        A[j1, j0] = A[j0, j1]
+                    A[j0, :j0+1] = grid.integrate_batch(all_basis[:j0+1], all_basis[j0], wcor_fit)
+                    A[:j0+1, j0] = A[j0, :j0+1]
+                del all_basis
 
             if (np.diag(A) < 0).any():
                 raise ValueError('The diagonal of A must be positive.')
@@ -382,10 +408,12 @@ class HirshfeldEMixin(object):
             self.cache.dump('A', number, A)
 
         #   Matrix B
-        B = np.zeros(nbasis, float)
-        for j0 in xrange(nbasis):
-            basis = self.get_basis(index, j0)
-            B[j0] = grid.integrate(delta_aim, basis, wcor_fit)
+        if basis is None:
+            B = np.zeros(nbasis)
+            for j0 in xrange(nbasis):
+                B[j0] = grid.integrate(self.get_basis(index, j0), delta_aim, wcor_fit)
+        else:
+            B = grid.integrate_batch(basis, delta_aim, wcor_fit)
 
         #   Constant C
         C = grid.integrate(delta_aim, delta_aim, wcor_fit)
@@ -397,10 +425,10 @@ class HirshfeldEMixin(object):
 
 
 class HirshfeldEWPart(HirshfeldEMixin, HirshfeldIWPart):
-    def __init__(self, system, grid, proatomdb, local=True, slow=False, lmax=3, epsilon=0, threshold=1e-6, maxiter=500, greedy=False):
+    def __init__(self, system, grid, proatomdb, local=True, slow=False, lmax=3, epsilon=0, threshold=1e-6, maxiter=500, greedy=False, symmetry=None):
         hebasis = HEBasis(system.numbers, proatomdb)
         HirshfeldEMixin.__init__(self, hebasis)
-        HirshfeldIWPart.__init__(self, system, grid, proatomdb, local, slow, lmax, epsilon, threshold, maxiter, greedy)
+        HirshfeldIWPart.__init__(self, system, grid, proatomdb, local, slow, lmax, epsilon, threshold, maxiter, greedy, symmetry)
 
     def get_wcor_fit(self, index):
         return None
@@ -419,13 +447,13 @@ class HirshfeldEWPart(HirshfeldEMixin, HirshfeldIWPart):
 
 
 class HirshfeldECPart(HirshfeldEMixin, HirshfeldICPart):
-    def __init__(self, system, grid, local, moldens, proatomdb, wcor_numbers=None, wcor_rcut_max=2.0, wcor_rcond=0.1, lmax=3, threshold=1e-6, maxiter=500, greedy=False):
+    def __init__(self, system, grid, local, moldens, proatomdb, wcor_numbers=None, wcor_rcut_max=2.0, wcor_rcond=0.1, lmax=3, threshold=1e-6, maxiter=500, greedy=False, symmetry=None):
         '''
            See CPart base class for the description of the arguments.
         '''
         hebasis = HEBasis(system.numbers, proatomdb)
         HirshfeldEMixin.__init__(self, hebasis)
-        HirshfeldICPart.__init__(self, system, grid, local, moldens, proatomdb, wcor_numbers, wcor_rcut_max, wcor_rcond, lmax, threshold, maxiter, greedy)
+        HirshfeldICPart.__init__(self, system, grid, local, moldens, proatomdb, wcor_numbers, wcor_rcut_max, wcor_rcond, lmax, threshold, maxiter, greedy, symmetry)
 
     def get_memory_estimates(self):
         if self.local:
@@ -93,21 +93,55 @@ class HirshfeldIMixin(IterativeProatomMixin):
             self.eval_spline(index, spline, result, grid, label)
         return result
 
+    def get_somefns(self, index, splines, keys, label, grid=None):
+        # Same as get_somefn, but all splines that are not cached yet are
+        # evaluated with a single call to eval_splines. The results are rows
+        # of one array.
+        if grid is None:
+            grid = self.get_grid(index)
+        shape = (len(splines),) + tuple(grid.shape)
+        if not self._greedy:
+            output = np.zeros(shape)
+            self.eval_splines(index, splines, output, grid, label)
+            return list(output)
+        keys = [key + (index, id(grid)) for key in keys]
+        results = [self.cache.load(*key, default=None) for key in keys]
+        todo = [i for i in xrange(len(splines)) if results[i] is None]
+        if len(todo) > 0:
+            output = np.zeros((len(todo),) + shape[1:])
+            self.eval_splines(index, [splines[i] for i in todo], output, grid, label)
+            for row, i in zip(output, todo):
+                self.cache.dump(*(keys[i] + (row,)))
+                results[i] = row
+        return results
+
     def get_isolated(self, index, charge, grid=None):
         number = self.system.numbers[index]
         spline = self.proatomdb.get_spline(number, charge)
         return self.get_somefn(index, spline, ('isolated', charge), 'isolated q=%+i' % charge, grid)
 
+    def get_isolateds(self, index, charges, grid=None):
+        number = self.system.numbers[index]
+        splines = [self.proatomdb.get_spline(number, charge) for charge in charges]
+        keys = [('isolated', charge) for charge in charges]
+        label = 'isolated q=%s' % ','.join('%+i' % charge for charge in charges)
+        return self.get_somefns(index, splines, keys, label, grid)
+
     def eval_proatom(self, index, output, grid=None):
         # Greedy version of eval_proatom
         icharge, x = self.get_interpolation_info(index)
-        output[:] = self.get_isolated(index, icharge, grid)
-        output *= 1-x
         pseudo_pop = self.system.pseudo_numbers[index] - icharge
         if pseudo_pop > 1 and x != 0.0:
-            output += self.get_isolated(index, icharge+1, grid)*x
+            # Both isolated atoms are evaluated at once.
+            isolated0, isolated1 = self.get_isolateds(index, [icharge, icharge+1], grid)
+            output[:] = isolated0
+            output *= 1-x
+            output += isolated1*x
         elif pseudo_pop <= 0:
             raise ValueError('Requesting a pro-atom with a negative (pseudo) population')
+        else:
+            output[:] = self.get_isolated(index, icharge, grid)
+            output *= 1-x
         output += 1e-100
 
     def _init_propars(self):
@@ -116,6 +150,9 @@ class HirshfeldIMixin(IterativeProatomMixin):
         self.cache.dump('propars', charges, tags='o')
         return charges
 
+    def _get_atom_propars_range(self, index):
+        return index, index+1
+
     def _update_propars_atom(self, index):
         # Compute population
         pseudo_population = self.compute_pseudo_population(index)
@@ -128,7 +165,7 @@ class HirshfeldIMixin(IterativeProatomMixin):
 class HirshfeldIWPart(HirshfeldIMixin, HirshfeldWPart):
     options = HirshfeldIMixin.options + ['epsilon']
 
-    def __init__(self, system, grid, proatomdb, local=True, slow=False, lmax=3, epsilon=0, threshold=1e-6, maxiter=500, greedy=False):
+    def __init__(self, system, grid, proatomdb, local=True, slow=False, lmax=3, epsilon=0, threshold=1e-6, maxiter=500, greedy=False, symmetry=None):
         '''
            **Optional arguments:** (that are not present in the base class)
 
@@ -142,7 +179,7 @@ class HirshfeldIWPart(HirshfeldIMixin, HirshfeldWPart):
                 in the end, no warning is given.
         '''
         HirshfeldIMixin.__init__(self, threshold, maxiter, greedy)
-        HirshfeldWPart.__init__(self, system, grid, proatomdb, local, slow, lmax, epsilon)
+        HirshfeldWPart.__init__(self, system, grid, proatomdb, local, slow, lmax, epsilon, symmetry)
 
     def get_memory_estimates(self):
         return (
@@ -158,7 +195,7 @@ class HirshfeldIWPart(HirshfeldIMixin, HirshfeldWPart):
 
 
 class HirshfeldICPart(HirshfeldIMixin, HirshfeldCPart):
-    def __init__(self, system, grid, local, moldens, proatomdb, wcor_numbers=None, wcor_rcut_max=2.0, wcor_rcond=0.1, lmax=3, threshold=1e-6, maxiter=500, greedy=False):
+    def __init__(self, system, grid, local, moldens, proatomdb, wcor_numbers=None, wcor_rcut_max=2.0, wcor_rcond=0.1, lmax=3, threshold=1e-6, maxiter=500, greedy=False, symmetry=None):
         '''
            **Optional arguments:** (that are not present in the base class)
 
@@ -172,7 +209,7 @@ class HirshfeldICPart(HirshfeldIMixin, HirshfeldCPart):
                 in the end, no warning is given.
         '''
         HirshfeldIMixin.__init__(self, threshold, maxiter, greedy)
-        HirshfeldCPart.__init__(self, system, grid, local, moldens, proatomdb, wcor_numbers, wcor_rcut_max, wcor_rcond, lmax)
+        HirshfeldCPart.__init__(self, system, grid, local, moldens, proatomdb, wcor_numbers, wcor_rcut_max, wcor_rcond, lmax, symmetry)
 
     def get_memory_estimates(self):
         return (
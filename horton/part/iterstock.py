@@ -57,8 +57,9 @@ class IterativeProatomMixin():
         self.update_at_weights()
 
         # Update the proatoms
-        for index in xrange(self.system.natom):
+        for index in self._unique_atoms:
             self._update_propars_atom(index)
+        self._copy_propars_to_equivalents()
 
         # Keep track of history
         self.history_charges.append(self.cache.load('charges').copy())
@@ -66,6 +67,23 @@ class IterativeProatomMixin():
     def _update_propars_atom(self, index):
         raise NotImplementedError
 
+    def _get_atom_propars_range(self, index):
+        '''Return the begin and end of the proatom parameters of one atom'''
+        raise NotImplementedError
+
+    def _copy_propars_to_equivalents(self):
+        '''Copy the proatoms and charges of the symmetry-unique atoms'''
+        if self._symmetry is None:
+            return
+        propars = self.cache.load('propars')
+        for index in xrange(self.system.natom):
+            rep = self._representatives[index]
+            if rep != index:
+                begin, end = self._get_atom_propars_range(index)
+                rep_begin, rep_end = self._get_atom_propars_range(rep)
+                propars[begin:end] = propars[rep_begin:rep_end]
+        self.copy_to_equivalents(self.cache.load('charges'))
+
     def _finalize_propars(self):
         charges = self._cache.load('charges')
         self.cache.dump('history_propars', np.array(self.history_propars), tags='o')
@@ -76,7 +94,7 @@ class IterativeProatomMixin():
     @just_once
     def do_partitioning(self):
         # Perform one general check in the beginning to avoid recomputation
-        new = any(('at_weights', i) not in self.cache for i in xrange(self.system.natom))
+        new = any(('at_weights', i) not in self.cache for i in self._unique_atoms)
         new |= 'niter' not in self.cache
         new |= 'change'not in self.cache
         if new:
@@ -120,10 +138,10 @@ class IterativeStockholderWPart(IterativeProatomMixin, StockholderWPart):
     options = ['slow', 'lmax', 'threshold', 'maxiter', 'epsilon']
     linear = False
 
-    def __init__(self, system, grid, slow=False, lmax=3, epsilon=0, threshold=1e-6, maxiter=500):
+    def __init__(self, system, grid, slow=False, lmax=3, epsilon=0, threshold=1e-6, maxiter=500, symmetry=None):
         self._threshold = threshold
         self._maxiter = maxiter
-        StockholderWPart.__init__(self, system, grid, True, slow, lmax, epsilon)
+        StockholderWPart.__init__(self, system, grid, True, slow, lmax, epsilon, symmetry)
 
     def _init_log_scheme(self):
         if log.do_medium:
@@ -151,6 +169,9 @@ class IterativeStockholderWPart(IterativeProatomMixin, StockholderWPart):
         ntotal = self._ranges[-1]
         return self.cache.load('propars', alloc=ntotal, tags='o')[0]
 
+    def _get_atom_propars_range(self, index):
+        return self._ranges[index], self._ranges[index+1]
+
     def _update_propars_atom(self, index):
         # compute spherical average
         atgrid = self.get_grid(index)
@@ -27,6 +27,7 @@ from __future__ import absolute_import
 import numpy as np
 
 from horton.log import log
+from horton.grid.base import IntGrid
 from horton.grid.cext import CubicSpline
 from horton.part.base import WPart, CPart
 
@@ -89,6 +90,19 @@ class StockHolderMixin(object):
             log('  Evaluating spline (%s) for atom %i (n=%i) on %i grid points' % (label, index, number, grid.size))
         grid.eval_spline(spline, center, output)
 
+    def eval_splines(self, index, splines, output, grid=None, label='noname'):
+        center = self.system.coordinates[index]
+        if grid is None:
+            grid = self.get_grid(index)
+        if log.do_debug:
+            number = self.system.numbers[index]
+            log('  Evaluating %i splines (%s) for atom %i (n=%i) on %i grid points' % (len(splines), label, index, number, grid.size))
+        if isinstance(grid, IntGrid):
+            grid.eval_splines(splines, center, output)
+        else:
+            for spline, spline_output in zip(splines, output):
+                grid.eval_spline(spline, center, spline_output)
+
     def eval_proatom(self, index, output, grid=None):
         spline = self.get_proatom_spline(index)
         output[:] = 0.0
@@ -103,15 +117,21 @@ class StockHolderMixin(object):
         promoldens[:] = 0
 
         # update the promolecule density and store the proatoms in the at_weights
-        # arrays for later.
+        # arrays for later. Only the symmetry-unique atoms get at_weights. The
+        # other proatoms are evaluated in a temporary array.
+        unique = np.zeros(self.system.natom, bool)
+        unique[self._unique_atoms] = True
         for index in xrange(self.system.natom):
             grid = self.get_grid(index)
-            at_weights = self.cache.load('at_weights', index, alloc=grid.shape)[0]
-            self.update_pro(index, at_weights, promoldens)
+            if unique[index]:
+                proatdens = self.cache.load('at_weights', index, alloc=grid.shape)[0]
+            else:
+                proatdens = grid.zeros()
+            self.update_pro(index, proatdens, promoldens)
 
         # Compute the atomic weights by taking the ratios between proatoms and
         # promolecules.
-        for index in xrange(self.system.natom):
+        for index in self._unique_atoms:
             at_weights = self.cache.load('at_weights', index)
             at_weights /= self.to_atomic_grid(index, promoldens)
             np.clip(at_weights, 0, 1, out=at_weights)
@@ -26,7 +26,9 @@ from __future__ import absolute_import
 
 import numpy as np
 
-from horton.moments import rotate_cartesian_moments
+from horton.cext import fill_cartesian_polynomials, fill_pure_polynomials
+from horton.moments import rotate_cartesian_moments, get_ncart, \
+    get_ncart_cumul, get_npure_cumul
 
 
 
@@ -104,3 +106,68 @@ def symmetry_analysis(system, symmetry, aim_results):
             result[key] = stats
 
     return result
+
+
+def get_cartesian_generators(symmetry, cell):
+    '''Return the linear parts of the generators in Cartesian coordinates
+
+       **Arguments:**
+
+       symmetry
+            The symmetry descriptor. Its generators act on fractional
+            coordinates.
+
+       cell
+            The Cell object that defines the fractional coordinates.
+
+       **Returns:** an array with shape (ngenerator, 3, 3). Each item is the
+       Cartesian rotation matrix of the corresponding generator.
+    '''
+    # The columns of to_cart and to_frac are the images of the unit vectors.
+    # For partially periodic or isolated systems, the Cell object completes
+    # the cell vectors with orthonormal vectors.
+    eye = np.identity(3)
+    to_cart = np.array([cell.to_cart(eye[i]) for i in xrange(3)]).T
+    to_frac = np.array([cell.to_frac(eye[i]) for i in xrange(3)]).T
+    result = np.zeros((len(symmetry.generators), 3, 3))
+    for igen, generator in enumerate(symmetry.generators):
+        result[igen] = np.dot(to_cart, np.dot(generator[:,:3], to_frac))
+    return result
+
+
+def get_cartesian_to_pure(lmax):
+    '''Return the linear transformation from cartesian to pure multipoles
+
+       **Arguments:**
+
+       lmax
+            The maximum angular momentum.
+
+       **Returns:** a matrix with shape (npure, ncart), where npure and ncart
+       are the numbers of pure and cartesian multipoles up to lmax. The pure
+       multipole moments are obtained as the dot product of this matrix with
+       the cartesian multipole moments.
+    '''
+    # Both types of polynomials for a given angular momentum are homogeneous
+    # polynomials of the same degree. The transformation is found by
+    # evaluating them in a few random points and solving a linear system.
+    result = np.zeros((get_npure_cumul(lmax), int(get_ncart_cumul(lmax))))
+    result[0, 0] = 1.0
+    rng = np.random.RandomState(1)
+    for l in xrange(1, lmax+1):
+        ncart = int(get_ncart(l))
+        cart_polys = np.zeros((ncart, int(get_ncart_cumul(lmax))-1))
+        pure_polys = np.zeros((ncart, get_npure_cumul(lmax)-1))
+        for ipoint in xrange(ncart):
+            point = rng.uniform(-1, 1, 3)
+            cart_polys[ipoint,:3] = point
+            fill_cartesian_polynomials(cart_polys[ipoint], l)
+            pure_polys[ipoint,:3] = point[[2, 0, 1]]
+            fill_pure_polynomials(pure_polys[ipoint], l)
+        cart_begin = int(get_ncart_cumul(l-1))
+        cart_end = int(get_ncart_cumul(l))
+        pure_begin = l**2
+        pure_end = (l+1)**2
+        block = np.linalg.solve(cart_polys[:,cart_begin-1:cart_end-1], pure_polys[:,pure_begin-1:pure_end-1])
+        result[pure_begin:pure_end, cart_begin:cart_end] = block.T
+    return result
@@ -33,7 +33,7 @@ from horton import *
 __all__ = [
     'get_proatomdb_cp2k', 'get_proatomdb_hf_sto3g',
     'get_proatomdb_hf_lan', 'get_fake_co', 'get_fake_pseudo_oo',
-    'check_names', 'check_proatom_splines',
+    'get_fake_symmetric', 'check_names', 'check_proatom_splines',
 ]
 
 
@@ -116,6 +116,44 @@ def get_fake_pseudo_oo():
     return sys, ugrid, moldens, proatomdb
 
 
+def get_fake_symmetric():
+    # Define a periodic system with a four-fold rotation axis
+    generators = [
+        np.array([[1, 0, 0, 0], [0, 1, 0, 0], [0, 0, 1, 0]], float),
+        np.array([[0, -1, 0, 0], [1, 0, 0, 0], [0, 0, 1, 0]], float),
+        np.array([[-1, 0, 0, 0], [0, -1, 0, 0], [0, 0, 1, 0]], float),
+        np.array([[0, 1, 0, 0], [-1, 0, 0, 0], [0, 0, 1, 0]], float),
+    ]
+    fracs = np.array([[0.1, 0.35, 0.3], [0.5, 0.5, 0.5]])
+    cell = Cell(np.identity(3, float)*7.2)
+    symmetry = Symmetry('c4', generators, fracs, np.array([6, 8]), cell)
+    coordinates, numbers, links = symmetry.generate()
+    sys = System(coordinates, numbers, cell=cell)
+
+    # Load some pro-atoms
+    proatomdb = ProAtomDB.from_refatoms(numbers=[6, 8], max_kation=1, max_anion=1)
+    proatomdb.compact(0.02)
+
+    # Make fake cube data. The grid is invariant under the symmetry operations.
+    origin = np.zeros(3)
+    rvecs = np.identity(3, float)*0.2
+    shape = np.array([36, 36, 36])
+    ugrid = UniformGrid(origin, rvecs, shape, np.ones(3, int))
+
+    moldens = np.zeros(ugrid.shape)
+    licos = {
+        6: {+1: 0.5, 0: 0.4, -1: 0.1},
+        8: {+1: 0.1, 0: 0.4, -1: 0.5},
+    }
+    for i in xrange(sys.natom):
+        n = sys.numbers[i]
+        c = sys.coordinates[i]
+        spline = proatomdb.get_spline(n, licos[n])
+        ugrid.eval_spline(spline, c, moldens)
+
+    return sys, ugrid, moldens, proatomdb, symmetry
+
+
 def check_names(names, part):
     for name in names:
         assert name in part.cache
@@ -26,7 +26,7 @@ from __future__ import division
 from __future__ import absolute_import
 from horton import *
 from horton.part.test.common import check_names, check_proatom_splines, \
-    get_fake_co, get_fake_pseudo_oo
+    get_fake_co, get_fake_pseudo_oo, get_fake_symmetric
 
 
 def check_jbw_coarse(local):
@@ -212,3 +212,32 @@ def test_hirshfeld_e_fake_pseudo_nowcor_local_greedy():
 
 def test_hirshfeld_e_fake_pseudo_nowcor_global_greedy():
     check_fake('he', pseudo=True, dowcor=True, local=False, absmean=0.396, threshold=1e-4, greedy=True)
+
+
+def check_fake_symmetry(scheme, **kwargs):
+    sys, ugrid, mol_dens, proatomdb, symmetry = get_fake_symmetric()
+    CPartClass = cpart_schemes[scheme]
+    results = []
+    for sym in None, symmetry:
+        cpart = CPartClass(sys, ugrid, True, mol_dens, proatomdb, [], symmetry=sym, **kwargs)
+        cpart.do_charges()
+        cpart.do_moments()
+        results.append(cpart)
+    assert (results[1].unique_atoms == [0, 4]).all()
+    # atomic weights are only stored for the symmetry-unique atoms
+    assert ('at_weights', 4) in results[1].cache
+    assert ('at_weights', 1) not in results[1].cache
+    for key in 'charges', 'cartesian_multipoles', 'pure_multipoles', 'radial_moments':
+        assert abs(results[0][key] - results[1][key]).max() < 1e-10
+
+
+def test_hirshfeld_fake_symmetry():
+    check_fake_symmetry('h')
+
+
+def test_hirshfeld_i_fake_symmetry():
+    check_fake_symmetry('hi', threshold=1e-5)
+
+
+def test_hirshfeld_e_fake_symmetry():
+    check_fake_symmetry('he', threshold=1e-5)
@@ -90,3 +90,30 @@ def test_symmetry_moments():
     assert abs(stats[1,1]).max() < 1e-10
     assert abs(stats[0,1,:2] - np.std([-0.1, 0.1])).max() < 1e-10
     assert abs(stats[0,1,2:]).max() < 1e-10
+
+
+def test_cartesian_generators():
+    system, symmetry = get_fake_example()
+    rmats = get_cartesian_generators(symmetry, system.cell)
+    assert abs(rmats - [g[:,:3] for g in symmetry.generators]).max() < 1e-10
+
+    # A three-fold rotation in a hexagonal cell
+    generator = np.array([[0, -1, 0, 0], [1, -1, 0, 0], [0, 0, 1, 0]], float)
+    cell = Cell(np.array([[2.0, 0.0, 0.0], [-1.0, np.sqrt(3.0), 0.0], [0.0, 0.0, 3.0]]))
+    symmetry = Symmetry('c3', [generator], np.zeros((1, 3)), np.array([1]), cell)
+    rmat = get_cartesian_generators(symmetry, cell)[0]
+    assert abs(np.dot(rmat, rmat.T) - np.identity(3)).max() < 1e-10
+    frac = np.array([0.1, 0.3, 0.2])
+    cart = np.dot(rmat, cell.to_cart(frac))
+    assert abs(cart - cell.to_cart(np.dot(generator[:,:3], frac))).max() < 1e-10
+
+
+def test_cartesian_to_pure():
+    points = np.random.uniform(-1, 1, (100, 3))
+    weights = np.random.uniform(0, 1, 100)
+    center = np.random.uniform(-1, 1, 3)
+    for lmax in xrange(5):
+        cart_to_pure = get_cartesian_to_pure(lmax)
+        cartesian = dot_multi_moments([weights], points, center, lmax, 1, None)
+        pure = dot_multi_moments([weights], points, center, lmax, 2, None)
+        assert abs(np.dot(cart_to_pure, cartesian) - pure).max() < 1e-10
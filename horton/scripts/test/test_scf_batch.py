@@ -0,0 +1,41 @@
+# -*- coding: utf-8 -*-
+# Horton is a development platform for electronic structure methods.
+# Copyright (C) 2011-2013 Toon Verstraelen <Toon.Verstraelen@UGent.be>
+#
+# This file is part of Horton.
+#
+# Horton is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 3
+# of the License, or (at your option) any later version.
+#
+# Horton is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, see <http://www.gnu.org/licenses/>
+#
+#--
+#pylint: skip-file
+
+
+from __future__ import print_function
+from __future__ import division
+from __future__ import absolute_import
+import shutil, h5py as h5
+
+from horton import *
+from horton.test.common import check_script, tmpdir
+from horton.scripts.test.common import check_files
+
+
+def test_script_hf_water():
+    with tmpdir('horton.scripts.test.test_scf_batch.test_script_hf_water') as dn:
+        shutil.copy(context.get_fn('test/water.xyz'), '%s/water.xyz' % dn)
+        check_script('horton-scf-batch.py water.xyz out.h5 --obasis=sto-3g --nproc=1', dn)
+        check_files(dn, ['out.h5'])
+        with h5.File('%s/out.h5' % dn, 'r') as f:
+            assert 'energy' in f['water']
+            assert f['water'].attrs['cpu_time'] > 0
@@ -533,3 +533,46 @@ def test_from_parameters3():
 def test_no_initvoid():
     with assert_raises(TypeError):
         cell = Cell(initvoid=True)
+
+
+def check_neighbor_list(cell, ncenter, rcut):
+    centers = np.random.uniform(-5, 5, (ncenter, 3))
+    nlist = cell.get_neighbor_list(centers, rcut)
+    assert nlist.ncenter == ncenter
+    assert nlist.rcut == rcut
+    for r in rcut, 2.5*rcut:
+        point = np.random.uniform(-5, 5, 3)
+        icenters, images, deltas, distances = nlist.query(point, r)
+        # compare with a brute force search
+        found = set()
+        for icenter, image, delta, distance in zip(icenters, images, deltas, distances):
+            assert distance < r
+            assert image[cell.nvec:].sum() == 0
+            expected = point - centers[icenter] - np.dot(image[:cell.nvec], cell.rvecs)
+            assert abs(delta - expected).max() < 1e-10
+            assert abs(np.linalg.norm(delta) - distance) < 1e-10
+            found.add((icenter,) + tuple(image))
+        assert len(found) == len(icenters)
+        expected = set()
+        if cell.nvec > 0:
+            dmax = abs(point - centers).max()*np.sqrt(3) + r if ncenter > 0 else 0
+            nimages = np.ceil(dmax/cell.rspacings).astype(int)
+        else:
+            nimages = np.zeros(0, int)
+        for image in np.ndindex(*(2*nimages+1)):
+            image = np.array(image) - nimages
+            deltas = point - centers - np.dot(image, cell.rvecs)
+            for icenter in (np.sqrt((deltas**2).sum(axis=1)) < r).nonzero()[0]:
+                expected.add((icenter,) + tuple(image) + (0,)*(3-cell.nvec))
+        assert found == expected
+
+
+def test_neighbor_list():
+    for nvec in xrange(4):
+        for ncenter in 0, 1, 30:
+            check_neighbor_list(get_random_cell(6.0, nvec), ncenter, 2.0)
+    # many more bins than centers
+    check_neighbor_list(get_random_cell(50.0, 3), 5, 0.5)
+    check_neighbor_list(Cell(None), 5, 0.01)
+    with assert_raises(ValueError):
+        Cell(None).get_neighbor_list(np.zeros((3, 3)), 0.0)
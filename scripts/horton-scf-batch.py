@@ -0,0 +1,91 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# Horton is a Density Functional Theory program.
+# Copyright (C) 2011-2012 Toon Verstraelen <Toon.Verstraelen@UGent.be>
+#
+# This file is part of Horton.
+#
+# Horton is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 3
+# of the License, or (at your option) any later version.
+#
+# Horton is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, see <http://www.gnu.org/licenses/>
+#
+#--
+
+
+import sys, argparse, numpy as np
+
+from horton import log, run_scf_batch, batch_functionals, SCFWrapper, \
+    __version__
+
+
+# All, except underflows, is *not* fine.
+np.seterr(divide='raise', over='raise', invalid='raise')
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(prog='horton-scf-batch.py',
+        description='Run SCF computations on many molecules with a pool of '
+                    'worker processes.')
+    parser.add_argument('-V', '--version', action='version',
+        version="%%(prog)s (horton version %s)" % __version__)
+
+    parser.add_argument('geometries', nargs='+',
+        help='The geometry files, e.g. in the XYZ format.')
+    parser.add_argument('output',
+        help='The HDF5 output file. Every molecule gets a group named after '
+             'its geometry file, without directory and extension.')
+    parser.add_argument('--overwrite', default=False, action='store_true',
+        help='Overwrite existing output in the HDF5 file. By default, '
+             'molecules that are already present in the output are skipped.')
+
+    parser.add_argument('--functional', default='hf',
+        choices=sorted(batch_functionals),
+        help='The Hamiltonian. [default=%(default)s]')
+    parser.add_argument('--obasis', default='3-21G',
+        help='The orbital basis set. [default=%(default)s]')
+    parser.add_argument('--grid', default='fine',
+        help='The atomic grid specification for DFT computations. '
+             '[default=%(default)s]')
+    parser.add_argument('--charge', default=0, type=int,
+        help='The charge of all molecules. [default=%(default)s]')
+    parser.add_argument('--mult', default=None, type=int,
+        help='The spin multiplicity of all molecules. By default, the lowest '
+             'possible multiplicity is used.')
+    parser.add_argument('--scf', default='cdiis',
+        choices=sorted(SCFWrapper.available_methods),
+        help='The SCF algorithm. [default=%(default)s]')
+    parser.add_argument('--threshold', default=1e-6, type=float,
+        help='The SCF convergence threshold. [default=%(default)s]')
+    parser.add_argument('--maxiter', default=128, type=int,
+        help='The maximum number of SCF iterations. [default=%(default)s]')
+    parser.add_argument('--nproc', default=None, type=int,
+        help='The number of worker processes. By default, the number of CPUs '
+             'is used.')
+    parser.add_argument('--nthread', default=1, type=int,
+        help='The number of OpenMP threads in each worker process. '
+             '[default=%(default)s]')
+
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    nfail = run_scf_batch(
+        args.geometries, args.output, args.functional, args.obasis, args.grid,
+        args.scf, {'threshold': args.threshold, 'maxiter': args.maxiter},
+        args.charge, args.mult, args.nproc, args.nthread, args.overwrite)
+    if nfail > 0:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
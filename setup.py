@@ -151,8 +151,8 @@ setup(
                 'horton/cell.pxd', 'horton/cell.h',
                 'horton/moments.pxd', 'horton/moments.h'],
             include_dirs=[np.get_include(), 'horton'],
-            #extra_compile_args=["-fopenmp"],
-            #extra_link_args=["-fopenmp"],
+            extra_compile_args=["-fopenmp"],
+            extra_link_args=["-fopenmp"],
             language="c++",),
         Extension("horton.meanfield.cext",
             sources=get_sources('horton/meanfield'),
@@ -169,6 +169,8 @@ setup(
                 'horton/cell.pxd', 'horton/cell.h',
                 'horton/grid/uniform.pxd', 'horton/grid/uniform.h'],
             include_dirs=[np.get_include(), 'horton', 'horton/grid'],
+            extra_compile_args=["-fopenmp"],
+            extra_link_args=["-fopenmp"],
             language="c++"),
     ],
     classifiers=[